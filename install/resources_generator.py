@@ -14,10 +14,12 @@ import logging
 import math
 import os
 import re
+import shlex
+import subprocess
 import sys
-from argparse import ArgumentParser, HelpFormatter
+from argparse import ArgumentParser, HelpFormatter, SUPPRESS
 from concurrent.futures import ThreadPoolExecutor
-from json import dumps
+from json import dumps, loads
 from ipaddress import ip_address
 from math import ceil
 from urllib import request, error
@@ -89,6 +91,10 @@ CONST_RESOURCES = dict(
     ena_llq=True,
 )
 MAX_DRIVE_NODES_PERCPU = 4
+DEFAULT_PARALLEL_HOSTS = 32
+REMOTE_DETECT_TIMEOUT = 300
+# Cluster mode options, consumed locally and not forwarded to the hosts (value: takes a list of values)
+CLUSTER_MODE_ARGS = {"--hosts": True, "--hosts-file": False, "--parallel": False, "--path": False}
 
 def is_cloud_env(check_aws=True, check_oci=True):
     req_list = []
@@ -179,6 +185,13 @@ class NetDevice:
     def as_dict(self):
         return self.__dict__
 
+    @classmethod
+    def from_dict(cls, net_dev_dict):
+        """Rebuild a net device detected on another host, without querying ethtool locally"""
+        net_dev = cls.__new__(cls)
+        net_dev.__dict__.update(net_dev_dict)
+        return net_dev
+
 
 class RdmaDevice:
     def __init__(self, name, sa_family):
@@ -257,9 +270,9 @@ class Container:
         self.resources_json = dumps(resources_dict, sort_keys=True, indent=1)
 
 
-def get_failure_domain_based_on_nodename():
+def get_failure_domain_based_on_nodename(full_hostname=None):
     max_failure_domain_length = 16
-    full_hostname = os.uname().nodename
+    full_hostname = full_hostname or os.uname().nodename
     hostname = full_hostname.split('.')[0].replace('-', '_')  # just in case it's a FQDN
     if len(hostname) > max_failure_domain_length:
         hash_obj = hashlib.shake_256(hostname.encode())
@@ -295,6 +308,8 @@ class ResourcesGenerator:
         self.numa_nodes_info = []
         self.exclusive_nics_policy = None
         self.is_DEFAULT_DRIVES_BASE_PORT_used = False
+        self.hosts = []
+        self.total_memory_bytes = None
 
     def set_user_args(self):
         """parses command line arguments"""
@@ -452,14 +467,25 @@ class ResourcesGenerator:
             _validate_non_negative(size)
             return size
 
+        def _read_hosts_file(path):
+            try:
+                with open(path) as f:
+                    lines = [line.split('#')[0].strip() for line in f]
+            except OSError as err:
+                logger.error("Could not read hosts file: %s", err)
+                quit(1)
+            return [line for line in lines if line]
+
         class SortingHelpFormatter(HelpFormatter):
             def add_arguments(self, actions):
                 actions = sorted(actions, key=lambda a: a.option_strings)
                 super(SortingHelpFormatter, self).add_arguments(actions)
 
         parser = ArgumentParser(description="Generates weka resources files",
-                                usage='\n%(prog)s --net <net-devices> [options]',
-                                formatter_class=SortingHelpFormatter)
+                                usage='\n%(prog)s --net <net-devices> [options]'
+                                      '\n%(prog)s --net <net-devices> --hosts <hosts> [options]',
+                                formatter_class=SortingHelpFormatter,
+                                allow_abbrev=False)  # cluster mode strips its own options by their full name
         parser.add_argument("--net", nargs="+", type=str, metavar="net-devices",
                             help="Specify net devices to be used separated by whitespaces")
         parser.add_argument("--drives", nargs="+", type=str,
@@ -519,6 +545,15 @@ class ResourcesGenerator:
         parser.add_argument("--base-port", default=DEFAULT_DRIVES_BASE_PORT, type=int, help="Specify the base port")
         parser.add_argument("--scan-rdma", default="OFF", type=_validate_scan_rdma,
                             help="Scan for RDMA devices by network type, either 'IB', 'ETH', 'ALL' or 'OFF' (default)")
+        parser.add_argument("--hosts", default=[], nargs="+", type=str,
+                            help="Cluster mode: detect the hardware of these hosts over ssh in parallel and write the "
+                                 "resources files of each host to <path>/<host>/, the other options apply to every host")
+        parser.add_argument("--hosts-file", default=None, type=_read_hosts_file,
+                            help="Cluster mode: read the hosts from a file, one per line ('#' starts a comment)")
+        parser.add_argument("--parallel", default=DEFAULT_PARALLEL_HOSTS, type=_validate_positive,
+                            help="Cluster mode: max number of hosts detected at once, default is %s" % DEFAULT_PARALLEL_HOSTS)
+        # Used by cluster mode on each host: print the detected hardware as json instead of writing resources files
+        parser.add_argument("--detect-only", action='store_true', help=SUPPRESS)
 
         # Create a mutually exclusive group
         group = parser.add_mutually_exclusive_group()
@@ -542,6 +577,20 @@ class ResourcesGenerator:
         ResourcesGenerator.scan_rdma = self.args.scan_rdma
         self.next_base_port = self.args.base_port + 200
 
+        self.hosts = list(dict.fromkeys(self.args.hosts + (self.args.hosts_file or [])))
+        if self.hosts:
+            # net devices and core ids are validated by each host during detection
+            if not self.args.net:
+                logger.error("At least 1 net device is required")
+                quit(1)
+            for net_arg in self.args.net:
+                arg_parts = net_arg.split('/')
+                if arg_parts[1:2] != ["rdma-only"] and any(arg_parts[1:4]):
+                    logger.error("%s: ips, netmask and gateway belong to a single host and cannot be given with "
+                                 "--hosts or --hosts-file, pass only the net device", net_arg)
+                    quit(1)
+            return
+
         _validate_net_dev()
         _verify_core_ids(self.args.drive_core_ids + self.args.compute_core_ids + self.args.frontend_core_ids)
         _verify_core_ids(self.args.core_ids)
@@ -550,6 +599,9 @@ class ResourcesGenerator:
     def check_if_should_continue(self):
         if self.args.force:
             return
+        if self.args.detect_only:
+            logger.error("Cannot prompt during cluster mode detection, run with --force to continue")
+            quit(1)
         inp = None
         while inp not in ['n', 'y', 'N', 'Y']:
             inp = input("Would you like to continue? (y/n) ")
@@ -943,6 +995,8 @@ class ResourcesGenerator:
             self.drive_nodes.append(_get_next_drive_node(i))
 
     def _get_total_memory_bytes(self):
+        if self.total_memory_bytes is not None:  # detected on another host
+            return self.total_memory_bytes
         return int(extract_digits(os.popen("cat /proc/meminfo | grep MemTotal").read().strip())) * KiB
 
     def _get_os_reserved_memory(self, total_memory):
@@ -1158,15 +1212,28 @@ class ResourcesGenerator:
             self.drives.append(dev)
         logger.info("Drives to be allocated: %s", self.drives)
 
-    def create_resources_files(self):
+    def prepare_containers(self):
+        for role in self.containers:
+            for container in self.containers[role]:
+                container.prepare_members()
+
+    def set_host_identity(self, hostname):
+        """Point the planned containers at the given host, so a plan can be shared by hosts of the same hardware"""
+        failure_domain = "" if self.args.use_auto_failure_domain else get_failure_domain_based_on_nodename(hostname)
+        for role in self.containers:
+            for container in self.containers[role]:
+                container.hostname = hostname
+                container.failure_domain = failure_domain
+
+    def create_resources_files(self, path=None):
         """For each required container generates resources json file"""
-        resources_filenames_path = os.path.join(self.args.path, "resources_filenames")
+        path = path or self.args.path
+        resources_filenames_path = os.path.join(path, "resources_filenames")
         with open(resources_filenames_path, 'w') as resources_filenames_file:
             for role in self.containers:
                 for i, container in enumerate(self.containers[role]):
-                    container.prepare_members()
                     container.create_json()
-                    resources_path = os.path.join(self.args.path, role.lower() + str(i) + '.json')
+                    resources_path = os.path.join(path, role.lower() + str(i) + '.json')
                     with open(resources_path, 'w') as f:
                         f.write(container.resources_json + '\n')
                     resources_filenames_file.write(resources_path + '\n')
@@ -1175,27 +1242,151 @@ class ResourcesGenerator:
         logging.basicConfig(format='%(levelname)s: %(message)s')
         logger.setLevel(logging.DEBUG if self.args.verbose else logging.INFO)
 
-    def generate(self):
-        """Run the whole flow from parsing command-line arguments to generate all the required json files"""
-        self.set_user_args()
-        self._setup_logging()
+    def _use_auto_cores(self):
+        return not (self.args.frontend_core_ids or self.args.compute_core_ids or self.args.drive_core_ids)
+
+    def detect(self):
+        """Detection phase: everything that has to run on the host itself"""
         self.set_net_devices()
         if self.args.drives:
             self.set_specified_drives()
         else:
             self.find_unmounted_devices()
-        use_auto_cores = not (self.args.frontend_core_ids or self.args.compute_core_ids or self.args.drive_core_ids)
-        if use_auto_cores:
+        if self._use_auto_cores():
             self.set_cores()
-            self.set_numa_nodes_info()
-            self.set_nodes()
-
         else:
             self.set_specified_cores()
-            self.set_numa_nodes_info()
+        self.set_numa_nodes_info()
+
+    def plan(self):
+        """Planning phase: allocate nodes, containers and memory from the detected hardware"""
+        if self._use_auto_cores():
+            self.set_nodes()
+        else:
             self.set_nodes_by_specified_cores()
         self.set_containers()
         self.set_memory()
+        self.prepare_containers()
+
+    def hardware_profile(self):
+        """The detected hardware as a json-able dict, the input of the planning phase"""
+        return dict(
+            hostname=os.uname().nodename,
+            exclusive_nics_policy=self.exclusive_nics_policy,
+            net_devices=[dev.as_dict() for dev in self.net_devices],
+            rdma_devices=[dev.as_dict() for dev in self.rdma_devices],
+            drives=self.drives,
+            cores=[[core.cpu_id, core.numa] for core in self.cores],
+            num_available_cores=self.num_available_cores,
+            numa_nodes=[[numa.id, numa.memory] for numa in self.numa_nodes_info],
+            total_memory_bytes=self._get_total_memory_bytes(),
+        )
+
+    def load_hardware_profile(self, profile):
+        """Restore the state of the detection phase from a hardware profile detected on another host"""
+        self.exclusive_nics_policy = profile["exclusive_nics_policy"]
+        self.net_devices = [NetDevice.from_dict(dev) for dev in profile["net_devices"]]
+        self.rdma_devices = [RdmaDevice(dev["name"], dev["sa_family"]) for dev in profile["rdma_devices"]]
+        self.drives = profile["drives"][:]
+        self.cores = []
+        for cpu_id, numa_id in profile["cores"]:
+            core = Core(cpu_id=cpu_id)
+            core.numa = numa_id
+            self.cores.append(core)
+        self.num_available_cores = profile["num_available_cores"]
+        for numa_id, memory in profile["numa_nodes"]:
+            numa = Numa(numa_id)
+            numa.pre_allocated_cores = list(filter(lambda c: c.numa == numa_id, self.cores))
+            numa.memory = memory
+            self.numa_nodes_info.append(numa)
+            self.numa_to_ionodes[numa_id] = []
+        self.total_memory_bytes = profile["total_memory_bytes"]
+
+    def _remote_args(self):
+        """The command line minus the cluster mode options, for running the detection phase on each host"""
+        remote_args = []
+        values_to_skip = 0  # values left of a cluster mode option, negative for all up to the next option
+        for arg in sys.argv[1:]:
+            option = arg.split('=')[0]
+            if option in CLUSTER_MODE_ARGS:
+                values_to_skip = 0 if '=' in arg else (-1 if CLUSTER_MODE_ARGS[option] else 1)
+                continue
+            if values_to_skip and not arg.startswith('-'):
+                values_to_skip -= 1
+                continue
+            values_to_skip = 0
+            remote_args.append(arg)
+        return remote_args + ["--detect-only"]
+
+    def _detect_host(self, host):
+        """Run this script with --detect-only on the host over ssh, return its hardware profile or None"""
+        cmd = ["ssh", "-o", "BatchMode=yes", host, "python3 - " + " ".join(shlex.quote(arg) for arg in self._remote_args())]
+        try:
+            with open(os.path.abspath(__file__), 'rb') as script:
+                result = subprocess.run(cmd, stdin=script, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                        timeout=REMOTE_DETECT_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            logger.error("%s: detection did not finish within %s seconds", host, REMOTE_DETECT_TIMEOUT)
+            return None
+        remote_log = result.stderr.decode('utf-8', errors='replace').strip()
+        if result.returncode != 0:
+            logger.error("%s: detection failed (exit code %s):\n%s", host, result.returncode, remote_log)
+            return None
+        if remote_log:
+            logger.debug("%s: %s", host, remote_log)
+        try:
+            return loads(result.stdout)
+        except ValueError:
+            logger.error("%s: invalid hardware profile: %s", host, result.stdout[:200])
+            return None
+
+    def generate_for_hosts(self):
+        """Cluster mode: detect all hosts in parallel, then plan once per distinct hardware profile"""
+        logger.info("Detecting hardware of %s hosts", len(self.hosts))
+        with ThreadPoolExecutor(max_workers=min(self.args.parallel, len(self.hosts))) as executor:
+            profiles = dict(zip(self.hosts, executor.map(self._detect_host, self.hosts)))
+        failed_hosts = [host for host in self.hosts if profiles[host] is None]
+
+        hosts_by_profile = dict()
+        for host in self.hosts:
+            profile = profiles[host]
+            if profile is None:
+                continue
+            sku = {key: value for key, value in profile.items() if key != "hostname"}
+            sku_hash = hashlib.sha256(dumps(sku, sort_keys=True).encode()).hexdigest()
+            hosts_by_profile.setdefault(sku_hash, []).append(host)
+        logger.info("%s hosts detected, %s distinct hardware profiles", len(self.hosts) - len(failed_hosts),
+                    len(hosts_by_profile))
+
+        for sku_hash, hosts in hosts_by_profile.items():
+            logger.info("Hardware profile %s: %s", sku_hash[:12], " ".join(hosts))
+            planner = ResourcesGenerator()
+            planner.args = self.args
+            planner.next_base_port = self.next_base_port
+            planner.load_hardware_profile(profiles[hosts[0]])
+            planner.plan()
+            for host in hosts:
+                host_path = os.path.join(self.args.path, host)
+                os.makedirs(host_path, exist_ok=True)
+                planner.set_host_identity(profiles[host]["hostname"])
+                planner.create_resources_files(host_path)
+
+        if failed_hosts:
+            logger.error("Could not detect the hardware of %s hosts: %s", len(failed_hosts), " ".join(failed_hosts))
+            quit(1)
+
+    def generate(self):
+        """Run the whole flow from parsing command-line arguments to generate all the required json files"""
+        self.set_user_args()
+        self._setup_logging()
+        if self.hosts:
+            self.generate_for_hosts()
+            return
+        self.detect()
+        if self.args.detect_only:
+            print(dumps(self.hardware_profile(), sort_keys=True))
+            return
+        self.plan()
         self.create_resources_files()
 
 
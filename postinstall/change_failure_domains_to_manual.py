@@ -11,6 +11,8 @@ import shlex
 # from pprint import pprint
 from datetime import datetime
 
+from health_watcher import health_watcher, is_fully_protected
+
 SSH_OPTIONS = ["ssh", "-o", "LogLevel=ERROR", "-o", "UserKnownHostsFile=/dev/null", "-o", "StrictHostKeyChecking=no"]
 
 def get_timestamp():
@@ -32,82 +34,31 @@ def prompt_user_input():
     return get_input().strip().lower()
 
 
-def is_fully_protected(status, rebuild_status, print_rebuild_status=True):
-    if rebuild_status["unavailableMiB"] != 0:
-        if print_rebuild_status:
-            subprocess.call(["weka", "status", "rebuild"])
-            log("Cluster has too many failures (status %s) (seen rebuilding cluster, as expected)" % (status["status"],))
-        return False
-
-    if any(prot["MiB"] != 0 for prot in rebuild_status["protectionState"][1:]) or rebuild_status["protectionState"][0] == 0:
-        if print_rebuild_status:
-            subprocess.call(["weka", "status", "rebuild"])
-            scrubber_rate = json.loads(subprocess.check_output(["weka", "debug", "config", "show", "clusterInfo.scrubberBytesPerSecLimit", "-J"]))
-            log("Rebuilding at rate of %sMiB/sec (scrubber rate)" % (scrubber_rate / (1 << 20),));
-            log("Still has failures (status %s)" % (status["status"],))
-        return False
-
-    subprocess.call(["weka", "status", "rebuild"])
-    log("Cluster is fully protected (status %s)" % (status["status"],))
-    return True
-
-
 def wait_for_unhealthy_cluster(timeout_secs=120):
-    status_max_retries = 180
     attempts = 0
-    start = time.time()
-    while True:
-        time.sleep(1)
+    for sample in health_watcher.samples(timeout_secs=timeout_secs):
         attempts += 1
+        status, rebuild_status = sample.status, sample.rebuild
 
-        try:
-            if time.time() - start >= timeout_secs:
-                log("Timed out waiting for the cluster to become unhealthy - Assuming it's healthy")
-                return
-
-            rebuild_status = json.loads(subprocess.check_output(["weka", "status", "rebuild", "-J"]))
-            status = json.loads(subprocess.check_output(["weka", "status", "-J"]))
-
-            should_print = attempts % 3 == 0 # Only print in some of the iterations
-            if not is_fully_protected(status, rebuild_status, print_rebuild_status=should_print):
-                log("Seen rebuilding cluster, as expected (status %s)" % (status["status"],))
-                return
-
-
-        except subprocess.CalledProcessError:
-            if attempts >= status_max_retries:
-                log("Exhausted retries when querying cluster's rebuild status")
-                sys.exit(1)
-
-            log("Error querying cluster's rebuild status, retrying")
-            continue
+        should_print = attempts % 3 == 0 # Only print in some of the iterations
+        if not is_fully_protected(status, rebuild_status, print_rebuild_status=should_print):
+            log("Seen rebuilding cluster, as expected (status %s)" % (status["status"],))
+            return
 
         log("Cluster is unhealthy (status %s)" % (status["status"],))
 
+    log("Timed out waiting for the cluster to become unhealthy - Assuming it's healthy")
+
 
 def wait_for_healthy_cluster(print_healthy=True):
-    status_max_retries = 180
     attempts = 0
     wait_start = datetime.now()
-    while True:
+    for sample in health_watcher.samples():
         attempts += 1
-        if attempts > 1:
-            time.sleep(1)
-
-        try:
-            status = json.loads(subprocess.check_output(["weka", "status", "-J"]))
-            rebuild_status = json.loads(subprocess.check_output(["weka", "status", "rebuild", "-J"]))
-
-            should_print = attempts % 5 == 0 # Only print in some of the iterations
-            if not is_fully_protected(status, rebuild_status, print_rebuild_status=should_print):
-                continue
-
-        except subprocess.CalledProcessError:
-            if attempts >= status_max_retries:
-                log("Exhausted retries when querying cluster's rebuild status")
-                sys.exit(1)
+        status, rebuild_status = sample.status, sample.rebuild
 
-            log("Error querying cluster's rebuild status, retrying")
+        should_print = attempts % 5 == 0 # Only print in some of the iterations
+        if not is_fully_protected(status, rebuild_status, print_rebuild_status=should_print):
             continue
 
         def check_active_equals_total(json):
@@ -478,6 +429,9 @@ def main():
                              'If cluster is unhealthy, don\'t wait for rebuilds, and health checks')
     parser.add_argument('--wait-unhealthy-timeout-secs', dest='wait_unhealthy_timeout_secs', type=int, default=120,
                         help='Time to wait for cluster to become unhealthy before waiting for it to become healthy')
+    parser.add_argument('--health-series', dest='health_series', type=str,
+                        help='Append every cluster health sample, with rebuild throughput and ETA, to this file '
+                             '(CSV if it ends with .csv, JSON lines otherwise)')
 
     # S3
     parser.add_argument('--skip-s3-drain', dest='skip_s3_drain', action='store_true', default=False,
@@ -496,6 +450,7 @@ def main():
                         'Force stop the S3 container even if we failed consecutive post-drain IO checks')
 
     args = parser.parse_args()
+    health_watcher.series_path = args.health_series
     upgrade(
         s3_drain_timeout=args.s3_drain_timeout,
         s3_drain_grace=args.s3_drain_grace,
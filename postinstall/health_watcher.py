@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+"""
+Shared cluster health watcher for the rolling maintenance scripts (upgrade_many.py,
+change_failure_domains_to_manual.py).
+
+A single background thread queries 'weka status -J' while anyone is waiting on the cluster, and hands every
+parsed sample to all the waiters. When the protection state stops changing the query interval backs off (up to
+max_interval), and it drops back to min_interval as soon as something changes or a new wait starts. Every sample
+feeds RebuildTelemetry, which derives a smoothed rebuild throughput and ETA per protection level; only the last
+history_size samples are kept in memory. Set series_path to also append every sample to a CSV (".csv") or
+JSON-lines file.
+"""
+
+import csv
+import json
+import math
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import deque, namedtuple
+from datetime import datetime
+
+SERIES_FIELDS = ("time", "epoch", "status", "unavailable_mib", "protection_mib", "degraded_mib", "rebuild_mib_per_sec",
+                 "eta_secs", "scrubber_mib_per_sec")
+
+# seq: increasing sample number, time: epoch seconds, status: 'weka status -J', rebuild: 'weka status rebuild -J'
+HealthSample = namedtuple("HealthSample", ["seq", "time", "status", "rebuild"])
+
+
+def log(msg):
+    print("%s LOG: %s" % (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), msg))
+
+
+def format_duration(secs):
+    secs = int(secs)
+    if secs >= 3600:
+        return "%dh%02dm" % (secs // 3600, secs % 3600 // 60)
+    if secs >= 60:
+        return "%dm%02ds" % (secs // 60, secs % 60)
+    return "%ds" % (secs,)
+
+
+class RebuildTelemetry(object):
+    """
+    Smoothed rebuild throughput per protection level, from the MiB each level of protectionState loses between
+    successive samples. Level 0 is fully protected data; every other level (and unavailableMiB) still needs rebuild.
+    Rates are exponentially smoothed over smoothing_secs, so uneven sample intervals weigh correctly.
+    """
+
+    def __init__(self, smoothing_secs=120.0):
+        self.smoothing_secs = smoothing_secs
+        self.rates = {}  # protection level index -> MiB/sec, "total" -> MiB/sec of all degraded data
+        self._last = None  # (time, {level: MiB})
+
+    @staticmethod
+    def degraded_levels(rebuild_status):
+        levels = {"total": rebuild_status.get("unavailableMiB", 0)}
+        for index, prot in enumerate(rebuild_status.get("protectionState", [])):
+            if index == 0:
+                continue
+            levels[index] = prot.get("MiB", 0)
+            levels["total"] += levels[index]
+        return levels
+
+    def update(self, sample):
+        levels = self.degraded_levels(sample.rebuild)
+        if self._last is not None:
+            last_time, last_levels = self._last
+            elapsed = sample.time - last_time
+            if elapsed > 0:
+                weight = 1 - math.exp(-elapsed / self.smoothing_secs)
+                for level, mib in levels.items():
+                    # Data moving down from a worse level can make a level grow; that is no progress, not negative
+                    rate = max(0.0, float(last_levels.get(level, mib) - mib) / elapsed)
+                    if level in self.rates:
+                        self.rates[level] += weight * (rate - self.rates[level])
+                    else:
+                        self.rates[level] = rate
+        if levels["total"] == 0:
+            # Fully protected: the next rebuild starts from scratch
+            self.rates = {}
+        self._last = (sample.time, levels)
+
+    def eta_secs(self, level="total"):
+        """Seconds until the level's degraded MiB reach 0 at the smoothed rate, or None if there is no progress."""
+        if self._last is None:
+            return None
+        mib = self._last[1].get(level, 0)
+        if mib == 0:
+            return 0
+        rate = self.rates.get(level)
+        if not rate:
+            return None
+        return mib / rate
+
+
+class HealthWatcher(object):
+    def __init__(self, min_interval=1.0, max_interval=15.0, backoff=1.5, max_errors=180, scrubber_rate_ttl=60,
+                 history_size=360):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.max_errors = max_errors
+        self.scrubber_rate_ttl = scrubber_rate_ttl
+        self.errors = 0
+        self.history = deque(maxlen=history_size)  # latest HealthSample per query, RebuildTelemetry keeps the rest
+        self.telemetry = RebuildTelemetry()
+        self.series_path = None
+        self._cond = threading.Condition()
+        self._latest = None
+        self._waiters = 0
+        self._interval = min_interval
+        self._thread = None
+        self._scrubber_rate = None
+        self._scrubber_rate_time = 0
+
+    def _query(self):
+        status = json.loads(subprocess.check_output(["weka", "status", "-J"]))
+        rebuild = status.get("rebuild")
+        if not isinstance(rebuild, dict) or "protectionState" not in rebuild or "unavailableMiB" not in rebuild:
+            # Older releases don't embed the rebuild state in 'weka status'
+            rebuild = json.loads(subprocess.check_output(["weka", "status", "rebuild", "-J"]))
+        return status, rebuild
+
+    @staticmethod
+    def _signature(status, rebuild):
+        return (status.get("status"),
+                rebuild.get("unavailableMiB"),
+                tuple(prot.get("MiB") for prot in rebuild.get("protectionState", [])),
+                json.dumps([status.get(key) for key in ("drives", "io_nodes", "hosts", "buckets")], sort_keys=True))
+
+    def _run(self):
+        last_signature = None
+        while True:
+            with self._cond:
+                while not self._waiters:
+                    self._cond.wait()
+
+            try:
+                status, rebuild = self._query()
+                signature = self._signature(status, rebuild)
+                seq = self._latest.seq + 1 if self._latest is not None else 1
+                sample = HealthSample(seq, time.time(), status, rebuild)
+                # Account for the sample before any waiter sees it (a waiter may finish the script right away)
+                self.telemetry.update(sample)
+            except Exception as ex:
+                # Any failure counts towards max_errors, a dead thread would leave the waiters blocked forever
+                log("Error querying cluster's rebuild status, retrying: %s" % (ex,))
+                with self._cond:
+                    self.errors += 1
+                    self._interval = self.min_interval
+                    self._cond.notify_all()
+            else:
+                if self.series_path:
+                    self._append_series(sample)
+                with self._cond:
+                    self._latest = sample
+                    self.history.append(sample)
+                    self.errors = 0
+                    if signature == last_signature:
+                        self._interval = min(self._interval * self.backoff, self.max_interval)
+                    else:
+                        self._interval = self.min_interval
+                    self._cond.notify_all()
+                last_signature = signature
+
+            with self._cond:
+                if self._waiters:
+                    # A new waiter wakes us up early, so every wait starts with a fresh sample
+                    self._cond.wait(self._interval)
+
+    def samples(self, timeout_secs=None):
+        """
+        Yield fresh samples, each taken after the previous one was handed out, until the caller stops iterating or
+        timeout_secs pass. Exits the process after max_errors consecutive failed queries, like the old polling loops.
+        """
+        deadline = time.time() + timeout_secs if timeout_secs is not None else None
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+            seen = self._latest.seq if self._latest is not None else 0
+            self._waiters += 1
+            self._interval = self.min_interval
+            self._cond.notify_all()
+
+        try:
+            while True:
+                with self._cond:
+                    while self._latest is None or self._latest.seq <= seen:
+                        if self.errors >= self.max_errors:
+                            log("Exhausted retries when querying cluster's rebuild status")
+                            sys.exit(1)
+                        remaining = deadline - time.time() if deadline is not None else None
+                        if remaining is not None and remaining <= 0:
+                            return
+                        self._cond.wait(remaining)
+                    sample = self._latest
+                seen = sample.seq
+                yield sample
+        finally:
+            with self._cond:
+                self._waiters -= 1
+
+    def _append_series(self, sample):
+        levels = RebuildTelemetry.degraded_levels(sample.rebuild)
+        eta = self.telemetry.eta_secs()
+        row = {
+            "time": datetime.fromtimestamp(sample.time).strftime("%Y-%m-%d %H:%M:%S"),
+            "epoch": round(sample.time, 3),
+            "status": sample.status.get("status"),
+            "unavailable_mib": sample.rebuild.get("unavailableMiB"),
+            "protection_mib": "/".join(str(prot.get("MiB")) for prot in sample.rebuild.get("protectionState", [])),
+            "degraded_mib": levels["total"],
+            "rebuild_mib_per_sec": round(self.telemetry.rates.get("total", 0.0), 3),
+            "eta_secs": int(eta) if eta is not None else "",
+            "scrubber_mib_per_sec": (self._scrubber_rate / float(1 << 20)) if self._scrubber_rate is not None else "",
+        }
+        try:
+            if self.series_path.endswith(".csv"):
+                write_header = not os.path.exists(self.series_path) or os.path.getsize(self.series_path) == 0
+                with open(self.series_path, "a") as f:
+                    writer = csv.DictWriter(f, fieldnames=list(SERIES_FIELDS))
+                    if write_header:
+                        writer.writeheader()
+                    writer.writerow(row)
+            else:
+                with open(self.series_path, "a") as f:
+                    f.write(json.dumps(row, sort_keys=True) + "\n")
+        except (IOError, OSError) as ex:
+            log("Failed writing health time series to %s: %s" % (self.series_path, ex))
+            self.series_path = None
+
+    def scrubber_rate(self):
+        """clusterInfo.scrubberBytesPerSecLimit, re-read at most once per scrubber_rate_ttl seconds."""
+        if self._scrubber_rate is None or time.time() - self._scrubber_rate_time >= self.scrubber_rate_ttl:
+            self._scrubber_rate = json.loads(subprocess.check_output(
+                ["weka", "debug", "config", "show", "clusterInfo.scrubberBytesPerSecLimit", "-J"]))
+            self._scrubber_rate_time = time.time()
+        return self._scrubber_rate
+
+
+def log_rebuild_status(rebuild_status):
+    """Print the protection state from an already parsed 'weka status rebuild -J'."""
+    levels = []
+    for index, prot in enumerate(rebuild_status.get("protectionState", [])):
+        levels.append("%s failures: %s MiB" % (prot.get("numFailures", index), prot.get("MiB")))
+    log("Rebuild status: %s MiB unavailable, %s" % (rebuild_status.get("unavailableMiB"), ", ".join(levels)))
+
+
+def log_rebuild_eta(watcher, scrubber_rate):
+    telemetry = watcher.telemetry
+    rate = telemetry.rates.get("total")
+    if not rate:
+        log("Rebuild ETA: not enough progress seen yet")
+        return
+
+    eta = telemetry.eta_secs()
+    per_level = []
+    for level in sorted(key for key in telemetry.rates if key != "total"):
+        level_eta = telemetry.eta_secs(level)
+        per_level.append("level %s: %s" % (level, format_duration(level_eta) if level_eta is not None else "unknown"))
+    log("Rebuilding at %.1fMiB/sec (smoothed), estimated %s to full protection (%s)" % (
+        rate, format_duration(eta) if eta is not None else "unknown", ", ".join(per_level)))
+
+    scrubber_mib = scrubber_rate / float(1 << 20)
+    if scrubber_mib and rate >= 0.9 * scrubber_mib:
+        log("Rebuild is running at the scrubber limit; raising clusterInfo.scrubberBytesPerSecLimit would shorten it")
+
+
+def is_fully_protected(status, rebuild_status, print_rebuild_status=True, watcher=None):
+    if rebuild_status["unavailableMiB"] != 0:
+        if print_rebuild_status:
+            log_rebuild_status(rebuild_status)
+            log("Cluster has too many failures (status %s) (seen rebuilding cluster, as expected)" % (
+            status["status"],))
+        return False
+
+    if any(prot["MiB"] != 0 for prot in rebuild_status["protectionState"][1:]) or rebuild_status["protectionState"][
+        0] == 0:
+        if print_rebuild_status:
+            log_rebuild_status(rebuild_status)
+            watcher = watcher or health_watcher
+            scrubber_rate = watcher.scrubber_rate()
+            log("Rebuilding at rate of %sMiB/sec (scrubber rate)" % (scrubber_rate / (1 << 20),))
+            log_rebuild_eta(watcher, scrubber_rate)
+            log("Still has failures (status %s)" % (status["status"],))
+        return False
+
+    log_rebuild_status(rebuild_status)
+    log("Cluster is fully protected (status %s)" % (status["status"],))
+    return True
+
+
+health_watcher = HealthWatcher()
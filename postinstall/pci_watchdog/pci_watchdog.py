@@ -8,6 +8,7 @@ import select
 import re
 from pprint import pformat
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 
 class LoggerCustomFormatter(logging.Formatter):
@@ -75,12 +76,245 @@ def test_nvme_fmt():
     logger.debug(res.groups())
 
 
+def test_kmsg_classifier():
+    dog = PCIWatchDog(io.StringIO(""), ignore_timestamp=True, dry_run=True)
+    classify = dog._kmsg_classifier.classify
+
+    assert classify("usb 1-1: new high-speed USB device number 2 using xhci_hcd") is None
+    assert classify("nvme nvme19: Removing after probe status: -12") is None
+
+    res = classify("nvme nvme19: Removing after probe failure status: -12")
+    assert res[0] == "nvme_failure" and res[2] == ("nvme19", "-12"), pformat(res)
+
+    res = classify("nvme nvme0: pci function 0000:87:00.0")
+    assert res[0] == "nvme_addr" and res[2] == ("nvme0", "0000:87:00.0"), pformat(res)
+
+    res = classify("nvme nvme3: I/O 840 QID 9 timeout, aborting")
+    assert res[0] == "nvme_timeout" and res[2] == ("nvme3", "840", "9", "aborting"), pformat(res)
+
+    res = classify("nvme nvme3: I/O 24 (I/O Cmd) QID 1 timeout, reset controller")
+    assert res[0] == "nvme_timeout" and res[2] == ("nvme3", "24", "1", "reset controller"), pformat(res)
+
+    res = classify("nvme nvme3: controller is down; will reset: CSTS=0xffffffff, PCI_STATUS=0xffff")
+    assert res[0] == "nvme_reset" and res[2][0] == "nvme3", pformat(res)
+
+    res = classify("pcieport 0000:00:03.0: AER: Uncorrected (Fatal) error received: 0000:04:00.0")
+    assert res[0] == "pci_aer" and res[2] == ("0000:00:03.0", "Uncorrected (Fatal) error received: 0000:04:00.0"), pformat(res)
+    logger.debug(res)
+
+
+class KmsgClassifier:
+    """
+    Single pass classification of kmsg messages against all the registered patterns.
+
+    Each pattern comes with the literal prefixes its messages start with. A message that starts with none of them
+    (most of a kernel log storm) is rejected with one str.startswith() call, the rest are matched once against the
+    alternation of all patterns, and the name of the alternative that matched tells which pattern it was.
+    """
+
+    def __init__(self):
+        self._patterns = []  # (name, prefixes, regex)
+        self._prefixes = ()
+        self._combined = None
+        self._group_slices = {}
+
+    def register(self, name, prefixes, regex):
+        """regex must match the whole message and may use unnamed groups only, they are returned by classify()."""
+        self._patterns.append((name, tuple(prefixes), regex))
+        self._prefixes = tuple(sorted({prefix for _, prefixes, _ in self._patterns for prefix in prefixes}))
+
+        alternatives = []
+        self._group_slices = {}
+        group_index = 1
+        for name, _, regex in self._patterns:
+            # each alternative is wrapped in a group named after the pattern, its own groups follow that one
+            num_groups = re.compile(regex).groups
+            self._group_slices[name] = slice(group_index + 1, group_index + 1 + num_groups)
+            group_index += 1 + num_groups
+            alternatives.append(f"(?P<{name}>{regex})")
+        self._combined = re.compile("|".join(alternatives))
+
+    def classify(self, msg):
+        """Return (name, match, groups) of the pattern msg matches, or None."""
+        if not msg.startswith(self._prefixes):
+            return None
+        res = self._combined.fullmatch(msg)
+        if res is None:
+            return None
+        name = res.lastgroup
+        group_slice = self._group_slices[name]
+        return name, res, tuple(res.group(i) for i in range(group_slice.start, group_slice.stop))
+
+
+class NvmeTopology:
+    """
+    In memory index of nvme name <-> pci address <-> kernel driver <-> namespaces.
+
+    Built once from sysfs, then kept up to date from the kernel uevents (NETLINK_KOBJECT_UEVENT) of the nvme, block
+    and pci subsystems, so looking a device up doesn't list /dev or sysfs. When the uevent socket can't be opened
+    (or in simulated mode) every lookup reads sysfs directly, like before.
+    """
+    NETLINK_KOBJECT_UEVENT = 15
+    UEVENT_BUFFER_SIZE = 1 << 20
+    RE_NVME_NAME = re.compile(r'^nvme\d+$')
+    RE_NVME_NAMESPACE = re.compile(r'^(nvme\d+)n\d+$')
+
+    def __init__(self, live=True):
+        self._sock = None
+        self._nvme_to_pci_addr = {}
+        self._pci_addr_driver = {}
+        self._nvme_namespaces = {}
+        if live:
+            try:
+                self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, self.NETLINK_KOBJECT_UEVENT)
+                self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.UEVENT_BUFFER_SIZE)
+                self._sock.bind((0, 1))
+                self._sock.setblocking(False)
+            except OSError:
+                logger.exception("failed to listen to kernel uevents, will read sysfs on every lookup")
+                self._sock = None
+        if self._sock is not None:
+            self.refresh()
+
+    def live(self):
+        return self._sock is not None
+
+    def fileno(self):
+        return self._sock.fileno()
+
+    @staticmethod
+    def _read_pci_addr(nvme):
+        try:
+            with open(os.path.join("/sys/class/nvme", nvme, "address"), "r") as f:
+                return f.read().strip(' \n\t')
+        except FileNotFoundError:
+            return ""
+
+    @staticmethod
+    def _read_driver(pci_addr):
+        try:
+            return os.path.basename(os.readlink(f"/sys/bus/pci/devices/{pci_addr}/driver"))
+        except FileNotFoundError:
+            return ""
+
+    def refresh(self):
+        """Rebuild the whole index from sysfs."""
+        nvme_to_pci_addr = {}
+        for nvme in os.listdir("/sys/class/nvme") if os.path.isdir("/sys/class/nvme") else []:
+            pci_addr = self._read_pci_addr(nvme)
+            if len(pci_addr) > 0:
+                nvme_to_pci_addr[nvme] = pci_addr
+        nvme_namespaces = {}
+        for dev in os.listdir("/sys/block"):
+            res = self.RE_NVME_NAMESPACE.match(dev)
+            if res is not None:
+                nvme_namespaces.setdefault(res.groups()[0], set()).add(dev)
+        self._nvme_to_pci_addr = nvme_to_pci_addr
+        self._pci_addr_driver = {pci_addr: self._read_driver(pci_addr) for pci_addr in nvme_to_pci_addr.values()}
+        self._nvme_namespaces = nvme_namespaces
+        logger.info("nvme topology: %s", pformat({nvme: (pci_addr, self._pci_addr_driver[pci_addr], sorted(self._nvme_namespaces.get(nvme, [])))
+                                                 for nvme, pci_addr in sorted(self._nvme_to_pci_addr.items())}))
+
+    def poll(self):
+        """Apply the pending uevents, return how many were relevant."""
+        changes = 0
+        while True:
+            try:
+                data = self._sock.recv(self.UEVENT_BUFFER_SIZE)
+            except BlockingIOError:
+                return changes
+            except OSError:
+                # ENOBUFS, uevents were dropped
+                logger.warning("lost kernel uevents, rebuilding nvme topology from sysfs")
+                self.refresh()
+                changes += 1
+                continue
+            changes += self._apply_uevent(data)
+
+    def _apply_uevent(self, data):
+        # action@devpath\0ACTION=...\0DEVPATH=...\0SUBSYSTEM=...\0...
+        fields = data.decode("utf-8", errors="replace").split("\0")
+        env = dict(field.split("=", 1) for field in fields[1:] if "=" in field)
+        action = env.get("ACTION")
+        subsystem = env.get("SUBSYSTEM")
+        devname = env.get("DEVNAME", "")
+        devname = devname[len("/dev/"):] if devname.startswith("/dev/") else devname
+
+        if subsystem == "nvme" and self.RE_NVME_NAME.match(devname):
+            if action == "add":
+                # DEVPATH=/devices/pci0000:00/0000:00:03.0/0000:04:00.0/nvme/nvme0
+                pci_addr = env.get("DEVPATH", "").split("/")[-3]
+                self._nvme_to_pci_addr[devname] = pci_addr
+                self._pci_addr_driver.setdefault(pci_addr, self._read_driver(pci_addr))
+            elif action == "remove":
+                self._nvme_to_pci_addr.pop(devname, None)
+                self._nvme_namespaces.pop(devname, None)
+            else:
+                return 0
+        elif subsystem == "block" and self.RE_NVME_NAMESPACE.match(devname):
+            nvme = self.RE_NVME_NAMESPACE.match(devname).groups()[0]
+            if action == "add":
+                self._nvme_namespaces.setdefault(nvme, set()).add(devname)
+            elif action == "remove":
+                self._nvme_namespaces.get(nvme, set()).discard(devname)
+            else:
+                return 0
+        elif subsystem == "pci" and "PCI_SLOT_NAME" in env:
+            pci_addr = env["PCI_SLOT_NAME"]
+            if action in ("add", "bind"):
+                self._pci_addr_driver[pci_addr] = env.get("DRIVER", "")
+            elif action == "unbind":
+                self._pci_addr_driver[pci_addr] = ""
+            elif action == "remove":
+                self._pci_addr_driver.pop(pci_addr, None)
+            else:
+                return 0
+        else:
+            return 0
+
+        logger.debug("uevent %s %s %s", action, subsystem, devname or env.get("PCI_SLOT_NAME"))
+        return 1
+
+    def pci_addr(self, nvme):
+        if not self.live():
+            return self._read_pci_addr(nvme)
+        return self._nvme_to_pci_addr.get(nvme, "")
+
+    def driver(self, pci_addr):
+        if not self.live():
+            return self._read_driver(pci_addr)
+        return self._pci_addr_driver.get(pci_addr, "")
+
+    def namespaces(self, nvme):
+        if not self.live():
+            return sorted(dev for dev in os.listdir("/sys/block") if dev.startswith(f"{nvme}n"))
+        return sorted(self._nvme_namespaces.get(nvme, []))
+
+
 class PCIWatchDog:
     # nvme nvme19: Removing after probe failure status: -12
     # nvme nvme0: Removing after probe failure status: -19
-    RE_NVME_FAILURE_FMT = re.compile('^nvme (.+): Removing after probe failure status: (-\d+)$')
+    KMSG_NVME_FAILURE = 'nvme (.+): Removing after probe failure status: (-\d+)'
+    RE_NVME_FAILURE_FMT = re.compile(f'^{KMSG_NVME_FAILURE}$')
     # nvme nvme0: pci function 0000:87:00.0
-    RE_NVME_DEV_TO_ADDR_FMT = re.compile('^nvme (.+): pci function (.+)$')
+    KMSG_NVME_DEV_TO_ADDR = 'nvme (.+): pci function (.+)'
+    RE_NVME_DEV_TO_ADDR_FMT = re.compile(f'^{KMSG_NVME_DEV_TO_ADDR}$')
+    # nvme nvme3: I/O 840 QID 9 timeout, aborting
+    # nvme nvme3: I/O 24 (I/O Cmd) QID 1 timeout, reset controller
+    KMSG_NVME_TIMEOUT = 'nvme (nvme\d+): I/O (\d+)(?: \(.*\))? QID (\d+) timeout, (.+)'
+    # nvme nvme3: controller is down; will reset: CSTS=0xffffffff, PCI_STATUS=0xffff
+    KMSG_NVME_RESET = 'nvme (nvme\d+): (controller is down; will reset.*|resetting controller.*)'
+    # pcieport 0000:00:03.0: AER: Uncorrected (Fatal) error received: 0000:04:00.0
+    # nvme 0000:04:00.0: AER: can't recover (no error_detected callback)
+    KMSG_PCI_AER = '(?:pcieport|nvme) ([0-9a-f]{4}:[0-9a-f]{2}:[0-9a-f]{2}\.[0-7]): AER: (.+)'
+
+    # don't flood weka events while a device keeps timing out or reporting AER errors
+    SEC_BETWEEN_REPEATED_WEKA_EVENTS = 60
+
+    SEC_BETWEEN_REMOVE_AND_RESCAN = 2
+    SEC_BETWEEN_RESCAN_AND_CHECK = 5
+    # /dev/kmsg returns a single record per read, a record is at most ~1k
+    KMSG_READ_SIZE = 8192
 
     def __init__(self, file_handler, ignore_timestamp=False, dry_run=False):
         self._hostname = socket.gethostname()
@@ -88,6 +322,9 @@ class PCIWatchDog:
         self._dry_run = dry_run
         self._started_at_uptime = 0 if ignore_timestamp else get_uptime()
         self._simulated_mode = True if isinstance(self._file_handler, io.StringIO) else False
+        if not self._simulated_mode:
+            # records are read straight from the fd until EAGAIN, see _read_kmsg_lines()
+            os.set_blocking(self._file_handler.fileno(), False)
 
         # self._all_pcis = {}
         # self._nvme_pcis = {}
@@ -96,6 +333,24 @@ class PCIWatchDog:
         self._nvme_to_pci_addr = {}
         self._nvme_remove_time = {}
         self._nvme_rescan_time = {}
+        self._weka_event_time = {}
+        self._nvme_failure_time = {}
+        self._topology = NvmeTopology(live=not self._simulated_mode)
+
+        self._kmsg_handlers = {}
+        self._kmsg_classifier = KmsgClassifier()
+        self.register_kmsg_pattern("nvme_failure", ["nvme nvme"], self.KMSG_NVME_FAILURE, self._kmsg_nvme_failure)
+        self.register_kmsg_pattern("nvme_addr", ["nvme nvme"], self.KMSG_NVME_DEV_TO_ADDR, self._kmsg_nvme_addr)
+        self.register_kmsg_pattern("nvme_timeout", ["nvme nvme"], self.KMSG_NVME_TIMEOUT, self._kmsg_nvme_timeout)
+        self.register_kmsg_pattern("nvme_reset", ["nvme nvme"], self.KMSG_NVME_RESET, self._kmsg_nvme_reset)
+        self.register_kmsg_pattern("pci_aer", ["pcieport ", "nvme 0"], self.KMSG_PCI_AER, self._kmsg_pci_aer)
+
+
+    def register_kmsg_pattern(self, name, prefixes, regex, handler):
+        """handler(kmsg_time, kmsg_msg, groups) is called for every kmsg message matching regex (and starting with
+        one of prefixes), groups being the regex groups."""
+        self._kmsg_classifier.register(name, prefixes, regex)
+        self._kmsg_handlers[name] = handler
 
 
     def _verify_weka_sent_events(self):
@@ -125,12 +380,27 @@ class PCIWatchDog:
         self._weka_events_list.append(subprocess.Popen(["weka", "events", "trigger-event", msg], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
 
 
+    def _weka_event_rate_limited(self, key, msg):
+        time_cur = time.time()
+        if time_cur - self._weka_event_time.get(key, 0) < self.SEC_BETWEEN_REPEATED_WEKA_EVENTS:
+            return
+        self._weka_event_time[key] = time_cur
+        self._weka_event(msg)
+
+
     def _weka_event_nvme_failure_identified(self, nvme, pci_addr, msg):
         self._weka_event(f"nvme({nvme}) pci_addr({pci_addr}) {msg}")
 
 
     def _weka_event_nvme_recovered(self, nvme, pci_addr):
-        self._weka_event(f"nvme({nvme}) pci_addr({pci_addr}) recovered")
+        failure_time = self._nvme_failure_time.pop(nvme, None)
+        if failure_time is None:
+            self._weka_event(f"nvme({nvme}) pci_addr({pci_addr}) recovered")
+            return
+
+        latency = time.time() - failure_time
+        logger.info("nvme(%s) pci_addr(%s) recovered %.1f sec after failure identified", nvme, pci_addr, latency)
+        self._weka_event(f"nvme({nvme}) pci_addr({pci_addr}) recovered after {latency:.1f}s")
 
 
     # def pcis(self):
@@ -152,27 +422,20 @@ class PCIWatchDog:
     #     return self._nvme_pcis
 
 
-    def _kmsg_nvme_failure(self, kmsg_time, kmsg_msg):
-        res = self.RE_NVME_FAILURE_FMT.match(kmsg_msg)
-        if res is None or len(res.groups()) != 2:
-            return False
-
-        nvme=res.groups()[0].strip(' \n\t')
-        error_code=res.groups()[1].strip(' \n\t')
+    def _kmsg_nvme_failure(self, kmsg_time, kmsg_msg, groups):
+        nvme=groups[0].strip(' \n\t')
+        error_code=groups[1].strip(' \n\t')
         self._failed_nvme_list.append(nvme)
+        self._nvme_failure_time.setdefault(nvme, time.time())
         pci_addr = self._nvme_to_pci_addr.get(nvme, "")
         logger.warning("nvme(%s) pci_addr(%s) failed with error code %s", nvme, pci_addr, error_code)
         self._weka_event_nvme_failure_identified(nvme, pci_addr, f"time({int(kmsg_time)*1000000}) {kmsg_msg}")
         return True
 
 
-    def _kmsg_nvme_addr(self, kmsg_time, kmsg_msg):
-        res = self.RE_NVME_DEV_TO_ADDR_FMT.match(kmsg_msg)
-        if res is None or len(res.groups()) != 2:
-            return False
-
-        nvme_name=res.groups()[0].strip(' \n\t')
-        nvme_pci_addr=res.groups()[1].strip(' \n\t')
+    def _kmsg_nvme_addr(self, kmsg_time, kmsg_msg, groups):
+        nvme_name=groups[0].strip(' \n\t')
+        nvme_pci_addr=groups[1].strip(' \n\t')
         logger.info("nvme(%s) pci_addr(%s) pci function", nvme_name, nvme_pci_addr)
         prev_pci_addr = self._nvme_to_pci_addr.get(nvme_name)
         if prev_pci_addr is not None and prev_pci_addr != nvme_pci_addr:
@@ -181,46 +444,110 @@ class PCIWatchDog:
         return True
 
 
-    def poll(self):
-        did_something = 0
-        while True:
-            if isinstance(self._file_handler, io.TextIOWrapper):
-                r, _, _ = select.select([ self._file_handler ], [], [], 0)
-                if self._file_handler not in r:
-                    break
-            elif self._simulated_mode and self._file_handler.closed:
-                break
+    def _kmsg_nvme_timeout(self, kmsg_time, kmsg_msg, groups):
+        nvme, command_id, qid, action = groups
+        pci_addr = self._nvme_to_pci_addr.get(nvme, "")
+        logger.warning("nvme(%s) pci_addr(%s) I/O %s QID %s timeout, %s", nvme, pci_addr, command_id, qid, action)
+        self._weka_event_rate_limited(("timeout", nvme), f"nvme({nvme}) pci_addr({pci_addr}) I/O timeout, {action}")
+        return True
+
+
+    def _kmsg_nvme_reset(self, kmsg_time, kmsg_msg, groups):
+        nvme, reason = groups
+        pci_addr = self._nvme_to_pci_addr.get(nvme, "")
+        logger.warning("nvme(%s) pci_addr(%s) %s", nvme, pci_addr, reason)
+        self._weka_event_rate_limited(("reset", nvme), f"nvme({nvme}) pci_addr({pci_addr}) {reason}")
+        return True
 
-            line = self._file_handler.readline()
-            if not line or len(line) == 0:
-                if self._simulated_mode:
+
+    def _kmsg_pci_aer(self, kmsg_time, kmsg_msg, groups):
+        pci_addr, error = groups
+        if "Corrected" in error and "Uncorrected" not in error:
+            # corrected errors come in floods and need no action, keep them out of the weka events
+            logger.info("pci_addr(%s) AER: %s", pci_addr, error)
+            return True
+        logger.warning("pci_addr(%s) AER: %s", pci_addr, error)
+        self._weka_event_rate_limited(("aer", pci_addr), f"pci_addr({pci_addr}) AER: {error}")
+        return True
+
+
+    def _read_kmsg_lines(self):
+        if self._simulated_mode:
+            while not self._file_handler.closed:
+                line = self._file_handler.readline()
+                if not line or len(line) == 0:
                     self._file_handler.close()
+                    break
+                yield line
+            return
+
+        fd = self._file_handler.fileno()
+        while True:
+            try:
+                record = os.read(fd, self.KMSG_READ_SIZE)
+            except BlockingIOError:
                 break
+            except BrokenPipeError:
+                # the kernel overwrote records we did not read yet, the next read continues from the oldest one left
+                logger.warning("kmsg records were overwritten before being read")
+                continue
+            if not record:
+                break
+            # a record may carry continuation lines (" SUBSYSTEM=...") which, like before, are skipped by poll()
+            yield from record.decode("utf-8", errors="replace").splitlines()
+
 
+    def poll(self):
+        did_something = 0
+        for line in self._read_kmsg_lines():
             did_something = 1
             line = line.strip(' \n\t')
             # logger.debug(line)
-            line_split = line.split(";")
-
-            if len(line_split) < 2:
+            header, sep, kmsg_msg = line.partition(";")
+            if not sep:
                 continue
 
-            pri, index, time_from_boot, _ = line_split[0].split(",")
+            # pri,seq,time,flags[,fields added by newer kernels]
+            pri, index, time_from_boot = header.split(",", 3)[:3]
             time_from_boot = float(time_from_boot) / 1000000
             if time_from_boot < self._started_at_uptime:
                 # logger.debug("skipping. happend before our time")
                 continue
 
-            logger.debug(line)
-            kmsg_msg = ";".join(line_split[1:]).strip(' \n\t')
-            if self._kmsg_nvme_failure(time_from_boot, kmsg_msg):
-                continue
-            if self._kmsg_nvme_addr(time_from_boot, kmsg_msg):
+            kmsg_msg = kmsg_msg.strip(' \n\t')
+            res = self._kmsg_classifier.classify(kmsg_msg)
+            if res is None:
                 continue
 
+            logger.debug(line)
+            name, _, groups = res
+            self._kmsg_handlers[name](time_from_boot, kmsg_msg, groups)
+
         return did_something
 
 
+    def _wait_timeout(self, watch_lap_time_sec):
+        """Seconds until handle_nvmes() or the weka events have something due, None if only a new kmsg record can
+        give us work."""
+        time_cur = time.time()
+        deadlines = []
+        if len(self._nvme_remove_time) > 0:
+            # one rescan for all removed nvmes, after the last of them was removed
+            deadlines.append(max(self._nvme_remove_time.values()) + self.SEC_BETWEEN_REMOVE_AND_RESCAN)
+        # only nvmes still failing are checked after their rescan. a check that is already due is left to the lap
+        # below: an nvme whose pci_addr can't be identified any more never gets checked, and its passed deadline
+        # would keep the loop from ever sleeping
+        check_deadlines = [rescan_time + self.SEC_BETWEEN_RESCAN_AND_CHECK
+                           for nvme, rescan_time in self._nvme_rescan_time.items() if nvme in self._failed_nvme_list]
+        deadlines += [deadline for deadline in check_deadlines if deadline > time_cur]
+        if len(self._failed_nvme_list) > 0 or len(self._weka_events_list) > 0:
+            # failed nvmes may recover by themselves and events may need to be resent, so keep checking on them
+            deadlines.append(time_cur + watch_lap_time_sec)
+        if len(deadlines) == 0:
+            return None
+        return max(0, min(deadlines) - time_cur)
+
+
     def _nvme_remove(self, nvme, pci_addr):
 
         def _pci_rm(nvme, pci_addr):
@@ -236,6 +563,7 @@ class PCIWatchDog:
 
         if self._simulated_mode:
             _pci_rm(nvme, pci_addr)
+            self._nvme_remove_time[nvme] = time.time()
             return 1
 
         remove_time = self._nvme_remove_time.get(nvme)
@@ -249,51 +577,60 @@ class PCIWatchDog:
 
 
 
-    def _pci_rescan(self, nvme):
-        sec_between_remove_and_rescan = 2
+    def _pci_rescan(self):
+        # a single rescan for every nvme removed since the last one, so drives that failed together (e.g. behind the
+        # same pcie switch) are rediscovered together instead of rescanning the bus per drive
+        sec_between_remove_and_rescan = self.SEC_BETWEEN_REMOVE_AND_RESCAN
+        if len(self._nvme_remove_time) == 0:
+            return 0
 
-        def _rescan(nvme):
-            logger.info("rescan. reason nvme(%s) been removed more then 2 sec ago", nvme)
+        def _rescan(nvmes):
+            logger.info("rescan. reason nvmes(%s) been removed more then 2 sec ago", ",".join(nvmes))
             if not self._dry_run:
                 with open("/sys/bus/pci/rescan", "w") as f:
                     f.write("1")
 
-            self._nvme_rescan_time[nvme] = time.time()
+            rescan_time = time.time()
+            for nvme in nvmes:
+                self._nvme_rescan_time[nvme] = rescan_time
 
 
+        nvmes = sorted(self._nvme_remove_time)
         if self._simulated_mode:
             time.sleep(sec_between_remove_and_rescan)
-            _rescan(nvme)
+            _rescan(nvmes)
+            self._nvme_remove_time.clear()
             return 1
 
-        remove_time = self._nvme_remove_time.get(nvme)
-        if remove_time is None or time.time() - remove_time < sec_between_remove_and_rescan:
+        if time.time() - max(self._nvme_remove_time.values()) < sec_between_remove_and_rescan:
             return 0
 
-        _rescan(nvme)
-        del self._nvme_remove_time[nvme]
+        _rescan(nvmes)
+        self._nvme_remove_time.clear()
         return 1
 
 
 
     def _identify_nvme_pci_addr(self, nvme):
-        _path = os.path.join("/sys/class/nvme", nvme, "address")
         res = None
 
-        # try read from sysfs
-        if os.path.exists(_path):
-            try:
-                with open(_path, "r") as f:
-                    res = f.read().strip(' \n\t')
-                # logger.debug("got %s address %s from %s", nvme, res, _path)
-            except Exception as e:
-                logger.exception("failed read pci addr from sysfs")
+        # try the sysfs topology
+        try:
+            res = self._topology.pci_addr(nvme)
+        except Exception as e:
+            logger.exception("failed read pci addr from sysfs")
 
         if res is None or len(res) == 0:
             res = self._nvme_to_pci_addr.get(nvme, "")
         return res
 
 
+    def _nvme_forget(self, nvme):
+        # the nvme recovered, a new failure of it starts over from remove and rescan
+        self._nvme_remove_time.pop(nvme, None)
+        self._nvme_rescan_time.pop(nvme, None)
+
+
     def _nvme_check(self, nvme):
         rescan_time = self._nvme_rescan_time.get(nvme)
         # this case the first time we check before trying to remove and rescan
@@ -301,7 +638,7 @@ class PCIWatchDog:
             return True
 
         # we initiate rescan but not pass 5 sec yet
-        if time.time() - rescan_time <= 5:
+        if time.time() - rescan_time <= self.SEC_BETWEEN_RESCAN_AND_CHECK:
             return False
 
         # we initiate rescan and 5 sec pass
@@ -310,12 +647,11 @@ class PCIWatchDog:
 
 
     def _kernel_driver_name(self, nvme, pci_addr):
-        _path = f"/sys/bus/pci/devices/{pci_addr}/driver"
         try:
-            if not os.path.exists(_path):
-                logger.warning("path %s not exist. nvme(%s) pci_addr(%s)", _path, nvme, pci_addr)
+            driver_name = self._topology.driver(pci_addr)
+            if len(driver_name) == 0:
+                logger.warning("no kernel driver bound. nvme(%s) pci_addr(%s)", nvme, pci_addr)
                 return ""
-            driver_name = os.path.basename(os.readlink(_path))
             logger.info("driver of nvme(%s) pci_addr(%s) %s", nvme, pci_addr, driver_name)
             return driver_name
         except Exception as e:
@@ -331,7 +667,7 @@ class PCIWatchDog:
 
             driver_name = self._kernel_driver_name(nvme, pci_addr)
             if driver_name == "nvme":
-                nvme_dev_ns = [dev for dev in os.listdir("/dev") if dev.startswith(f"{nvme}n")]
+                nvme_dev_ns = self._topology.namespaces(nvme)
                 dev_path = os.path.join("/dev", nvme)
                 dev_path_exist = os.path.exists(dev_path)
 
@@ -368,11 +704,10 @@ class PCIWatchDog:
         if len(self._failed_nvme_list) < 1:
             return did_something
 
-        nvmes_to_handle = self._failed_nvme_list
+        nvmes_to_handle = list(dict.fromkeys(self._failed_nvme_list))
         self._failed_nvme_list = []
-        while len(nvmes_to_handle) > 0:
-            nvme = nvmes_to_handle.pop(0)
-
+        nvmes_to_verify = []
+        for nvme in nvmes_to_handle:
             pci_addr = self._identify_nvme_pci_addr(nvme)
             if pci_addr is None or len(pci_addr) == 0:
                 logger.error("can't identify nvme(%s) pci_addr", nvme)
@@ -380,18 +715,36 @@ class PCIWatchDog:
                 continue
 
             logger.info("handle nvme(%s) pci_addr(%s)", nvme, pci_addr)
-            if self._nvme_ok(nvme):
-                continue
-
-            if not self._nvme_check(nvme):
-                self._failed_nvme_list.append(nvme)
+            nvmes_to_verify.append((nvme, pci_addr))
+
+        # verify all the nvmes at once, sysfs of a device that is being reset may block for a while
+        if len(nvmes_to_verify) > 1:
+            with ThreadPoolExecutor(max_workers=min(len(nvmes_to_verify), 16)) as executor:
+                nvmes_ok = list(executor.map(self._nvme_ok, [nvme for nvme, _ in nvmes_to_verify]))
+        else:
+            nvmes_ok = [self._nvme_ok(nvme) for nvme, _ in nvmes_to_verify]
+
+        recovered = [nvme for (nvme, _), nvme_ok in zip(nvmes_to_verify, nvmes_ok) if nvme_ok]
+        if len(recovered) > 1:
+            logger.info("recovered nvmes(%s) in the same cycle", ",".join(recovered))
+        # stale remove/rescan times would skip the remove step when a recovered nvme fails again
+        for nvme in recovered:
+            self._nvme_forget(nvme)
+
+        nvmes_to_remove = []
+        for (nvme, pci_addr), nvme_ok in zip(nvmes_to_verify, nvmes_ok):
+            if nvme_ok:
                 continue
 
             # nvme device not ok, keep it on the list to verify
             self._failed_nvme_list.append(nvme)
+            if self._nvme_check(nvme):
+                nvmes_to_remove.append((nvme, pci_addr))
 
+        # one remove wave for all nvmes that are not ok, followed by a single rescan
+        for nvme, pci_addr in nvmes_to_remove:
             did_something += self._nvme_remove(nvme, pci_addr)
-            did_something += self._pci_rescan(nvme)
+        did_something += self._pci_rescan()
 
         return did_something
 
@@ -406,18 +759,32 @@ class PCIWatchDog:
         self.avoid_oom_killer()
 
         watch_lap_time_sec = 1
-        time_prev = 0
         did_something = 0
+        epoll = None
+        if not self._simulated_mode:
+            epoll = select.epoll()
+            epoll.register(self._file_handler.fileno(), select.EPOLLIN)
+            if self._topology.live():
+                epoll.register(self._topology.fileno(), select.EPOLLIN)
+
         while True:
             try:
-                time_cur = time.time()
-
-                # this sleep required to not reach core 100% while we have nothing to do
-                if did_something == 0 and time_cur - time_prev < watch_lap_time_sec:
-                    sleep_time = watch_lap_time_sec - (time_cur - time_prev)
-                    time.sleep(sleep_time)
+                # block until a kmsg record arrives or a remove/rescan/check deadline expires, so we react to a
+                # failure as soon as the kernel reports it and don't wake up while there is nothing to do
+                if did_something == 0:
+                    timeout = self._wait_timeout(watch_lap_time_sec)
+                    if epoll is not None:
+                        epoll.poll(-1 if timeout is None else timeout)
+                    else:
+                        time.sleep(watch_lap_time_sec if timeout is None else timeout)
 
                 did_something = 0
+                if self._topology.live():
+                    try:
+                        self._topology.poll()
+                    except Exception as e:
+                        logger.exception("something went wrong while reading uevents")
+
                 try:
                     did_something += self.poll()
                 except Exception as e:
@@ -428,8 +795,6 @@ class PCIWatchDog:
                 except Exception as e:
                     logger.exception("something went wrong while try to handle nvmes failures")
 
-                time_prev = time_cur
-
                 self._verify_weka_sent_events()
 
                 # this case useful in test scenario that nothin else left to parse and we want to bail out
@@ -2,7 +2,7 @@
 #
 ### Stripe: 4 + 2
 ### 1/96 buckets are down
-### Working on node 1 (last node is 101)...Got placements from all nodes
+### Got placements from 101/101 nodes...Got placements from all nodes
 ### Active: 95 buckets
 ### Unresponsive: 1 buckets
 ### ------------------------------------
@@ -10,10 +10,22 @@
 ###     DiskId<1>
 ###     DiskId<2>
 
+import array
+import collections
+import os
+import random
+import selectors
 import subprocess
 import json
 import sys
-from optparse import OptionParser
+import time
+import tracemalloc
+from optparse import OptionParser, SUPPRESS_HELP
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 parser = OptionParser()
 parser.add_option(
@@ -21,7 +33,15 @@ parser.add_option(
     help="make lots of noise [default]")
 parser.add_option(
     "--batch", default=16, type="int",
-    help="number of raid_placements manholes to concurrently execute")
+    help="number of raid_placements manholes to keep in flight")
+parser.add_option(
+    "--retries", default=2, type="int",
+    help="times to retry a node whose raid_placements manhole failed")
+parser.add_option(
+    "--solver-timeout", default=10.0, type="float",
+    help="seconds to search for the smallest set of drives to revive before settling for a greedy one")
+parser.add_option(
+    "--benchmark", default=None, type="int", metavar="BUCKETS", help=SUPPRESS_HELP)
 
 def parse_typed_identifier(prefix):
     def parse(s):
@@ -47,24 +67,62 @@ def get_status():
 def get_rebuild_status():
     return json_call(["weka", "status", "rebuild", "-J"])
 
-def chunks(seq, size):
-    return (seq[i:i+size] for i in range(0, len(seq), size))
-
-class JsonCall:
-    def __init__(self, *args, **kw):
-        self.cmd = args
-        self.popen = subprocess.Popen(*args, stdout=subprocess.PIPE, **kw)
-    def result(self):
-        assert self.popen.stdout
-        output = self.popen.stdout.read()
-        code = self.popen.wait()
-        if code != 0:
-            print(self.cmd, ":", code)
-            raise subprocess.CalledProcessError(returncode=code, cmd=self.cmd)
-        return json.loads(output)
-
-def raid_placements(node_id):
-    return JsonCall(["weka", "debug", "manhole", "--node=%s" % node_id, "raid_placements"])
+def raid_placements_cmd(node_id):
+    return ["weka", "debug", "manhole", "--node=%s" % node_id, "raid_placements"]
+
+def collect_placements(node_ids, window, retries):
+    """Yield (node_id, raid_placements result) for every node, in completion order.
+
+    Keeps up to `window` manholes in flight: a new one starts as soon as any
+    running one exits, so a slow node only holds up its own slot. A node whose
+    manhole fails or returns bad JSON is queued again up to `retries` times,
+    after which it is yielded with a None result.
+    """
+    pending = collections.deque((node_id, 1) for node_id in node_ids)
+    running = {}
+    sel = selectors.DefaultSelector()
+
+    def start(node_id, attempt):
+        popen = subprocess.Popen(raid_placements_cmd(node_id), stdout=subprocess.PIPE)
+        os.set_blocking(popen.stdout.fileno(), False)
+        running[popen.stdout.fileno()] = (node_id, attempt, popen, [])
+        sel.register(popen.stdout, selectors.EVENT_READ)
+
+    try:
+        while pending or running:
+            while pending and len(running) < window:
+                start(*pending.popleft())
+
+            for key, _ in sel.select():
+                node_id, attempt, popen, output = running[key.fd]
+                data = popen.stdout.read()
+                if data is None:
+                    continue
+                if data:
+                    output.append(data)
+                    continue
+
+                sel.unregister(popen.stdout)
+                popen.stdout.close()
+                del running[key.fd]
+                code = popen.wait()
+                try:
+                    if code != 0:
+                        raise subprocess.CalledProcessError(returncode=code, cmd=popen.args)
+                    result = json.loads(b"".join(output))
+                except (subprocess.CalledProcessError, ValueError) as e:
+                    if attempt <= retries:
+                        print("\nWARNING: NodeId<%s>: %s, retrying (attempt %s/%s)" % (node_id, e, attempt + 1, retries + 1))
+                        pending.append((node_id, attempt + 1))
+                        continue
+                    print("\nERROR: NodeId<%s>: %s, giving up after %s attempts" % (node_id, e, attempt))
+                    result = None
+                yield node_id, result
+    finally:
+        for node_id, attempt, popen, output in running.values():
+            popen.kill()
+            popen.wait()
+        sel.close()
 
 def get_enabled_bits(num):
     idx = 0
@@ -76,7 +134,136 @@ def get_enabled_bits(num):
 def space_separated(seq):
     return " ".join(str(x) for x in seq)
 
-def main(*, verbose, batch_size):
+NO_ID = -1  # INVALID identifiers, stored in the integer columns
+
+class PlacementTable:
+    """Every placement reported by the compute nodes, one row per (bucket, placement).
+
+    Stored column-wise in flat arrays: `width` disk ids per row (NO_ID for
+    INVALID), and the raw dirty/down bitmasks from raid_placements. Failure
+    patterns are grouped straight from the columns, vectorized when NumPy is
+    installed, instead of building a dict and frozensets for every placement.
+    """
+
+    def __init__(self, width):
+        assert 0 < width <= 64
+        self.width = width
+        self.bucket_ids = array.array('i')
+        self.placement_idxs = array.array('i')
+        self.disks = array.array('i')
+        self.dirty = array.array('Q')
+        self.down = array.array('Q')
+
+    def __len__(self):
+        return len(self.bucket_ids)
+
+    def add(self, bucket_id, placement_idx, disks, dirty, down):
+        assert len(disks) <= self.width
+        self.bucket_ids.append(NO_ID if bucket_id is None else bucket_id)
+        self.placement_idxs.append(NO_ID if placement_idx is None else placement_idx)
+        self.disks.extend(NO_ID if disk_id is None else disk_id for disk_id in disks)
+        self.disks.extend([NO_ID] * (self.width - len(disks)))
+        self.dirty.append(dirty)
+        self.down.append(down)
+
+    def remove_duplicates(self):
+        """Keep only the last report of each (bucket, placement); return the (bucket, placement) pairs replaced."""
+        seen = set()
+        duplicates = []
+        keep = []
+        for row in range(len(self) - 1, -1, -1):
+            key = (self.bucket_ids[row], self.placement_idxs[row])
+            if key in seen:
+                duplicates.append(key)
+            else:
+                seen.add(key)
+                keep.append(row)
+        if duplicates:
+            keep.reverse()
+            w = self.width
+            self.bucket_ids = array.array('i', (self.bucket_ids[row] for row in keep))
+            self.placement_idxs = array.array('i', (self.placement_idxs[row] for row in keep))
+            self.disks = array.array('i', (disk_id for row in keep for disk_id in self.disks[row * w:(row + 1) * w]))
+            self.dirty = array.array('Q', (self.dirty[row] for row in keep))
+            self.down = array.array('Q', (self.down[row] for row in keep))
+        return duplicates
+
+    def bucket_set(self):
+        return set(self.bucket_ids)
+
+    def failure_patterns(self, bucket_ids):
+        """Group the placements of `bucket_ids` by failure pattern.
+
+        Returns ({(dirty_disks, down_disks): set(bucket_ids)}, [(bucket_id, placement_idx) that could not probe
+        its disks]). Healthy placements (no dirty or down disks) are left out.
+        """
+        if numpy is not None:
+            return self._failure_patterns_numpy(bucket_ids)
+        return self._failure_patterns_python(bucket_ids)
+
+    def _failure_patterns_python(self, bucket_ids):
+        w = self.width
+        disks = self.disks
+        bits_of_mask = {}
+        patterns = {}
+        unprobed = []
+        for row, (bucket_id, dirty, down) in enumerate(zip(self.bucket_ids, self.dirty, self.down)):
+            if bucket_id not in bucket_ids:
+                continue
+            base = row * w
+            if disks[base] == NO_ID and all(disk_id == NO_ID for disk_id in disks[base:base + w]):
+                unprobed.append((bucket_id, self.placement_idxs[row]))
+                continue
+            if not dirty and not down:
+                continue
+            key = []
+            for mask in (dirty, down):
+                bits = bits_of_mask.get(mask)
+                if bits is None:
+                    bits = bits_of_mask[mask] = tuple(get_enabled_bits(mask))
+                key.append(frozenset(None if disks[base + i] == NO_ID else disks[base + i] for i in bits))
+            patterns.setdefault(tuple(key), set()).add(bucket_id)
+        return patterns, unprobed
+
+    def _failure_patterns_numpy(self, bucket_ids):
+        w = self.width
+        all_buckets = numpy.frombuffer(self.bucket_ids, dtype=numpy.intc)
+        rows = numpy.flatnonzero(numpy.isin(all_buckets, numpy.fromiter(bucket_ids, dtype=numpy.intc)))
+        bucket_col = all_buckets[rows]
+        disks = numpy.frombuffer(self.disks, dtype=numpy.intc).reshape(-1, w)[rows]
+        dirty = numpy.frombuffer(self.dirty, dtype=numpy.ulonglong)[rows]
+        down = numpy.frombuffer(self.down, dtype=numpy.ulonglong)[rows]
+
+        no_disks = (disks == NO_ID).all(axis=1)
+        unprobed = list(zip(bucket_col[no_disks].tolist(),
+                            numpy.frombuffer(self.placement_idxs, dtype=numpy.intc)[rows[no_disks]].tolist()))
+
+        failed = ~no_disks & ((dirty | down) != 0)
+        if not failed.any():
+            return {}, unprobed
+        disks = disks[failed]
+        bits = numpy.left_shift(numpy.ulonglong(1), numpy.arange(w, dtype=numpy.ulonglong))
+        # Row i holds the dirty disk ids and then the down disk ids of a failed placement, each half sorted and padded
+        # with `unused`, so that equal failure patterns are equal rows
+        unused = numpy.iinfo(numpy.intc).max
+        halves = []
+        for masks in (dirty[failed], down[failed]):
+            half = numpy.where((masks[:, None] & bits) != 0, disks, unused)
+            half.sort(axis=1)
+            halves.append(half)
+        keys, inverse = numpy.unique(numpy.concatenate(halves, axis=1), axis=0, return_inverse=True)
+        pairs = numpy.unique(numpy.stack([inverse.reshape(-1), bucket_col[failed]], axis=1), axis=0)
+
+        def disk_set(ids):
+            return frozenset(None if disk_id == NO_ID else disk_id for disk_id in ids if disk_id != unused)
+
+        pattern_of_key = [(disk_set(key[:w]), disk_set(key[w:])) for key in keys.tolist()]
+        patterns = {}
+        for key_idx, bucket_id in pairs.tolist():
+            patterns.setdefault(pattern_of_key[key_idx], set()).add(bucket_id)
+        return patterns, unprobed
+
+def main(*, verbose, batch_size, retries, solver_timeout):
 
     def verbose_print(*args, **kw):
         if verbose:
@@ -114,49 +301,43 @@ def main(*, verbose, batch_size):
         if "COMPUTE" in node_dict["roles"]
     ]
 
-    placements = {}
+    placements = PlacementTable(D + P)
     buckets_of_node = {}
-    for nodes in chunks(compute_node_ids, batch_size):
-        print("\rWorking on node %s (last node is %s)..." % (nodes[0], compute_node_ids[-1]), end='')
-        calls = [(node_id, raid_placements(node_id)) for node_id in nodes]
-        for node_id, call in calls:
-            for plcDesc, info in call.result().items():
-                desc = json.loads(plcDesc)
-                bucket_id = parse_bucket_id(desc["bucketId"])
-                placement_idx = parse_placement_idx(desc["placementIdx"])
-                bucketDict = placements.setdefault(bucket_id, {})
-                buckets_of_node.setdefault(node_id, set()).add(bucket_id)
-                if placement_idx in bucketDict:
-                    print("WARNING: duplicate %s\n" % (desc,))
-                bucketDict[placement_idx] = dict(disks=[parse_disk_id(disk_id_str) for disk_id_str in info["disks"]["_array"]], dirty=info["dirtyDisks"], down=info["downDisks"])
-    print("Got placements from all nodes")
+    failed_nodes = []
+    for done, (node_id, result) in enumerate(collect_placements(compute_node_ids, batch_size, retries), 1):
+        print("\rGot placements from %s/%s nodes..." % (done, len(compute_node_ids)), end='')
+        if result is None:
+            failed_nodes.append(node_id)
+            continue
+        for plcDesc, info in result.items():
+            desc = json.loads(plcDesc)
+            bucket_id = parse_bucket_id(desc["bucketId"])
+            placement_idx = parse_placement_idx(desc["placementIdx"])
+            buckets_of_node.setdefault(node_id, set()).add(bucket_id)
+            placements.add(bucket_id, placement_idx, [parse_disk_id(disk_id_str) for disk_id_str in info["disks"]["_array"]], info["dirtyDisks"], info["downDisks"])
+    if failed_nodes:
+        print("Got placements from all nodes except", space_separated("NodeId<%s>" % node_id for node_id in failed_nodes))
+    else:
+        print("Got placements from all nodes")
+    for bucket_id, placement_idx in placements.remove_duplicates():
+        print("WARNING: duplicate BucketId<%s>:PlacementIdx<0x%x>\n" % (bucket_id, placement_idx))
     verbose_print("")
     verbose_print("Got bucket reports in nodes:")
     for node_id, bucket_ids in buckets_of_node.items():
         verbose_print(("NodeId<%s>:" % node_id).ljust(16), space_separated(bucket_ids))
 
+    reported_buckets = placements.bucket_set()
     needed_recoveries = []
     for init_state, buckets in buckets_by_state.items():
         verbose_print("-------------------------------")
         print("%s: %s buckets" % (init_state, len(buckets)))
-        buckets_of_failures = {}
-        for bucket_id in buckets:
-            if bucket_id not in placements:
-                print("ERROR: Could not get placements report for %s from any COMPUTE node" % (bucket_id,))
-                continue
-            for placement_idx, info in placements[bucket_id].items():
-                disks = info["disks"]
-                if all(disk_id is None for disk_id in disks):
-                    print("WARNING: BucketId<%s>:PlacementIdx<0x%x> could not probe its disks" % (bucket_id, placement_idx))
-                    continue
-
-                dirty_disks = frozenset(disks[i] for i in get_enabled_bits(info['dirty']))
-                down_disks  = frozenset(disks[i] for i in get_enabled_bits(info['down']))
-                buckets_of_failures.setdefault((dirty_disks, down_disks), set()).add(bucket_id)
+        for bucket_id in buckets - reported_buckets:
+            print("ERROR: Could not get placements report for %s from any COMPUTE node" % (bucket_id,))
+        buckets_of_failures, unprobed = placements.failure_patterns(buckets & reported_buckets)
+        for bucket_id, placement_idx in unprobed:
+            print("WARNING: BucketId<%s>:PlacementIdx<0x%x> could not probe its disks" % (bucket_id, placement_idx))
         verbose_print()
         for (dirty_disks, down_disks), bucket_ids in buckets_of_failures.items():
-            if not dirty_disks and not down_disks: continue
-
             failure_count = len(dirty_disks | down_disks)
 
             verbose_print("------------------------------------------")
@@ -175,9 +356,84 @@ def main(*, verbose, batch_size):
                 verbose_print("exists in %s buckets" % (len(bucket_ids),))
         verbose_print()
 
-    print_needed_recovery(needed_recoveries)
-
-def print_needed_recovery(needed_recoveries):
+    print_needed_recovery(needed_recoveries, solver_timeout)
+
+def greedy_revival(needed_recoveries):
+    """Drives to revive so every (need_revival, revivable) gets its need, picking the most needed drive each time."""
+    needs = [[need_revival, revivable] for need_revival, revivable in needed_recoveries if need_revival > 0]
+    revive = set()
+    while needs:
+        counts = collections.Counter(disk_id for need_revival, revivable in needs for disk_id in revivable - revive)
+        disk_id = max(sorted(counts), key=lambda disk_id: counts[disk_id])
+        revive.add(disk_id)
+        for need in needs:
+            if disk_id in need[1]:
+                need[0] -= 1
+        needs = [need for need in needs if need[0] > 0]
+    return revive
+
+def min_revival(needed_recoveries, timeout):
+    """Smallest set of drives whose revival gives every (need_revival, revivable) at least need_revival drives.
+
+    Branch and bound over the most constrained unmet requirement, starting from the greedy answer as the bound.
+    Returns (drives, optimal); when the search runs out of `timeout` seconds the best set found so far is returned
+    with optimal=False.
+    """
+    # Keep only the strongest requirement per revivable set
+    strongest = {}
+    for need_revival, revivable in needed_recoveries:
+        if need_revival > 0:
+            strongest[revivable] = max(need_revival, strongest.get(revivable, 0))
+    needs = [(need_revival, revivable) for revivable, need_revival in strongest.items()]
+
+    best = [greedy_revival(needs)]
+    deadline = time.monotonic() + timeout
+    nodes = [0]
+
+    class Timeout(Exception):
+        pass
+
+    def search(revive, excluded):
+        nodes[0] += 1
+        if nodes[0] % 1024 == 0 and time.monotonic() > deadline:
+            raise Timeout()
+        # Among the unmet requirements, branch on the one with the fewest choices left per missing drive
+        branch = None
+        max_missing = 0
+        for need_revival, revivable in needs:
+            missing = need_revival - len(revivable & revive)
+            if missing <= 0:
+                continue
+            candidates = revivable - revive - excluded
+            if len(candidates) < missing:
+                return
+            max_missing = max(max_missing, missing)
+            if branch is None or len(candidates) - missing < len(branch[1]) - branch[0]:
+                branch = (missing, candidates)
+        if branch is None:
+            if len(revive) < len(best[0]):
+                best[0] = set(revive)
+            return
+        if len(revive) + max_missing >= len(best[0]):
+            return
+        # Some of the candidates must be revived; try each as the first of them, excluding those tried before
+        missing, candidates = branch
+        excluded = set(excluded)
+        for disk_id in sorted(candidates):
+            if len(candidates - excluded) < missing:
+                break
+            revive.add(disk_id)
+            search(revive, excluded)
+            revive.remove(disk_id)
+            excluded.add(disk_id)
+
+    try:
+        search(set(), frozenset())
+    except Timeout:
+        return best[0], False
+    return best[0], True
+
+def print_needed_recovery(needed_recoveries, solver_timeout=10.0):
     print("------------------------------------")
     must_revive = set()
     for need_revival, revivable in needed_recoveries:
@@ -209,11 +465,104 @@ def print_needed_recovery(needed_recoveries):
             for disk_id in revivable:
                 print("    DiskId<%s>" % (disk_id,))
 
+    if not new_needed_recoveries:
+        return
+    revive, optimal = min_revival(new_needed_recoveries, solver_timeout)
+    print("------------------------------------")
+    if optimal:
+        print("Smallest recovery: reviving these %s drives recovers all buckets:" % (len(revive) + len(must_revive),))
+    else:
+        print("Recovery plan (search timed out after %ss, may not be the smallest): reviving these %s drives recovers all buckets:" % (
+            solver_timeout, len(revive) + len(must_revive)))
+    for disk_id in sorted(must_revive | revive):
+        print("  DiskId<%s>" % (disk_id,))
+
+def dict_failure_patterns(placements, bucket_ids):
+    """The failure grouping over a {bucket_id: {placement_idx: dict(disks, dirty, down)}} map that PlacementTable
+    replaced, kept as the baseline for benchmark()."""
+    buckets_of_failures = {}
+    for bucket_id in bucket_ids:
+        for placement_idx, info in placements[bucket_id].items():
+            disks = info["disks"]
+            if all(disk_id is None for disk_id in disks):
+                continue
+            dirty_disks = frozenset(disks[i] for i in get_enabled_bits(info['dirty']))
+            down_disks  = frozenset(disks[i] for i in get_enabled_bits(info['down']))
+            buckets_of_failures.setdefault((dirty_disks, down_disks), set()).add(bucket_id)
+    return {pattern: bucket_ids for pattern, bucket_ids in buckets_of_failures.items() if pattern[0] or pattern[1]}
+
+def benchmark(num_buckets, placements_per_bucket=64, D=16, P=4, num_disks=2048, num_down=6, seed=0):
+    """Compare memory and runtime of the dict and columnar representations on a synthetic cluster."""
+    rng = random.Random(seed)
+    down_disks = set(rng.sample(range(num_disks), num_down))
+    dirty_disks = set(rng.sample(sorted(down_disks), num_down // 2))
+    rows = []
+    for bucket_id in range(num_buckets):
+        for placement_idx in range(placements_per_bucket):
+            disks = rng.sample(range(num_disks), D + P)
+            dirty = sum(1 << i for i, disk_id in enumerate(disks) if disk_id in dirty_disks)
+            down = sum(1 << i for i, disk_id in enumerate(disks) if disk_id in down_disks)
+            rows.append((bucket_id, placement_idx, disks, dirty, down))
+    bucket_ids = set(range(num_buckets))
+    print("Synthetic cluster: %s buckets x %s placements, stripe %s + %s over %s disks, %s down (%s dirty)" % (
+        num_buckets, placements_per_bucket, D, P, num_disks, num_down, len(dirty_disks)))
+
+    def build_dict():
+        placements = {}
+        for bucket_id, placement_idx, disks, dirty, down in rows:
+            placements.setdefault(bucket_id, {})[placement_idx] = dict(disks=list(disks), dirty=dirty, down=down)
+        return placements
+
+    def build_table():
+        placements = PlacementTable(D + P)
+        for bucket_id, placement_idx, disks, dirty, down in rows:
+            placements.add(bucket_id, placement_idx, disks, dirty, down)
+        return placements
+
+    def measure(build, analyze):
+        tracemalloc.start()
+        start = time.perf_counter()
+        placements = build()
+        built = time.perf_counter()
+        stored = tracemalloc.get_traced_memory()[0]
+        patterns = analyze(placements)
+        done = time.perf_counter()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return patterns, stored, peak, built - start, done - built
+
+    global numpy
+    installed_numpy = numpy
+    variants = [("dict", build_dict, lambda placements: dict_failure_patterns(placements, bucket_ids))]
+    table_analyze = lambda placements: placements.failure_patterns(bucket_ids)[0]
+    variants.append(("table (python)", build_table, table_analyze))
+    if installed_numpy is not None:
+        variants.append(("table (numpy)", build_table, table_analyze))
+
+    print("%-16s %12s %12s %10s %10s" % ("", "stored MiB", "peak MiB", "build s", "group s"))
+    expected = None
+    try:
+        for name, build, analyze in variants:
+            numpy = installed_numpy if name == "table (numpy)" else None
+            patterns, stored, peak, build_secs, analyze_secs = measure(build, analyze)
+            print("%-16s %12.1f %12.1f %10.2f %10.2f" % (name, stored / 2**20, peak / 2**20, build_secs, analyze_secs))
+            if expected is None:
+                expected = patterns
+            elif patterns != expected:
+                print("ERROR: %s grouped %s failure patterns differently" % (name, len(patterns)))
+    finally:
+        numpy = installed_numpy
+    print("%s failure patterns" % (len(expected),))
+
 if __name__ == '__main__':
     options, args = parser.parse_args()
     if args:
         parser.error('Invalid arguments: %s' % args)
         sys.exit(2)
+    if options.benchmark:
+        benchmark(options.benchmark)
+        sys.exit(0)
     assert options.batch >= 1
     assert options.batch <= 2048
-    main(verbose=options.verbose, batch_size=options.batch)
+    assert options.retries >= 0
+    main(verbose=options.verbose, batch_size=options.batch, retries=options.retries, solver_timeout=options.solver_timeout)
@@ -6,10 +6,13 @@ import json
 import time
 import sys
 import os
+import threading
 # from pprint import pprint
 from datetime import datetime
 from os.path import exists
 
+from health_watcher import health_watcher, is_fully_protected
+
 SSH_OPTIONS = ["ssh", "-o", "LogLevel=ERROR", "-o", "UserKnownHostsFile=/dev/null", "-o", "StrictHostKeyChecking=no"]
 
 
@@ -35,79 +38,29 @@ def prompt_user_input():
     return get_input().strip().lower()
 
 
-def is_fully_protected(status, rebuild_status, print_rebuild_status=True):
-    if rebuild_status["unavailableMiB"] != 0:
-        if print_rebuild_status:
-            subprocess.call(["weka", "status", "rebuild"])
-            log("Cluster has too many failures (status %s) (seen rebuilding cluster, as expected)" % (
-            status["status"],))
-        return False
-
-    if any(prot["MiB"] != 0 for prot in rebuild_status["protectionState"][1:]) or rebuild_status["protectionState"][
-        0] == 0:
-        if print_rebuild_status:
-            subprocess.call(["weka", "status", "rebuild"])
-            scrubber_rate = json.loads(subprocess.check_output(
-                ["weka", "debug", "config", "show", "clusterInfo.scrubberBytesPerSecLimit", "-J"]))
-            log("Rebuilding at rate of %sMiB/sec (scrubber rate)" % (scrubber_rate / (1 << 20),));
-            log("Still has failures (status %s)" % (status["status"],))
-        return False
-
-    subprocess.call(["weka", "status", "rebuild"])
-    log("Cluster is fully protected (status %s)" % (status["status"],))
-    return True
-
-
 def wait_for_rebuild_to_start():
-    status_max_retries = 180
     attempts = 0
-    while True:
-        time.sleep(1)
+    for sample in health_watcher.samples():
         attempts += 1
+        status, rebuild_status = sample.status, sample.rebuild
 
-        try:
-            rebuild_status = json.loads(subprocess.check_output(["weka", "status", "rebuild", "-J"]))
-            status = json.loads(subprocess.check_output(["weka", "status", "-J"]))
-
-            should_print = attempts % 3 == 0  # Only print in some of the iterations
-            if not is_fully_protected(status, rebuild_status, print_rebuild_status=should_print):
-                log("Seen rebuilding cluster, as expected (status %s)" % (status["status"],))
-                return
-
-        except subprocess.CalledProcessError:
-            if attempts >= status_max_retries:
-                log("Exhausted retries when querying cluster's rebuild status")
-                sys.exit(1)
-
-            log("Error querying cluster's rebuild status, retrying")
-            continue
+        should_print = attempts % 3 == 0  # Only print in some of the iterations
+        if not is_fully_protected(status, rebuild_status, print_rebuild_status=should_print):
+            log("Seen rebuilding cluster, as expected (status %s)" % (status["status"],))
+            return
 
         log("Cluster is unhealthy (status %s)" % (status["status"],))
 
 
 def wait_for_healthy_cluster(print_healthy=True):
-    status_max_retries = 180
     attempts = 0
     wait_start = datetime.now()
-    while True:
+    for sample in health_watcher.samples():
         attempts += 1
-        if attempts > 1:
-            time.sleep(1)
-
-        try:
-            status = json.loads(subprocess.check_output(["weka", "status", "-J"]))
-            rebuild_status = json.loads(subprocess.check_output(["weka", "status", "rebuild", "-J"]))
-
-            should_print = attempts % 5 == 0  # Only print in some of the iterations
-            if not is_fully_protected(status, rebuild_status, print_rebuild_status=should_print):
-                continue
-
-        except subprocess.CalledProcessError:
-            if attempts >= status_max_retries:
-                log("Exhausted retries when querying cluster's rebuild status")
-                sys.exit(1)
+        status, rebuild_status = sample.status, sample.rebuild
 
-            log("Error querying cluster's rebuild status, retrying")
+        should_print = attempts % 5 == 0  # Only print in some of the iterations
+        if not is_fully_protected(status, rebuild_status, print_rebuild_status=should_print):
             continue
 
         def check_active_equals_total(json):
@@ -135,8 +88,261 @@ def wait_for_healthy_cluster(print_healthy=True):
         break
 
 
+def get_failure_domain(host):
+    # With automatic failure domains every server is its own failure domain
+    failure_domain = host.get("failure_domain")
+    if not failure_domain or failure_domain == "AUTO" or host.get("failure_domain_type") == "AUTO":
+        return "AUTO:%s" % (host["hostname"],)
+    return failure_domain
+
+
+def get_protection_level():
+    status = json.loads(subprocess.check_output(["weka", "status", "-J"]))
+    return status.get("stripe_protection_drives", 1)
+
+
+def plan_upgrade_waves(pending, max_parallel, max_failure_domains):
+    """
+    Split (host, source_version) pairs into waves of at most max_parallel hosts that span at most
+    max_failure_domains failure domains. Hosts of one failure domain are kept together as long as the wave has
+    room, so a wave takes down as few failure domains as possible.
+    """
+    domains = []
+    hosts_by_domain = {}
+    for host, source_version in pending:
+        failure_domain = get_failure_domain(host)
+        if failure_domain not in hosts_by_domain:
+            domains.append(failure_domain)
+            hosts_by_domain[failure_domain] = []
+        hosts_by_domain[failure_domain].append((host, source_version))
+
+    waves = []
+    wave = []
+    wave_domains = 0
+    for failure_domain in domains:
+        domain_hosts = hosts_by_domain[failure_domain]
+        for start in range(0, len(domain_hosts), max_parallel):
+            chunk = domain_hosts[start:start + max_parallel]
+            if wave and (wave_domains >= max_failure_domains or len(wave) + len(chunk) > max_parallel):
+                waves.append(wave)
+                wave = []
+                wave_domains = 0
+            wave += chunk
+            wave_domains += 1
+    if wave:
+        waves.append(wave)
+    return waves
+
+
+def get_source_version(host):
+    if host["status"] != "UP":
+        return host["sw_release_string"]
+
+    machine_info = json.loads(
+        subprocess.check_output(["weka", "debug", "jrpc", "-H", host["host_ip"], "-P", str(host["mgmt_port"]),
+                                 "client_query_backend"]))
+
+    if 'container_software_release' in machine_info:
+        # in newer versions container_software_release is the
+        # host's own version, and software_release became the
+        # min BE version of the entire cluster
+        return machine_info['container_software_release']
+    # in older versions, this is the only one that exists, and is the self version
+    return machine_info['software_release']
+
+
+def upgrade_host(host, source_version, target_version, container_name, timestamp, ssh_identity=None,
+                 skip_prepare_upgrade=False, skip_local_start=False, check_drives=False):
+    """
+    Upgrade a single host's container. Returns whether the container has drive nodes (so a rebuild is expected),
+    when check_drives is set.
+    """
+    ip = host["host_ip"]
+    hostname = host["hostname"]
+
+    is_root = os.geteuid() == 0
+
+    should_sudo = not is_root
+
+    ssh_identity_args = ["-i", ssh_identity] if ssh_identity is not None else []
+    sudo_args = ["sudo"] if should_sudo else []
+    ssh_opts = SSH_OPTIONS + ssh_identity_args + [ip] + sudo_args
+
+    def ssh_args(args):
+        return ssh_opts + list(args)
+
+    def ssh_call(*args):
+        log("Running '%s' on %s via ssh" % (' '.join(str(x) for x in args), ip))
+        subprocess.check_call(ssh_args(args))
+
+    def ssh_unchecked_call(*args):
+        log("Running '%s' on %s via ssh (allow failure)" % (' '.join(str(x) for x in args), ip))
+        subprocess.call(ssh_args(args))
+
+    def ssh_call_with_output(*args):
+        log("Running '%s' on %s (%s) via ssh, capturing output" % (
+            ' '.join(str(x) for x in args), hostname, ip))
+        return subprocess.check_output(ssh_args(args))
+
+    def container_has_drives():
+        return is_node_role_in_container("DRIVES")
+
+    def is_node_role_in_container(role):
+        max_retries = 10
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                resources = json.loads(
+                    ssh_call_with_output("weka", "local", "resources", "-C", container_name, "-J"))
+                for slot in resources['nodes']:
+                    if role in resources['nodes'][slot]['roles']:
+                        return True
+            except subprocess.CalledProcessError as ex:
+                if attempts > max_retries:
+                    log("Couldn't query resources of %s:%s after %s retrys with error: %s" %
+                        (hostname, container_name, max_retries, ex.__str__()))
+                    raise ex
+                else:
+                    time.sleep(1)
+            return False
+
+    def set_agent_version_if_all_container_are_in_target_version():
+        try:
+            containers = json.loads(ssh_call_with_output("weka", "local", "ps", "-J"))
+            all_weka_containers_are_in_target_version = True
+            for container in containers:
+                if container["type"] == "weka" and container["versionName"] != target_version:
+                    all_weka_containers_are_in_target_version = False
+
+            if all_weka_containers_are_in_target_version:
+                log("All weka containers are in the target version, setting agent version")
+                ssh_unchecked_call("weka", "version", "set", target_version, "--allow-running-containers")
+            else:
+                log("Not all weka containers are in the target version, not setting agent version")
+        except subprocess.CalledProcessError as ex:
+            log("Failed setting agent version %s for host %s, with error: %s" % (
+            target_version, hostname, ex.__str__(),))
+
+    # This yields incorrect versions in MBC, when each container runs different versions
+    # remote_old_version = subprocess.check_output(ssh_args(["weka", "version", "current"])).strip().decode("utf8")
+
+    assert source_version != target_version, "We tested that it is NOT the target version but 'weka version' says it is?!"
+    log("Starting upgrade of %s from %s to %s" % (hostname, source_version, target_version,))
+
+    ## We assume we delivered the version to every host already
+    log("weka version get %s" % (target_version,))
+    ssh_call("weka", "version", "get", target_version)
+    if skip_prepare_upgrade:
+        log("Skipping preparation of driver for upgrade on %s" % (hostname,))
+    else:
+        log("Preparing driver for upgrade on %s" % (hostname,))
+        if exists("/proc/wekafs/interface"):
+            ssh_call("echo", "prepare-upgrade", ">", "/proc/wekafs/interface")
+        ssh_call("sync")
+
+    log("Preparing version on %s using 'weka version prepare %s'" % (hostname, target_version,))
+    ssh_call("weka", "version", "prepare", target_version)
+
+    log("Stopping local containers on %s" % (hostname,))
+    try:
+        ssh_call("weka", "local", "stop", container_name, "--force")
+    except subprocess.CalledProcessError as e:
+        ssh_call("weka", "local", "stop", container_name)
+
+    # Allowed to fail:
+    log("Moving target version data dir on %s, if one exists:" % (hostname,))
+    ssh_unchecked_call("mv",
+                       "/opt/weka/data/%s_%s" % (container_name, target_version,),
+                       "/opt/weka/data/%s_%s.bk.%s" % (container_name, target_version, timestamp))
+
+    log("Moving old data dir to target data dir")
+    try:
+        ssh_call("mv",
+                 "/opt/weka/data/%s_%s" % (container_name, source_version,),
+                 "/opt/weka/data/%s_%s" % (container_name, target_version,))
+    except Exception:
+        log("Failed to move the data dir to target version, starting back up and bailing out...")
+        ssh_call("weka", "local", "start", container_name, )
+        raise
+
+    if container_name == 'default':
+        ssh_unchecked_call("weka", "version", "set", target_version, )
+    else:
+        ssh_unchecked_call("weka", "version", "set", target_version, "-C", container_name, )
+    if skip_local_start:
+        log("NOT starting containers on %s because --skip-local-start" % (hostname,))
+    else:
+        try:
+            log("Starting containers on %s" % (hostname,))
+            ssh_call("weka", "local", "start", container_name, )
+            log("Started containers on %s" % (hostname,))
+        except Exception:
+            log("Failed to weka version start, renaming back, starting back up and bailing out...")
+            ssh_call("mv",
+                     "/opt/weka/data/%s_%s" % (container_name, target_version,),
+                     "/opt/weka/data/%s_%s" % (container_name, source_version,))
+            if container_name == 'default':
+                ssh_unchecked_call(("weka", "version", "set", source_version,))
+            else:
+                ssh_unchecked_call("weka", "version", "set", source_version, "-C", container_name, )
+
+            if not skip_local_start:
+                ssh_call("weka", "local", "start", container_name, )
+            raise
+
+    set_agent_version_if_all_container_are_in_target_version()
+
+    if not check_drives:
+        return False
+    try:
+        return container_has_drives()
+    except subprocess.CalledProcessError:
+        log("We failed to check if %s:%s has drive nodes, we will wait for rebuild to start" % (
+            hostname, container_name))
+        return True
+
+
+def upgrade_wave(wave, target_version, container_name, timestamp, ssh_identity=None, skip_prepare_upgrade=False,
+                 skip_local_start=False, check_drives=False):
+    """
+    Upgrade all (host, source_version) pairs of a wave concurrently, one thread per host.
+    Returns whether any of the upgraded containers has drive nodes. Re-raises the first failure once every host
+    of the wave has finished.
+    """
+    if len(wave) == 1:
+        host, source_version = wave[0]
+        return upgrade_host(host, source_version, target_version, container_name, timestamp, ssh_identity,
+                            skip_prepare_upgrade, skip_local_start, check_drives)
+
+    results = [None] * len(wave)
+    errors = []
+
+    def run(index, host, source_version):
+        try:
+            results[index] = upgrade_host(host, source_version, target_version, container_name, timestamp,
+                                          ssh_identity, skip_prepare_upgrade, skip_local_start, check_drives)
+        except BaseException as ex:
+            log("Upgrade of %s failed: %s" % (host["hostname"], ex))
+            errors.append(sys.exc_info())
+
+    threads = []
+    for index, (host, source_version) in enumerate(wave):
+        thread = threading.Thread(target=run, args=(index, host, source_version))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        exc_type, exc_value, exc_tb = errors[0]
+        raise exc_value
+    return any(results)
+
+
 def upgrade_flow(target_version, ssh_identity=None, container_name=None, skip_health_checks=False,
-                 skip_wait_for_rebuild_to_start=False, skip_prepare_upgrade=False, skip_local_start=False):
+                 skip_wait_for_rebuild_to_start=False, skip_prepare_upgrade=False, skip_local_start=False,
+                 max_parallel=1):
     # TODO: Ask the user if we distributed the version
 
     timestamp = get_timestamp()
@@ -146,200 +352,60 @@ def upgrade_flow(target_version, ssh_identity=None, container_name=None, skip_he
     if container_name is None:
         container_name = "default"
 
-    upgrade_all_already_checked = False
     skipped_hosts = 0
     upgraded_hosts = 0
+    pending = []
     for host in hosts:
-        ip = host["host_ip"]
-        port = host["mgmt_port"]
-        is_up = host["status"] == "UP"
         hostname = host["hostname"]
-        log("Querying %s at %s..." % (hostname, ip))
-        source_version = ""
-        if is_up:
-            machine_info = json.loads(
-                subprocess.check_output(["weka", "debug", "jrpc", "-H", ip, "-P", str(port), "client_query_backend"]))
-
-            if 'container_software_release' in machine_info:
-                # in newer versions container_software_release is the
-                # host's own version, and software_release became the
-                # min BE version of the entire cluster
-                source_version = machine_info['container_software_release']
-            else:
-                # in older versions, this is the only one that exists, and is the self version
-                source_version = machine_info['software_release']
-        else:
-            source_version = host["sw_release_string"]
+        log("Querying %s at %s..." % (hostname, host["host_ip"]))
+        source_version = get_source_version(host)
         log("Queried %s: currently running %s" % (hostname, source_version))
 
         if source_version == target_version:
             log("No need to upgrade %s, it is already running %s" % (hostname, source_version))
             skipped_hosts += 1
             continue
+        pending.append((host, source_version))
+
+    max_failure_domains = 1
+    if max_parallel > 1:
+        # Keep one failure domain of protection in reserve while a wave is down
+        protection_level = get_protection_level()
+        max_failure_domains = max(1, protection_level - 1)
+        log("Upgrading up to %s hosts at a time across at most %s failure domains (protection level %s)" % (
+            max_parallel, max_failure_domains, protection_level))
+
+    upgrade_all_already_checked = False
+    for wave in plan_upgrade_waves(pending, max_parallel, max_failure_domains):
+        hostnames = ", ".join(host["hostname"] for host, _ in wave)
         if not skip_health_checks:
             wait_for_healthy_cluster(print_healthy=False)
 
         if not upgrade_all_already_checked:
-            log("Upgrade %s to %s? [y]es / [s]kip / all> " % (hostname, target_version,))
+            log("Upgrade %s to %s? [y]es / [s]kip / all> " % (hostnames, target_version,))
             i = prompt_user_input()
             if i in ("s", "skip"):
-                log("Skipping %s" % (hostname,))
-                skipped_hosts += 1
+                log("Skipping %s" % (hostnames,))
+                skipped_hosts += len(wave)
                 continue
 
             if i in ("all",):
-                log("Will upgrade %s and then continue to upgrade ALL of the cluster" % (hostname,))
+                log("Will upgrade %s and then continue to upgrade ALL of the cluster" % (hostnames,))
                 upgrade_all_already_checked = True
             elif i not in ("y", "yes"):
                 log("Unacceptable input '%s', quitting" % (i,))
                 sys.exit(1)
 
-        is_root = os.geteuid() == 0
-
-        should_sudo = not is_root
-
-        ssh_identity_args = ["-i", ssh_identity] if ssh_identity is not None else []
-        sudo_args = ["sudo"] if should_sudo else []
-        ssh_opts = SSH_OPTIONS + ssh_identity_args + [ip] + sudo_args
-
-        def ssh_args(args):
-            return ssh_opts + list(args)
-
-        def ssh_call(*args):
-            log("Running '%s' on %s via ssh" % (' '.join(str(x) for x in args), ip))
-            subprocess.check_call(ssh_args(args))
-
-        def ssh_unchecked_call(*args):
-            log("Running '%s' on %s via ssh (allow failure)" % (' '.join(str(x) for x in args), ip))
-            subprocess.call(ssh_args(args))
-
-        def ssh_call_with_output(*args):
-            log("Running '%s' on %s (%s) via ssh, capturing output" % (
-                ' '.join(str(x) for x in args), hostname, ip))
-            return subprocess.check_output(ssh_args(args))
-
-        def container_has_drives():
-            return is_node_role_in_container("DRIVES")
-
-        def is_node_role_in_container(role):
-            max_retries = 10
-            attempts = 0
-            while True:
-                attempts += 1
-                try:
-                    resources = json.loads(
-                        ssh_call_with_output("weka", "local", "resources", "-C", container_name, "-J"))
-                    for slot in resources['nodes']:
-                        if role in resources['nodes'][slot]['roles']:
-                            return True
-                except subprocess.CalledProcessError as ex:
-                    if attempts > max_retries:
-                        log("Couldn't query resources of %s:%s after %s retrys with error: %s" %
-                            (hostname, container_name, max_retries, ex.__str__()))
-                        raise ex
-                    else:
-                        time.sleep(1)
-                return False
-
-        def set_agent_version_if_all_container_are_in_target_version():
-            try:
-                containers = json.loads(ssh_call_with_output("weka", "local", "ps", "-J"))
-                all_weka_containers_are_in_target_version = True
-                for container in containers:
-                    if container["type"] == "weka" and container["versionName"] != target_version:
-                        all_weka_containers_are_in_target_version = False
-
-                if all_weka_containers_are_in_target_version:
-                    log("All weka containers are in the target version, setting agent version")
-                    ssh_unchecked_call("weka", "version", "set", target_version, "--allow-running-containers")
-                else:
-                    log("Not all weka containers are in the target version, not setting agent version")
-            except subprocess.CalledProcessError as ex:
-                log("Failed setting agent version %s for host %s, with error: %s" % (
-                target_version, hostname, ex.__str__(),))
-
         wait_start = datetime.now()
 
-        # This yields incorrect versions in MBC, when each container runs different versions
-        # remote_old_version = subprocess.check_output(ssh_args(["weka", "version", "current"])).strip().decode("utf8")
-
-        assert source_version != target_version, "We tested that it is NOT the target version but 'weka version' says it is?!"
-        log("Starting upgrade of %s from %s to %s" % (hostname, source_version, target_version,))
+        check_drives = not skip_health_checks and not skip_wait_for_rebuild_to_start
+        should_expect_rebuild = upgrade_wave(wave, target_version, container_name, timestamp, ssh_identity,
+                                             skip_prepare_upgrade, skip_local_start, check_drives)
 
-        ## We assume we delivered the version to every host already
-        log("weka version get %s" % (target_version,))
-        ssh_call("weka", "version", "get", target_version)
-        if skip_prepare_upgrade:
-            log("Skipping preparation of driver for upgrade on %s" % (hostname,))
-        else:
-            log("Preparing driver for upgrade on %s" % (hostname,))
-            if exists("/proc/wekafs/interface"):
-                ssh_call("echo", "prepare-upgrade", ">", "/proc/wekafs/interface")
-            ssh_call("sync")
-
-        log("Preparing version on %s using 'weka version prepare %s'" % (hostname, target_version,))
-        ssh_call("weka", "version", "prepare", target_version)
-
-        log("Stopping local containers on %s" % (hostname,))
-        try:
-            ssh_call("weka", "local", "stop", container_name, "--force")
-        except subprocess.CalledProcessError as e:
-            ssh_call("weka", "local", "stop", container_name)
-
-        # Allowed to fail:
-        log("Moving target version data dir on %s, if one exists:" % (hostname,))
-        ssh_unchecked_call("mv",
-                           "/opt/weka/data/%s_%s" % (container_name, target_version,),
-                           "/opt/weka/data/%s_%s.bk.%s" % (container_name, target_version, timestamp))
-
-        log("Moving old data dir to target data dir")
-        try:
-            ssh_call("mv",
-                     "/opt/weka/data/%s_%s" % (container_name, source_version,),
-                     "/opt/weka/data/%s_%s" % (container_name, target_version,))
-        except Exception:
-            log("Failed to move the data dir to target version, starting back up and bailing out...")
-            ssh_call("weka", "local", "start", container_name, )
-            raise
-
-        if container_name == 'default':
-            ssh_unchecked_call("weka", "version", "set", target_version, )
-        else:
-            ssh_unchecked_call("weka", "version", "set", target_version, "-C", container_name, )
-        if skip_local_start:
-            log("NOT starting containers on %s because --skip-local-start" % (hostname,))
-        else:
-            try:
-                log("Starting containers on %s" % (hostname,))
-                ssh_call("weka", "local", "start", container_name, )
-                log("Started containers on %s" % (hostname,))
-            except Exception:
-                log("Failed to weka version start, renaming back, starting back up and bailing out...")
-                ssh_call("mv",
-                         "/opt/weka/data/%s_%s" % (container_name, target_version,),
-                         "/opt/weka/data/%s_%s" % (container_name, source_version,))
-                if container_name == 'default':
-                    ssh_unchecked_call(("weka", "version", "set", source_version,))
-                else:
-                    ssh_unchecked_call("weka", "version", "set", source_version, "-C", container_name, )
-
-                if not skip_local_start:
-                    ssh_call("weka", "local", "start", container_name, )
-                raise
-
-        set_agent_version_if_all_container_are_in_target_version()
-
-        upgraded_hosts += 1
+        upgraded_hosts += len(wave)
         if not skip_health_checks:
             # We first want to see the cluster as unhealthy before we wait for it to become healthy
             if not skip_wait_for_rebuild_to_start:
-                should_expect_rebuild = True
-                try:
-                    should_expect_rebuild = container_has_drives()
-                except subprocess.CalledProcessError:
-                    log("We failed to check if %s:%s has drive nodes, we will wait for rebuild to start" % (
-                        hostname, container_name))
-
                 if should_expect_rebuild:
                     wait_for_rebuild_to_start()
             else:
@@ -349,8 +415,9 @@ def upgrade_flow(target_version, ssh_identity=None, container_name=None, skip_he
 
         wait_end = datetime.now()
         wait_delta = wait_end - wait_start
-        log(" === Finished upgrade of %s, %s container from %s to %s (took %s seconds) ===" % (
-            hostname, container_name, source_version, target_version, wait_delta.total_seconds(),))
+        for host, source_version in wave:
+            log(" === Finished upgrade of %s, %s container from %s to %s (took %s seconds) ===" % (
+                host["hostname"], container_name, source_version, target_version, wait_delta.total_seconds(),))
 
     return upgraded_hosts, skipped_hosts
 
@@ -372,17 +439,27 @@ def main():
                         help='Do not ask the driver to prepare for the upgrade and wait for in-flight ops')
     parser.add_argument('--skip-local-start', dest='skip_local_start', action='store_true',
                         help='Do not "weka local start" in the new version')
+    parser.add_argument('-p', '--parallel', dest='max_parallel', type=int, default=1,
+                        help='Upgrade up to this many hosts at a time, grouped by failure domain. A wave never '
+                             'spans more failure domains than the stripe protection level minus one')
+    parser.add_argument('--health-series', dest='health_series', type=str,
+                        help='Append every cluster health sample, with rebuild throughput and ETA, to this file '
+                             '(CSV if it ends with .csv, JSON lines otherwise)')
 
     args = parser.parse_args()
+    health_watcher.series_path = args.health_series
     upgrade(args.target_version, args.ssh_identity, args.container_name, args.skip_health_checks,
-            args.skip_wait_for_rebuild_to_start, args.skip_prepare_upgrade, args.skip_local_start)
+            args.skip_wait_for_rebuild_to_start, args.skip_prepare_upgrade, args.skip_local_start,
+            max(1, args.max_parallel))
 
 
 def upgrade(target_version, ssh_identity=None, container_name=None, skip_health_checks=False,
-            skip_wait_for_rebuild_to_start=False, skip_prepare_upgrade=False, skip_local_start=False):
+            skip_wait_for_rebuild_to_start=False, skip_prepare_upgrade=False, skip_local_start=False,
+            max_parallel=1):
     wait_start = datetime.now()
     upgraded_hosts, skipped_hosts = upgrade_flow(target_version, ssh_identity, container_name, skip_health_checks,
-                                                 skip_wait_for_rebuild_to_start, skip_prepare_upgrade, skip_local_start)
+                                                 skip_wait_for_rebuild_to_start, skip_prepare_upgrade, skip_local_start,
+                                                 max_parallel)
 
     wait_end = datetime.now()
     wait_delta = wait_end - wait_start
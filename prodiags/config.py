@@ -4,3 +4,9 @@ SSH_AUTH_TIMEOUT = 30
 SSH_CONNECT_TIMEOUT = 30
 SSH_EXEC_TIMEOUT = 30
 TAR_URL = "http://xxx/WekaIO_ProDiags/latest.tar"
+TESTS_PER_SERVER = 4
+TESTBANK_DIR = '/var/lib/wekaio_prodiags'
+MAX_CONCURRENT_TESTS = 64
+RUNTIMES_FILE = '/var/log/WekaIO_ProDiags.runtimes.json'
+RESULTS_FILE = '/var/log/WekaIO_ProDiags.results.jsonl'
+RESULTS_INDEX_FILE = '/var/log/WekaIO_ProDiags.results.index.json'
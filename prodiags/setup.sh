@@ -10,9 +10,9 @@ if [ $? -eq 1 ]; then
 	exit 1
 fi
 
-pip3 install scp requests pathlib paramiko 1> /dev/null 2> /dev/null
+pip3 install requests pathlib paramiko 1> /dev/null 2> /dev/null
 if [ $? -eq 1 ]; then
-	pip3 install scp requests pathlib paramiko
+	pip3 install requests pathlib paramiko
 	echo "Failed to install some of the components"
 	exit 1
 else
@@ -36,7 +36,7 @@ if [ $? -eq 1 ]; then
                         apt-get update 1> /dev/null 2> /dev/null
                         apt-get --yes install ipmitool 1> /dev/null > /dev/null
                         if [ $? -eq 1 ]; then
-                                dpkg -i /tmp/lib/ipmitool_1.8.18-8_amd64.deb 1> /dev/null 2> /dev/null
+                                dpkg -i /var/lib/wekaio_prodiags/lib/ipmitool_1.8.18-8_amd64.deb 1> /dev/null 2> /dev/null
                                 if [ $? -eq 1 ]; then
                                         echo "Could not install ipmitool properly"
                                         res="1"
@@ -68,7 +68,7 @@ if [ $? -eq 1 ]; then
                 apt-get update 1> /dev/null 2> /dev/null
                 apt-get --yes install ipmiutil 1> /dev/null 2> /dev/null
                 if [ $? -eq 1 ]; then
-                        dpkg -i /tmp/lib/ipmiutil_3.1.5-1_amd64.deb 1> /dev/null 2> /dev/null
+                        dpkg -i /var/lib/wekaio_prodiags/lib/ipmiutil_3.1.5-1_amd64.deb 1> /dev/null 2> /dev/null
                         if [ $? -eq 1 ]; then
                                 echo "Could not install ipmiutil properly"
                                 res="1"
@@ -77,7 +77,7 @@ if [ $? -eq 1 ]; then
         else
                 yum install ipmiutil -y 1> /dev/null 2> /dev/null
                 if [ $? -eq 1 ]; then
-                        rpm --quiet -i /tmp/lib/ipmiutil-3.1.6-1.1.x86_64.rpm 1> /dev/null 2> /dev/null
+                        rpm --quiet -i /var/lib/wekaio_prodiags/lib/ipmiutil-3.1.6-1.1.x86_64.rpm 1> /dev/null 2> /dev/null
                         if [ $? -eq 1 ]; then
                                 echo "Could not install ipmiutil properly"
                                 res="1"
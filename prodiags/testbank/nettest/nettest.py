@@ -1,80 +1,161 @@
-#!/bin/bash
-# Test to check on errors on all backend NICs using ethtool -S <device_name> which are up
-#
+#!/usr/bin/env python3
+# Test to check on errors on all backend NICs which are up
+# The ethtool statistics of every up interface are read twice through the SIOCETHTOOL ioctl (the counters
+# "ethtool -S" shows), falling back to /sys/class/net/<dev>/statistics when the driver has none.
+# The test fails on error counters that grow between the two samples, errors left over from before the test
+# (e.g. from boot) are only reported.
+import array
+import fcntl
+import os
+import socket
+import struct
+import subprocess
+import sys
+import time
+
 # Global settings
-res="0"
-
-function barline () {
-## barline
-echo "================================================================="
-}
-
-function testname () {
-## testname
-
-echo "Test name: Looking for errors on network ports"
-which hostname 1> /dev/null 2> /dev/null
-if [ $? -eq 1 ]; then
-        echo "Hostname command not found"
-else
-        echo "Hostname: `hostname`"
-        echo "IP address: `hostname -I`"
-fi
-}
-
-function testrun () {
-# Test run
-barline
-testname
-
-# Looking for ethtool to to scan for port errors
-which ethtool 1> /dev/null 2> /dev/null 
-if [ $? -eq 1 ]; then
-	echo "Ethtool not found"
-	exit 1
-fi
-
-for f in /sys/class/net/*; do
-	dev=$(basename $f)
-	driver=$(readlink $f/device/driver/module)
-	if [ $driver ]; then
-		driver=$(basename $driver)
-	fi
-	addr=$(cat $f/address)
-	operstate=$(cat $f/operstate)
-	if [ "$operstate" == "up" ]; then
-		echo "Looking at device name: $dev for errors"
-		ethtool -S $dev|grep -i "_err" | grep ": [1-9]"
-		if [ $? -ne 1 ]; then
-			echo "Some errors found on $dev device below:"
-			ethtool -S $dev | grep -i "_err" | grep ": [^0]"
-			res="1"
-		else
-			echo "No errors found for $dev device name"
-		fi
-	fi
-	#printf "%10s [%s]: %10s (%s)\n" "$dev" "$addr" "$driver" "$operstate"
-done
-}
+SAMPLE_INTERVAL = 5  # seconds between the two samples
+SIOCETHTOOL = 0x8946
+ETHTOOL_GDRVINFO = 0x03
+ETHTOOL_GSTRINGS = 0x1b
+ETHTOOL_GSTATS = 0x1d
+ETH_SS_STATS = 1
+ETH_GSTRING_LEN = 32
+DRVINFO_SIZE = 196
+DRVINFO_N_STATS_OFFSET = 180
 
-# MAIN
-# If there is parameter after the script run command, output everything out
-if [ "$1" ]; then
-        testrun
-        if [ "$res" -eq "1" ]; then
-                exit 1
-        fi
-else
-        rm /tmp/$(basename $0).log 1> /dev/null 2> /dev/null
-        testrun > /tmp/$(basename $0).log
-        if [ "$res" -ne "0" ]; then
-                cat /tmp/$(basename $0).log
-                rm /tmp/$(basename $0).log 1> /dev/null 2> /dev/null
-                exit 1
-        else
-                rm /tmp/$(basename $0).log 1> /dev/null 2> /dev/null
-                exit 0
-        fi
-fi
+res = 0
+output = []
+
+
+def out(line=""):
+    output.append(line)
+
+
+def barline():
+    out("=================================================================")
+
+
+def testname():
+    out("Test name: Looking for errors on network ports")
+    out("Hostname: %s" % socket.gethostname())
+    try:
+        out("IP address: %s" % subprocess.check_output(["hostname", "-I"]).decode("utf-8").strip())
+    except (OSError, subprocess.CalledProcessError):
+        pass
+
+
+def ethtool_ioctl(sock, dev, buf):
+    address, _ = buf.buffer_info()
+    ifreq = struct.pack("16sP", dev.encode("utf-8"), address)
+    fcntl.ioctl(sock.fileno(), SIOCETHTOOL, ifreq)
+
+
+def ethtool_stat_names(sock, dev):
+    drvinfo = array.array("B", struct.pack("I", ETHTOOL_GDRVINFO) + b"\0" * (DRVINFO_SIZE - 4))
+    ethtool_ioctl(sock, dev, drvinfo)
+    n_stats = struct.unpack_from("I", drvinfo, DRVINFO_N_STATS_OFFSET)[0]
+    if n_stats == 0:
+        return []
+    gstrings = array.array("B", struct.pack("III", ETHTOOL_GSTRINGS, ETH_SS_STATS, n_stats) + b"\0" * (n_stats * ETH_GSTRING_LEN))
+    ethtool_ioctl(sock, dev, gstrings)
+    data = gstrings.tobytes()[12:]
+    return [data[i * ETH_GSTRING_LEN:(i + 1) * ETH_GSTRING_LEN].split(b"\0", 1)[0].decode("utf-8", errors="replace")
+            for i in range(n_stats)]
+
+
+def ethtool_stat_values(sock, dev, n_stats):
+    gstats = array.array("B", struct.pack("II", ETHTOOL_GSTATS, n_stats) + b"\0" * (n_stats * 8))
+    ethtool_ioctl(sock, dev, gstats)
+    return struct.unpack_from("%dQ" % n_stats, gstats, 8)
 
 
+def sysfs_stats(dev):
+    stats = {}
+    path = os.path.join("/sys/class/net", dev, "statistics")
+    for name in os.listdir(path):
+        try:
+            with open(os.path.join(path, name)) as f:
+                stats[name] = int(f.read().strip())
+        except (IOError, ValueError):
+            pass
+    return stats
+
+
+def up_devices():
+    devices = []
+    for dev in sorted(os.listdir("/sys/class/net")):
+        try:
+            with open(os.path.join("/sys/class/net", dev, "operstate")) as f:
+                if f.read().strip() == "up":
+                    devices.append(dev)
+        except IOError:
+            pass
+    return devices
+
+
+class Sampler:
+    """Reads the error counters of one device, by ioctl when the driver reports ethtool statistics."""
+
+    def __init__(self, sock, dev):
+        self.sock = sock
+        self.dev = dev
+        try:
+            self.names = ethtool_stat_names(sock, dev)
+        except OSError:
+            self.names = []
+        self.source = "ethtool" if self.names else "sysfs"
+
+    def sample(self):
+        if self.names:
+            try:
+                values = ethtool_stat_values(self.sock, self.dev, len(self.names))
+                return dict((name, value) for name, value in zip(self.names, values) if "_err" in name.lower())
+            except OSError:
+                self.names = []
+                self.source = "sysfs"
+        return dict((name, value) for name, value in sysfs_stats(self.dev).items() if "_err" in name.lower())
+
+
+def testrun():
+    global res
+    barline()
+    testname()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    samplers = [Sampler(sock, dev) for dev in up_devices()]
+    first = dict((sampler.dev, sampler.sample()) for sampler in samplers)
+    started = time.time()
+    time.sleep(SAMPLE_INTERVAL)
+    second = dict((sampler.dev, sampler.sample()) for sampler in samplers)
+    elapsed = time.time() - started
+    sock.close()
+
+    for sampler in samplers:
+        dev = sampler.dev
+        out("Looking at device name: %s for errors (%s counters, %.1f sec apart)" % (dev, sampler.source, elapsed))
+        growing, old = [], []
+        for name, value in sorted(second[dev].items()):
+            delta = value - first[dev].get(name, value)
+            if delta > 0:
+                growing.append("%s: %s (+%.1f/sec)" % (name, value, delta / elapsed))
+            elif value > 0:
+                old.append("%s: %s" % (name, value))
+        if growing:
+            out("Errors growing on %s device below:" % dev)
+            out("\n".join("  " + line for line in growing))
+            res = 1
+        else:
+            out("No growing errors found for %s device name" % dev)
+        if old:
+            out("Errors counted before the test on %s device, not growing:" % dev)
+            out("\n".join("  " + line for line in old))
+
+
+# MAIN
+# If there is parameter after the script run command, output everything out
+if __name__ == "__main__":
+    testrun()
+    if len(sys.argv) > 1 or res != 0:
+        print("\n".join(output))
+    sys.exit(1 if res != 0 else 0)
@@ -1,152 +1,170 @@
-#!/bin/bash
+#!/usr/bin/env python3
 # Test to verify Weka SSD drives operational parameters
-# TODO:
-# Walk through available backends with weka cluster drive
-# 1. Get HostId: [0-9] 
-# 2. Walk through each HostId and find unique (first occurance) of each SSD / NVME / Other drive 
-# 3. Find mappings of drive to host (unique) 
-# 4. With weka manhole get hardware notifications per drive, if failure per parameter, test failed for drive 
-# 5. Test should run only once on first backend to fetch drives assigned (use #run_once) in test
-# 6. Tested parameters: ACTIVE, Temperature note above 55.0C, endurance not below 95%
-# This is a very long test, each drive tested about 2 seconds
+# 1. Get all ACTIVE drives and the node each one is served by from weka cluster drive -J
+# 2. Query the NVMe SMART log page of every drive with weka manhole, concurrently: up to MAX_PARALLEL queries
+#    in flight, and up to MAX_PARALLEL_PER_NODE on the same node so no single node is flooded
+# 3. Parse the JSON replies and print a per-drive table, if failure per parameter, test failed for drive
+# 4. Test should run only once on first backend to fetch drives assigned (use #run_once) in test
+# 5. Tested parameters: ACTIVE, Temperature note above 55.0C, endurance not below 95%
+# Each drive takes about 2 seconds to query, running the queries concurrently keeps large clusters to seconds
 # Set to run only once on system
 #run_once
+import json
+import re
+import socket
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # Global testing status and consts
-max_temperature="550" # in 550 = 55.0C
-spares="95" # lowest spare for SSD endurance
-spares_threshold="10" # statically set by system to 5
-
-res="0"
-
-function barline () {
-## barline
-echo "================================================================="
-}
-
-function testname () {
-## testname
-
-# Clean process
-rm -rf /tmp/ssd_output_list.sh
-rm -rf /tmp/ssd_compare.txt
-
-echo "Test name: SSD / NVMe test"
-
-which hostname 1> /dev/null 2> /dev/null
-if [ $? -eq 1 ]; then
-        echo "Hostname command not found"
-else
-        echo "Hostname: `hostname`"
-        echo "IP address: `hostname -I`"
-fi
-}
-
-function testrun () {
-# Test run
-barline
-testname
-
-weka cluster drive 1> /dev/null 2> /dev/null
-if [ $? -eq 1 ]; then
-	echo "Could not find weka executable"
-	exit 1
-fi
-
-weka_version=`weka version | grep "* " | awk -F. {'print $1"."$2'} | sed 's/\*//g'`
-if [ "$weka_version" == " 3.9" ]; then
-    weka cluster drive | grep -i ' active' | awk {'print "echo ============================== ;\n echo NodeId: "$4" and DiskId: "$1" && weka debug manhole -J -n "$4" ssd_get_nvme_smart_log_page diskId="$1" | grep \"percentage_used\\|readSuccess\\|available_spare\\|composite_temperature\\|critical_warning\\|errMsg\" | sed '\''s/,//g'\'' | sed '\''s/\"//g'\'' | sed '\''s/^ *//g'\''"'} > /tmp/ssd_output_list.sh 2> /dev/null
-elif [ "$weka_version" == " 3.10" ]; then
-    weka cluster drive | grep -i ' active' | awk {'print "echo ============================== ;\n echo NodeId: "$4" and DiskId: "$1" && weka debug manhole -J -n "$4" ssd_get_nvme_smart_log_page diskId="$1" | grep \"percentage_used\\|readSuccess\\|available_spare\\|composite_temperature\\|critical_warning\\|errMsg\" | sed '\''s/,//g'\'' | sed '\''s/\"//g'\'' | sed '\''s/^ *//g'\''"'} > /tmp/ssd_output_list.sh 2> /dev/null
-elif [ "$weka_version" == " 3.11" ]; then
-    weka cluster drive | grep -i ' active' | awk {'print "echo ============================== ;\n echo NodeId: "$4" and DiskId: "$1" && weka debug manhole -J -n "$4" ssd_get_nvme_smart_log_page diskId="$1" | grep \"percentage_used\\|readSuccess\\|available_spare\\|composite_temperature\\|critical_warning\\|errMsg\" | sed '\''s/,//g'\'' | sed '\''s/\"//g'\'' | sed '\''s/^ *//g'\''"'} > /tmp/ssd_output_list.sh 2> /dev/null
-elif [ "$weka_version" == " 3.12" ]; then
-    weka cluster drive | grep -i ' active' | awk {'print "echo ============================== ;\n echo NodeId: "$4" and DiskId: "$1" && weka debug manhole -J -n "$4" ssd_get_nvme_smart_log_page diskId="$1" | grep \"percentage_used\\|readSuccess\\|available_spare\\|composite_temperature\\|critical_warning\\|errMsg\" | sed '\''s/,//g'\'' | sed '\''s/\"//g'\'' | sed '\''s/^ *//g'\''"'} > /tmp/ssd_output_list.sh 2> /dev/null
-elif [ "$weka_version" == " 3.13" ]; then
-    weka cluster drive | grep -i ' active' | awk {'print "echo ============================== ;\n echo NodeId: "$4" and DiskId: "$1" && weka debug manhole -J -n "$4" ssd_get_nvme_smart_log_page diskId="$1" | grep \"percentage_used\\|readSuccess\\|available_spare\\|composite_temperature\\|critical_warning\\|errMsg\" | sed '\''s/,//g'\'' | sed '\''s/\"//g'\'' | sed '\''s/^ *//g'\''"'} > /tmp/ssd_output_list.sh 2> /dev/null
-elif [ "$weka_version" == " 3.14" ]; then
-    weka cluster drive | grep -i ' active' | awk {'print "echo ============================== ;\n echo NodeId: "$4" and DiskId: "$1" && weka debug manhole -J -n "$4" ssd_get_nvme_smart_log_page diskId="$1" | grep \"percentage_used\\|readSuccess\\|available_spare\\|composite_temperature\\|critical_warning\\|errMsg\" | sed '\''s/,//g'\'' | sed '\''s/\"//g'\'' | sed '\''s/^ *//g'\''"'} > /tmp/ssd_output_list.sh 2> /dev/null
-else # For version 3.8.1 or other than 3.9, 3.10, 3.11, 3.12, 3.13 and 3.14
-    weka cluster drive | grep -i ' active' | awk {'print "echo ============================== ;\n echo NodeId: "$8" and DiskId: "$2" && weka debug manhole -J -n "$8" ssd_get_nvme_smart_log_page diskId="$2" | grep \"percentage_used\\|readSuccess\\|available_spare\\|composite_temperature\\|critical_warning\\|errMsg\" | sed '\''s/,//g'\'' | sed '\''s/\"//g'\'' | sed '\''s/^ *//g'\''"'} > /tmp/ssd_output_list.sh 2> /dev/null
-fi
-
-num_of_disks=`cat /tmp/ssd_output_list.sh | grep -v "=====" | wc -l`
-echo "Number of media found: $num_of_disks disks"
-sh /tmp/ssd_output_list.sh | tee /tmp/ssd_compare.txt
-
-# Going through the ssd_compare_list, if error found output error with disk id and node id
-
-iterations=`cat /tmp/ssd_compare.txt | grep -i diskid | wc -l`
-for i in `seq $iterations`; do
-	diskid=`grep -i diskid /tmp/ssd_compare.txt | head -$i | tail -1`
-	errMsg=`grep -i errmsg /tmp/ssd_compare.txt | head -$i | tail -1`
-	errMsg_res=`echo $errMsg | awk {'print $2'}`
-	if [ "$errMsg_res" != "null" ]; then
-		echo "Error message displaying : $errMsg_res for $diskid"
-		res="1"
-	fi
-	readSuccess=`grep -i readsuccess /tmp/ssd_compare.txt | head -$i | tail -1`
-	readSuccess_res=`echo $readSuccess | awk {'print $2'}`
-	if [ "$readSuccess_res" != "true" ]; then
-		echo "readSuccess parameter displaying : $readSuccess_res for $diskid"
-		res="1"
-	fi
-	available_spare=`grep -i "available_spare:" /tmp/ssd_compare.txt | head -$i | tail -1`
-	available_spare_res=`echo $available_spare | awk {'print $2'}`
-	if [ $available_spare_res -le $spares ]; then
-		echo "available_spare parameter displaying : $available_spare_res for $diskid"
-		res="1"
-	fi
-	available_spare_threshold=`grep -i "available_spare_threshold" /tmp/ssd_compare.txt | head -$i | tail -1`
-	available_spare_threshold_res=`echo $available_spare_threshold | awk {'print $2'}`
-	if [ $available_spare_threshold_res -gt $spares_threshold ]; then
-		echo "available_spare_threshold parameter displaying : $available_spare_threshold_res for $diskid"
-		res="1"
-	fi
-	composite_temperature=`grep -i "composite_temperature:" /tmp/ssd_compare.txt | head -$i | tail -1`
-	composite_temperature_res=`echo $composite_temperature | awk {'print $2'}`
-	if [ $composite_temperature_res -gt $max_temperature ]; then
-		echo "composite_temperature parameter displaying : $composite_temperature_res for $diskid"
-		res="1"
-	fi
-	critical_composite_temperature_time=`grep -i "critical_composite_temperature_time:" /tmp/ssd_compare.txt | head -$i | tail -1`
-	critical_composite_temperature_time_res=`echo $critical_composite_temperature_time | awk {'print $2'}`
-	if [ $critical_composite_temperature_time_res -gt 0 ]; then
-		echo "critical_composite_temperature_time parameter displaying : $critical_composite_temperature_time_res for $diskid"
-		res="1"
-	fi
-	critical_warning=`grep -i "critical_warning:" /tmp/ssd_compare.txt | head -$i | tail -1`
-	critical_warning_res=`echo $critical_warning | awk {'print $2'}`
-	if [ $critical_warning_res -gt 0 ]; then
-		echo "critical_warning parameter displaying : $critical_warning_res for $diskid"
-		res="1"
-	fi
-	warning_composite_temperature_time=`grep -i "warning_composite_temperature_time:" /tmp/ssd_compare.txt | head -$i | tail -1`
-	warning_composite_temperature_time_res=`echo $warning_composite_temperature_time | awk {'print $2'}`
-	if [ $warning_composite_temperature_time_res -gt 0 ]; then
-		echo "warning_composite_temperature_time parameter displaying : $warning_composite_temperature_time_res for $diskid"
-		res="1"
-	fi
-done
-}
+max_temperature = 550  # in 550 = 55.0C
+spares = 95  # lowest spare for SSD endurance
+spares_threshold = 10  # statically set by system to 5
+MAX_PARALLEL = 64
+MAX_PARALLEL_PER_NODE = 4
+MANHOLE_TIMEOUT = 60
+
+SMART_FIELDS = ("errMsg", "readSuccess", "available_spare", "available_spare_threshold", "composite_temperature",
+                "critical_composite_temperature_time", "critical_warning", "warning_composite_temperature_time",
+                "percentage_used")
+
+res = 0
+output = []
+
+
+def out(line=""):
+    output.append(line)
+
+
+def barline():
+    out("=================================================================")
+
+
+def testname():
+    out("Test name: SSD / NVMe test")
+    out("Hostname: %s" % socket.gethostname())
+    try:
+        out("IP address: %s" % subprocess.check_output(["hostname", "-I"]).decode("utf-8").strip())
+    except (OSError, subprocess.CalledProcessError):
+        pass
+
+
+def numeric_id(typed_id):
+    # "DiskId<12>" -> "12", plain numbers are kept as they are
+    match = re.search(r"(\d+)", str(typed_id))
+    return match.group(1) if match else str(typed_id)
+
+
+def id_sort_key(typed_id):
+    # numeric ids in numeric order, anything else after them instead of failing the whole test
+    num = numeric_id(typed_id)
+    return (0, int(num), "") if num.isdigit() else (1, 0, num)
+
+
+def find_fields(obj, fields, found=None):
+    """First value of each wanted key anywhere in the (nested) SMART log page reply."""
+    if found is None:
+        found = {}
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            if key in fields and key not in found:
+                found[key] = value
+            find_fields(value, fields, found)
+    elif isinstance(obj, list):
+        for value in obj:
+            find_fields(value, fields, found)
+    return found
+
+
+def smart_log_page(drive, node_slots):
+    node_id, disk_id = numeric_id(drive["node_id"]), numeric_id(drive["disk_id"])
+    with node_slots[node_id]:
+        try:
+            reply = subprocess.run(["weka", "debug", "manhole", "-J", "-n", node_id, "ssd_get_nvme_smart_log_page",
+                                    "diskId=%s" % disk_id],
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=MANHOLE_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            return {"errMsg": "no reply within %s seconds" % MANHOLE_TIMEOUT}
+    if reply.returncode != 0:
+        return {"errMsg": reply.stderr.decode("utf-8", errors="replace").strip() or "exit code %s" % reply.returncode}
+    try:
+        return find_fields(json.loads(reply.stdout), SMART_FIELDS)
+    except ValueError:
+        return {"errMsg": "invalid JSON reply"}
+
+
+def as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def drive_failures(smart):
+    failures = []
+    if smart.get("errMsg") is not None:
+        failures.append("errMsg %s" % smart["errMsg"])
+    if smart.get("readSuccess") is not True:
+        failures.append("readSuccess %s" % smart.get("readSuccess"))
+    checks = (("available_spare", lambda v: v <= spares),
+              ("available_spare_threshold", lambda v: v > spares_threshold),
+              ("composite_temperature", lambda v: v > max_temperature),
+              ("critical_composite_temperature_time", lambda v: v > 0),
+              ("critical_warning", lambda v: v > 0),
+              ("warning_composite_temperature_time", lambda v: v > 0))
+    for field, failed in checks:
+        value = as_int(smart.get(field))
+        if field in smart and value is not None and failed(value):
+            failures.append("%s %s" % (field, value))
+    return failures
+
+
+def testrun():
+    global res
+    barline()
+    testname()
+
+    try:
+        drives = json.loads(subprocess.check_output(["weka", "cluster", "drive", "-J"], stderr=subprocess.DEVNULL))
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        out("Could not find weka executable")
+        res = 1
+        return
+
+    drives = [drive for drive in drives if str(drive.get("status", "")).upper() == "ACTIVE"]
+    out("Number of media found: %s disks" % len(drives))
+    if not drives:
+        return
+
+    node_slots = {}
+    for drive in drives:
+        node_slots.setdefault(numeric_id(drive["node_id"]), threading.Semaphore(MAX_PARALLEL_PER_NODE))
+    with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL, len(drives))) as executor:
+        smart_pages = list(executor.map(lambda drive: smart_log_page(drive, node_slots), drives))
+
+    header = ("NodeId", "DiskId", "Hostname", "Temp(C)", "Spare", "Used%", "CritWarn", "Result")
+    rows = []
+    for drive, smart in sorted(zip(drives, smart_pages),
+                               key=lambda pair: (id_sort_key(pair[0]["node_id"]), id_sort_key(pair[0]["disk_id"]))):
+        failures = drive_failures(smart)
+        if failures:
+            res = 1
+        temperature = as_int(smart.get("composite_temperature"))
+        rows.append((numeric_id(drive["node_id"]), numeric_id(drive["disk_id"]), drive.get("hostname", ""),
+                     "%.1f" % (temperature / 10.0) if temperature is not None else "-",
+                     smart.get("available_spare", "-"), smart.get("percentage_used", "-"),
+                     smart.get("critical_warning", "-"), "; ".join(failures) if failures else "OK"))
+
+    widths = [max(len(str(row[i])) for row in [header] + rows) for i in range(len(header))]
+    for row in [header] + rows:
+        out("  ".join(str(value).ljust(width) for value, width in zip(row, widths)).rstrip())
+
 
 # MAIN
 # If there is parameter after the script run command, output everything out
-if [ "$1" ]; then
-        testrun
-        if [ "$res" -eq "1" ]; then
-                exit 1
-        fi
-else
-        rm /tmp/$(basename $0).log 1> /dev/null 2> /dev/null
-        testrun > /tmp/$(basename $0).log
-        if [ "$res" -ne "0" ]; then
-                cat /tmp/$(basename $0).log
-                rm /tmp/$(basename $0).log 1> /dev/null 2> /dev/null
-                exit 1
-        else
-                rm /tmp/$(basename $0).log 1> /dev/null 2> /dev/null
-                exit 0
-        fi
-fi
-
+if __name__ == "__main__":
+    testrun()
+    if len(sys.argv) > 1 or res != 0:
+        print("\n".join(output))
+    sys.exit(1 if res != 0 else 0)
@@ -1,12 +1,13 @@
 #!/usr/bin/env python3
-import getpass,pathlib,os,sys,argparse,json,config,traceback,requests,io,tarfile,socket
-from threading import Thread
-from time import sleep
+import getpass,pathlib,os,sys,argparse,json,config,traceback,requests,io,tarfile,socket,hashlib
+from threading import Thread,Lock,Condition
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep,time
 from random import randint
 # Remove the cryptography warning
 import warnings 
 warnings.filterwarnings(action='ignore',module='.*paramiko.*')
-from scp import SCPClient
 from paramiko import SSHClient,AutoAddPolicy
 
 def threaded(fn):
@@ -69,27 +70,39 @@ class Connection:
         self.username = server['username']
         self.password = server['password']
         self.ssh = None
-        self.scp = None
 
     def open(self):
         self.ssh = SSHClient()
         self.ssh.set_missing_host_key_policy(AutoAddPolicy())
         self.ssh.connect(self.host, username=self.username, password=self.password,
                          timeout = config.SSH_CONNECT_TIMEOUT,auth_timeout = config.SSH_AUTH_TIMEOUT)
-        self.scp = SCPClient(self.ssh.get_transport())
 
     def close(self):
         if self.ssh:
             self.ssh.close()
-        if self.scp:
-            self.scp.close()
 
-    def copy(self,source,dest):
-        self.scp.put(source,recursive=True,remote_path = dest)
+    # Bring testbank and lib under config.TESTBANK_DIR up to date with the bundle, unless the copy left there by an
+    # earlier run already has the same content. The tests run as root, so the copy lives in a root only (0700)
+    # directory rather than in /tmp where any user could plant or swap files. The bundle is streamed as one tar
+    # over the SSH channel.
+    def sync(self,bundle):
+        testbank_dir = config.TESTBANK_DIR
+        current = self.run('install -d -m 0700 -o root -g root %s && cd %s && '
+                           'find %s -type f -print0 | LC_ALL=C sort -z | xargs -0 -r sha256sum | sha256sum'
+                           %(testbank_dir,testbank_dir,' '.join(Bundle.DIRS)))
+        if current.get('status') == 0 and current['response'].split()[:1] == [bundle.digest]:
+            return False
+        return self.run('cd %s && rm -rf %s && tar --no-same-owner -xf - -C %s'%(testbank_dir,' '.join(Bundle.DIRS),testbank_dir),
+                        data = bundle.tar())
 
-    def run(self,cmd):
+    # Every call opens its own channel on the one SSH transport, so several commands can run at once
+    def run(self,cmd,data=None):
         try:
             stdin, stdout, stderr = self.ssh.exec_command(cmd,timeout = config.SSH_EXEC_TIMEOUT)
+            if data is not None:
+                stdin.write(data)
+                stdin.flush()
+                stdin.channel.shutdown_write()
             status = stdout.channel.recv_exit_status()
             response = stdout.read()
             error = stderr.read()
@@ -99,6 +112,120 @@ class Connection:
                     'description':'Failed to run command',
                     'traceback':traceback.format_exc()}
 
+# Tool directories the tests need on every server, packed once per run
+class Bundle:
+    DIRS = ("testbank","lib")
+
+    def __init__(self,path):
+        self.path = path
+        self.lock = Lock()
+        self._tar = None
+        # The sha256sum of the 'sha256sum' listing of every file, which a server can compute on its own copy
+        listing = []
+        for name in self.files():
+            with open(self.path.joinpath(name),'rb') as f:
+                listing.append('%s  %s\n'%(hashlib.sha256(f.read()).hexdigest(),name))
+        self.digest = hashlib.sha256(''.join(listing).encode("utf-8")).hexdigest()
+
+    def files(self):
+        return sorted(str(f.relative_to(self.path)) for d in self.DIRS for f in self.path.joinpath(d).rglob('*') if f.is_file())
+
+    def tar(self):
+        with self.lock:
+            if self._tar is None:
+                fo = io.BytesIO()
+                with tarfile.open(fileobj = fo,mode = 'w') as tar:
+                    for d in self.DIRS:
+                        tar.add(str(self.path.joinpath(d)),arcname = d)
+                self._tar = fo.getvalue()
+            return self._tar
+
+# Runs jobs with at most max_running of them at once, and at most max_per_host at once on the same host.
+# Jobs start in the given order, skipping over jobs of hosts that are already busy.
+class Scheduler:
+
+    def __init__(self,max_running,max_per_host):
+        self.max_running = max_running
+        self.max_per_host = max_per_host
+        self.cond = Condition()
+        self.running = 0
+        self.running_per_host = Counter()
+
+    @threaded
+    def start(self,host,fn):
+        try:
+            fn()
+        finally:
+            with self.cond:
+                self.running -= 1
+                self.running_per_host[host] -= 1
+                self.cond.notify()
+
+    def run(self,jobs):
+        pending = list(jobs)
+        with self.cond:
+            while pending or self.running:
+                job = None
+                if self.running < self.max_running:
+                    job = next((j for j in pending if self.running_per_host[j[0]] < self.max_per_host),None)
+                if job is None:
+                    self.cond.wait()
+                    continue
+                pending.remove(job)
+                self.running += 1
+                self.running_per_host[job[0]] += 1
+                self.start(*job)
+
+# Streams every result to a JSON-lines file as soon as it is known, keeping only a compact index in memory:
+# host -> {test: {'status','duration','offset'}}, or host -> {'status','description','offset'} when the host
+# itself failed (SSH connection, testbank copy). offset points at the record in the results file.
+class ResultSink:
+
+    def __init__(self,path,index_path):
+        self.path = path
+        self.index_path = index_path
+        self.lock = Lock()
+        self.index = {}
+        self.file = open(path,'w')
+
+    def add_host(self,host):
+        with self.lock:
+            self.index.setdefault(host,{})
+
+    def add(self,host,test,result):
+        record = {'host':host,'test':test,'status':result.get('status'),'duration':result.get('duration'),'result':result}
+        line = json.dumps(record,sort_keys=True)
+        with self.lock:
+            offset = self.file.tell()
+            self.file.write(line+'\n')
+            self.file.flush()
+            entry = {'status':record['status'],'duration':record['duration'],'offset':offset}
+            if test is None:
+                entry['description'] = result.get('description')
+                self.index[host] = entry
+            else:
+                self.index.setdefault(host,{})[test] = entry
+
+    def close(self):
+        self.file.close()
+        try:
+            with open(self.index_path,'w') as f:
+                json.dump(self.index,f,sort_keys=True,indent=4)
+        except IOError:
+            pass
+
+    def read(self,offset):
+        with open(self.path) as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+
+    def records(self,errors_only=False):
+        with open(self.path) as f:
+            for line in f:
+                record = json.loads(line)
+                if not errors_only or record['status'] != 0:
+                    yield record
+
 # Tester class
 class Tester:
 
@@ -107,15 +234,20 @@ class Tester:
         self.servers = self.get_servers()
         self.tests = self.get_tests()
         self.results = {}
+        self.sink = None
         self.json = True
         self.out = True
         self.errors_only = False
         self.file = sys.stdout
         self.log_file = open('/var/log/WekaIO_ProDiags.log','w')
+        self.print_lock = Lock()
+        self.max_running = config.MAX_CONCURRENT_TESTS
+        self.max_per_server = config.TESTS_PER_SERVER
 
     def print(self,*args):
-        print(*args,file = self.file)
-        print(*args,file = self.log_file)
+        with self.print_lock:
+            print(*args,file = self.file)
+            print(*args,file = self.log_file)
         
 
     def pp_tests(self):
@@ -150,49 +282,91 @@ class Tester:
     def get_tests(self):
         return [f.name for f in os.scandir(self.path.joinpath("testbank")) if f.is_dir()]     
 
-    # Multithreaded connection to N servers and execute specified tests according to process:
+    # Prepare a server for running tests:
     # 1. Open connection
-    # 2. Clean remote server for exsting tests / outputs logs
-    # 3. Copy updated testbank to remote server
-    # 4. Execute the required tests on server
-    @threaded
-    def run_tests_on_server(self,server,test_indexes):
+    # 2. Sync the testbank to the remote server, skipped when its copy from an earlier run is current
+    def prepare_server(self,server):
         try:
             server.open()
         except:
-            self.results[server.host] = {'status': -124,
-                                         'description':'Failed to open SSH connection',
-                                         'traceback':traceback.format_exc()}
-            return            
-        server.run('rm -rf /tmp/testbank')
-        server.run('rm -rf /tmp/lib')
-        server.copy(str(self.path.joinpath("testbank")),'/tmp')       
-        server.copy(str(self.path.joinpath("lib")),'/tmp')       
-        self.results[server.host] = {}
-        for test in [self.tests[i-1] for i in test_indexes]:
-            parameter = ' a' if not self.errors_only else ''
-            results = server.run('/tmp/testbank/%s/%s.py%s'%(test,test,parameter))
-            if self.out:
-                if 'response' in results:
-                    resp = remove_blank_lines(results['response'])
-                    errs = remove_blank_lines(results['error'])
-                    if resp:
-                        self.print(resp)
-                    if errs:
-                        self.print(errs)
-            self.results[server.host][test]=results
-        server.run('rm -rf /tmp/testbank')
-        server.run('rm -rf /tmp/lib')
-        server.close()
+            self.sink.add(server.host,None,{'status': -124,
+                                            'description':'Failed to open SSH connection',
+                                            'traceback':traceback.format_exc()})
+            return False
+        synced = server.sync(self.bundle)
+        if synced and synced['status'] != 0:
+            self.sink.add(server.host,None,{'status': -125,
+                                            'description':'Failed to copy testbank',
+                                            'error':synced.get('error',synced.get('traceback'))})
+            server.close()
+            return False
+        self.sink.add_host(server.host)
+        return True
 
+    # Run a single test on a prepared server, each test gets its own channel on the server's SSH connection
+    def run_test_on_server(self,server,test):
+        parameter = ' a' if not self.errors_only else ''
+        started = time()
+        results = server.run('%s/testbank/%s/%s.py%s'%(config.TESTBANK_DIR,test,test,parameter))
+        results['duration'] = round(time()-started,3)
+        if self.out:
+            if 'response' in results:
+                resp = remove_blank_lines(results['response'])
+                errs = remove_blank_lines(results['error'])
+                if resp:
+                    self.print(resp)
+                if errs:
+                    self.print(errs)
+        self.sink.add(server.host,test,results)
 
-    def get_errors_only(self):
+    # Average runtime of each test in earlier runs, used to start long tests first
+    def load_runtimes(self):
+        try:
+            with open(config.RUNTIMES_FILE) as f:
+                return json.load(f)
+        except (IOError,ValueError):
+            return {}
 
-        def errors_on_server(server_results):
-            return server_results if server_results.get('status',0) == -124 else \
-                   dict([(k,v) for (k,v) in server_results.items() if v['status']!=0])
+    def save_runtimes(self,runtimes):
+        durations = {}
+        for server_results in self.results.values():
+            if 'offset' in server_results:
+                continue
+            for test,entry in server_results.items():
+                if entry['duration'] is not None:
+                    durations.setdefault(test,[]).append(entry['duration'])
+        for test,values in durations.items():
+            current = sum(values)/len(values)
+            runtimes[test] = round(current if test not in runtimes else 0.5*runtimes[test]+0.5*current,3)
+        try:
+            with open(config.RUNTIMES_FILE,'w') as f:
+                json.dump(runtimes,f,sort_keys=True,indent=4)
+        except IOError:
+            pass
+
+    # Failed hosts and failed tests, read back from the results stream
+    def get_errors_only(self):
+        errors = dict((host,{}) for host in self.results)
+        for record in self.sink.records(errors_only=True):
+            if record['test'] is None:
+                errors[record['host']] = record['result']
+            else:
+                errors[record['host']][record['test']] = record['result']
+        return errors
 
-        return dict([(server,errors_on_server(results)) for server,results in self.results.items()])
+    # Same report as json.dumps(results,sort_keys=True,indent=4), but built one host at a time from the stream
+    def print_json_report(self):
+        hosts = sorted(self.results)
+        self.print('{')
+        for i,host in enumerate(hosts):
+            entry = self.results[host]
+            if 'offset' in entry:
+                host_results = self.sink.read(entry['offset'])['result']
+            else:
+                host_results = dict((test,self.sink.read(test_entry['offset'])['result']) for test,test_entry in entry.items())
+            text = json.dumps(host_results,sort_keys=True,indent=4).replace('\n','\n    ')
+            self.print('    %s: %s%s'%(json.dumps(host),text,',' if i < len(hosts)-1 else ''))
+        self.print('}')
 
     # If #run_once string found in specific test, test would be executed on one of the servers once
     def split_tests(self,test_indexes):
@@ -208,23 +382,52 @@ class Tester:
                     all_servers.append(i)
         return first_server,all_servers
             
+    # Open and sync all servers, then schedule every (server,test) pair:
+    # - up to max_running tests at once in total and up to max_per_server at once on the same server
+    # - #run_once tests go to the servers with the least expected work so far
+    # - tests that took longest in earlier runs start first
     def run_tests(self,test_indexes=[],run_all=False):
         if run_all:
             test_indexes = [i+1 for i in range(len(self.tests))]
-        self.results = {}
-        run_on_first_server,run_on_all_servers = self.split_tests(test_indexes)
-        first_server_thread = self.run_tests_on_server(self.servers[0],run_on_first_server+run_on_all_servers)
-        other_servers_threads = [self.run_tests_on_server(server,run_on_all_servers) for \
-                   server in self.servers[1:]]
-        threads = [first_server_thread]+other_servers_threads                              
-        for thread in threads:
-            thread.join()
+        self.sink = ResultSink(config.RESULTS_FILE,config.RESULTS_INDEX_FILE)
+        self.results = self.sink.index
+        self.bundle = Bundle(self.path)
+        run_once,run_on_all_servers = self.split_tests(test_indexes)
+        with ThreadPoolExecutor(max_workers = max(1,min(len(self.servers),self.max_running))) as executor:
+            prepared = list(executor.map(self.prepare_server,self.servers))
+        servers = [server for server,ok in zip(self.servers,prepared) if ok]
+        if not servers:
+            self.sink.close()
+            return
+
+        runtimes = self.load_runtimes()
+        expected = lambda test: runtimes.get(test,1.0)
+        load = dict((server.host,0) for server in servers)
+        jobs = []
+        for i in run_on_all_servers:
+            for server in servers:
+                jobs.append((server,self.tests[i-1]))
+                load[server.host] += expected(self.tests[i-1])
+        for test in sorted([self.tests[i-1] for i in run_once],key = expected,reverse = True):
+            server = min(servers,key = lambda server: load[server.host])
+            jobs.append((server,test))
+            load[server.host] += expected(test)
+        jobs.sort(key = lambda job: expected(job[1]),reverse = True)
+
+        Scheduler(self.max_running,self.max_per_server).run(
+            [(server.host,lambda server=server,test=test: self.run_test_on_server(server,test)) for server,test in jobs])
+        for server in servers:
+            server.close()
+        self.sink.close()
+        self.save_runtimes(runtimes)
 
     def print_report(self):
-        res = self.get_errors_only() if self.errors_only else self.results
-        if res:
+        if self.results:
             if self.json:
-                self.print (json.dumps(res,sort_keys=True, indent=4))
+                if self.errors_only:
+                    self.print (json.dumps(self.get_errors_only(),sort_keys=True, indent=4))
+                else:
+                    self.print_json_report()
             self.log_file.close()
             os.system('./collect_diags.sh')
         
@@ -241,6 +444,10 @@ if __name__=="__main__":
     parser.add_argument("-e", "--errors_only", action='store_true',help="Show failed tests only")
     parser.add_argument("-nj", "--nojson", action='store_true', help = "no JSON report")
     parser.add_argument("-no", "--nooutput", action='store_true', help = "no scripts output")
+    parser.add_argument("-j", "--jobs", type=int, default=config.MAX_CONCURRENT_TESTS, metavar='N',
+                        help="Max tests running at once on all servers (default: %(default)s)")
+    parser.add_argument("-js", "--jobs_per_server", type=int, default=config.TESTS_PER_SERVER, metavar='N',
+                        help="Max tests running at once on the same server (default: %(default)s)")
     parser.add_argument('-f','--file', type=argparse.FileType('w'), default=sys.stdout,
                          metavar='PATH',
                         help="Output file (default: standard output)")
@@ -257,6 +464,8 @@ if __name__=="__main__":
     if args.errors_only:
         tester.errors_only = True
     tester.file = args.file
+    tester.max_running = max(1,args.jobs)
+    tester.max_per_server = max(1,args.jobs_per_server)
     if args.update:
         generic.test_internet()
         generic.update()
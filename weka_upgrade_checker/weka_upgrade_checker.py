@@ -1,21 +1,28 @@
 #!/usr/bin/env python3
 
 import argparse
+import asyncio
+import atexit
 import base64
-import concurrent.futures
+import bisect
 import datetime
+import gzip
+import hashlib
 import heapq
 import itertools
 import json
 import logging
 import os
+import queue
+import random
 import re
+import shutil
 import subprocess
 import sys
 import tarfile
+import tempfile
 import threading
 import time
-from subprocess import run
 import warnings
 from collections import Counter, defaultdict, namedtuple
 import textwrap
@@ -60,6 +67,8 @@ pg_version = "1.12.9"
 known_issues_file = "known_issues.json"
 
 log_file_path = os.path.abspath("./weka_upgrade_checker.log")
+cluster_state_file_path = os.path.abspath("./weka_upgrade_checker_cluster_state.json")
+timing_report_file_path = os.path.abspath("./weka_upgrade_checker_timing.json")
 logging.basicConfig(
     handlers=[logging.FileHandler(filename=log_file_path, encoding="utf-8", mode="w")],
     format="%(asctime)s %(name)s:%(levelname)s:%(message)s",
@@ -99,6 +108,7 @@ def ECHO(text):
     logging.info(wrapped_text)
 
 def INFO(text):
+    check_profiler.begin(text)
     nl = "\n"
     wrapped_text = textwrap.fill(text, width=150, subsequent_indent="          ")
     print(f"{colors.OKPURPLE}{nl}{wrapped_text}{nl}{colors.ENDC}")
@@ -280,6 +290,490 @@ class Spinner:
         )
         sys.stdout.flush()
 
+class SSHConnectionPool:
+    """Reuse one authenticated SSH session per host via OpenSSH ControlMaster.
+
+    The first command sent to a host opens a master connection that stays up in
+    the background (ControlPersist); every later command to the same host is
+    multiplexed over that master instead of paying for a new handshake. Setup
+    and reuse counts are tracked per host so they can be reported at the end.
+    """
+
+    def __init__(self, persist_secs=900):
+        self.enabled = True
+        self.persist_secs = persist_secs
+        self.control_dir = None
+        self._lock = threading.Lock()
+        self._stats = {}  # host_ip -> [setups, reuses]
+
+    @staticmethod
+    def _control_path(control_dir, host_ip):
+        # Unix socket paths are limited to ~100 chars, so hash the host instead
+        # of embedding long FQDNs / IPv6 addresses in the path.
+        digest = hashlib.sha1(host_ip.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(control_dir, digest)
+
+    def options(self, host_ip):
+        """Return the extra ssh options for *host_ip* and account for the call."""
+        if not self.enabled:
+            return []
+
+        with self._lock:
+            if self.control_dir is None:
+                self.control_dir = tempfile.mkdtemp(prefix="weka_ssh_")
+            control_path = self._control_path(self.control_dir, host_ip)
+            stats = self._stats.setdefault(host_ip, [0, 0])
+            if os.path.exists(control_path):
+                stats[1] += 1
+            else:
+                stats[0] += 1
+
+        return [
+            "-o", "ControlMaster=auto",
+            "-o", f"ControlPath={control_path}",
+            "-o", f"ControlPersist={self.persist_secs}",
+        ]
+
+    def close(self):
+        """Stop every master connection and remove the control socket directory."""
+        with self._lock:
+            control_dir, self.control_dir = self.control_dir, None
+            hosts = list(self._stats)
+
+        if control_dir is None:
+            return
+
+        env = _clean_subprocess_env()
+        for host_ip in hosts:
+            control_path = self._control_path(control_dir, host_ip)
+            if not os.path.exists(control_path):
+                continue
+            subprocess.call(
+                ["ssh", "-o", f"ControlPath={control_path}", "-O", "exit", host_ip],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                env=env,
+            )
+        shutil.rmtree(control_dir, ignore_errors=True)
+
+    def report(self):
+        if not self.enabled or not self._stats:
+            return
+
+        INFO("SSH CONNECTION REUSE SUMMARY")
+        total_setups = sum(setups for setups, _ in self._stats.values())
+        total_reuses = sum(reuses for _, reuses in self._stats.values())
+        ECHO(
+            f"{len(self._stats)} hosts, {total_setups} connection setups, "
+            f"{total_reuses} commands reused an existing connection"
+        )
+        for host_ip, (setups, reuses) in sorted(self._stats.items()):
+            logging.info(f"SSH host {host_ip}: {setups} setups, {reuses} reuses")
+
+        # A host that needed more than one setup lost its master mid-run
+        # (network blip, sshd restart) or raced concurrent first connections.
+        resetup = [
+            f"{host_ip}:{setups}"
+            for host_ip, (setups, _) in sorted(self._stats.items())
+            if setups > 1
+        ]
+        if resetup:
+            ECHO("Hosts with more than one connection setup (host:setups):")
+            printlist(resetup, 6)
+
+
+ssh_pool = SSHConnectionPool()
+atexit.register(ssh_pool.close)
+
+
+class CheckProfiler:
+    """Per-section timing of a checker run.
+
+    Every INFO() banner opens a new section, which closes the previous one. A
+    section records its wall time, the remote commands run while it was open
+    (count, bytes sent and received, time per host) and the local commands it
+    ran. save() writes the sections as a JSON report for the support bundle.
+    """
+
+    SLOWEST_HOSTS = 5
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.sections = []
+        self.current = None
+
+    def begin(self, title):
+        now = time.monotonic()
+        with self._lock:
+            self._close(now)
+            self.current = {
+                "section": title,
+                "started": now,
+                "wall_secs": 0.0,
+                "remote_execs": 0,
+                "remote_failures": 0,
+                "bytes_sent": 0,
+                "bytes_received": 0,
+                "local_commands": 0,
+                "local_secs": 0.0,
+                "host_secs": defaultdict(float),
+            }
+
+    def _close(self, now):
+        if self.current is not None:
+            self.current["wall_secs"] = now - self.current.pop("started")
+            self.sections.append(self.current)
+            self.current = None
+
+    def record_remote(self, host_name, secs, sent, received, failed=False):
+        with self._lock:
+            section = self.current
+            if section is None:
+                return
+            section["remote_execs"] += 1
+            section["remote_failures"] += int(failed)
+            section["bytes_sent"] += sent
+            section["bytes_received"] += received
+            section["host_secs"][host_name] += secs
+
+    def record_local(self, secs):
+        with self._lock:
+            section = self.current
+            if section is None:
+                return
+            section["local_commands"] += 1
+            section["local_secs"] += secs
+
+    def finish(self):
+        with self._lock:
+            self._close(time.monotonic())
+
+    def report_sections(self):
+        sections = []
+        for section in self.sections:
+            entry = {
+                key: round(value, 3) if isinstance(value, float) else value
+                for key, value in section.items()
+                if key != "host_secs"
+            }
+            slowest = heapq.nlargest(
+                self.SLOWEST_HOSTS, section["host_secs"].items(), key=lambda item: item[1]
+            )
+            entry["slowest_hosts"] = [
+                {"host": host, "secs": round(secs, 3)} for host, secs in slowest
+            ]
+            sections.append(entry)
+        return sections
+
+    def save(self, path):
+        """Close the open section and write the timing report to *path*."""
+        self.finish()
+        sections = self.report_sections()
+        report = {
+            "pg_version": pg_version,
+            "started": self.started,
+            "wall_secs": round(time.time() - self.started, 3),
+            "sections": sections,
+        }
+        try:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+        except OSError as e:
+            logging.warning(f"Unable to write timing report {path}: {e}")
+            return False
+
+        for entry in sorted(sections, key=lambda entry: entry["wall_secs"], reverse=True)[:10]:
+            logging.info(
+                f"Timing: {entry['wall_secs']}s, {entry['remote_execs']} remote execs, "
+                f"{entry['bytes_received']} bytes received - {entry['section']}"
+            )
+        return True
+
+
+check_profiler = CheckProfiler()
+
+
+class CommandCapture:
+    """Record every command output the checker consumes, or replay a recording.
+
+    In "record" mode commands run normally and their exit status, stdout and
+    stderr are stored under a key naming the command ("local" + argv, or "ssh" +
+    host + remote command). save() writes them to a gzip-compressed snapshot
+    bundle. In "replay" mode nothing is executed: results come from the bundle,
+    and a command that was never captured behaves like one that failed, so its
+    check reports missing data instead of reaching out to the cluster.
+    """
+
+    def __init__(self):
+        self.mode = None
+        self.path = None
+        self.started = time.time()
+        self.recorded_start = None
+        self.replayed = 0
+        self.missing = []
+        self._records = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(key):
+        return json.dumps(list(key))
+
+    def start_recording(self, path):
+        self.mode = "record"
+        self.path = path
+        self.started = time.time()
+
+    def load(self, path):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            bundle = json.load(f)
+        self._records = bundle["records"]
+        self.recorded_start = bundle["created"]
+        self.mode = "replay"
+        self.path = path
+        self.started = time.time()
+        logging.info(
+            f"Replaying snapshot {path} recorded by upgrade checker {bundle.get('pg_version')} "
+            f"at {datetime.datetime.fromtimestamp(self.recorded_start)}"
+        )
+
+    def save(self):
+        if self.mode != "record":
+            return
+        with self._lock:
+            bundle = {
+                "pg_version": pg_version,
+                "created": self.started,
+                "records": dict(self._records),
+            }
+        with gzip.open(self.path, "wt", encoding="utf-8") as f:
+            json.dump(bundle, f)
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._records.get(self._key(key))
+            if entry is None:
+                self.missing.append(key)
+            else:
+                self.replayed += 1
+        if entry is None:
+            logging.debug(f"Not captured in snapshot: {key}")
+        return entry
+
+    def lookup(self, key):
+        """Return the captured (returncode, stdout, stderr) of *key* (replay mode)."""
+        entry = self._lookup(key)
+        if entry is None:
+            return 127, b"", b"not captured in snapshot\n"
+        return (
+            entry["rc"],
+            entry["out"].encode("utf-8", "surrogateescape"),
+            entry["err"].encode("utf-8", "surrogateescape"),
+        )
+
+    def record(self, key, returncode, stdout, stderr):
+        if self.mode != "record":
+            return
+        entry = {
+            "rc": returncode,
+            "out": stdout.decode("utf-8", "surrogateescape"),
+            "err": stderr.decode("utf-8", "surrogateescape"),
+        }
+        with self._lock:
+            self._records[self._key(key)] = entry
+
+    def execute(self, key, argv, env=None):
+        """Run *argv* (or replay it) and return (returncode, stdout, stderr)."""
+        if self.mode == "replay":
+            return self.lookup(key)
+        started = time.monotonic()
+        proc = subprocess.run(
+            argv,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=env,
+        )
+        check_profiler.record_local(time.monotonic() - started)
+        self.record(key, proc.returncode, proc.stdout, proc.stderr)
+        return proc.returncode, proc.stdout, proc.stderr
+
+    def value(self, key, func):
+        """Capture a JSON-serializable local fact (file content, path existence)."""
+        if self.mode == "replay":
+            entry = self._lookup(key)
+            return None if entry is None else entry["value"]
+        value = func()
+        if self.mode == "record":
+            with self._lock:
+                self._records[self._key(key)] = {"value": value}
+        return value
+
+    def report(self):
+        if self.mode == "record":
+            ECHO(f"Captured {len(self._records)} command outputs into snapshot {self.path}")
+        elif self.mode == "replay":
+            ECHO(
+                f"Replayed {self.replayed} command outputs from {self.path} in "
+                f"{time.time() - self.started:.3f}s; {len(self.missing)} commands were not captured"
+            )
+
+
+command_capture = CommandCapture()
+
+
+def local_check_output(argv, stderr=None):
+    """subprocess.check_output() for local commands, routed through command_capture."""
+    returncode, stdout, err = command_capture.execute(["local"] + list(argv), argv)
+    if stderr == subprocess.STDOUT:
+        stdout += err
+    elif stderr is None and err:
+        sys.stderr.write(err.decode("utf-8", errors="replace"))
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, argv, output=stdout)
+    return stdout
+
+
+def local_run(argv):
+    """subprocess.run() with captured stdout/stderr, routed through command_capture."""
+    returncode, stdout, stderr = command_capture.execute(["local"] + list(argv), argv)
+    return subprocess.CompletedProcess(argv, returncode, stdout, stderr)
+
+
+def local_call(argv):
+    """Exit status of a local command whose output is discarded."""
+    return local_run(argv).returncode
+
+
+def read_local_file(path):
+    def read():
+        try:
+            with open(path, "r") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    content = command_capture.value(["file", path], read)
+    if content is None:
+        raise FileNotFoundError(path)
+    return content
+
+
+def local_path_exists(path):
+    return bool(command_capture.value(["exists", path], lambda: os.path.exists(path)))
+
+
+class WekaCLICache:
+    """Memoize ``weka ... -J`` invocations for the duration of one checker run.
+
+    Parsed results are keyed by argv, so a command issued by several checks (or
+    once per host, like ``weka debug traces status``) only reaches the cluster
+    leader once. Returned objects are shared between callers and must be
+    treated as read-only. invalidate() drops one command, or every command.
+
+    When a snapshot file is configured, the raw outputs are written to it at the
+    end of the run, each with the time it was fetched from the cluster, and a
+    rerun reuses the outputs fetched within ``max_age_secs`` instead of querying
+    the cluster again. Reused outputs keep their original fetch time, so chained
+    reruns cannot keep old state alive.
+    """
+
+    def __init__(self):
+        self._raw = {}  # argv tuple -> stdout text
+        self._parsed = {}  # argv tuple -> parsed JSON
+        self._fetched = {}  # argv tuple -> time the output was fetched from the cluster
+        self._lock = threading.Lock()
+        self.snapshot_path = None
+        self.hits = 0
+        self.misses = 0
+
+    def json(self, argv, stderr=None):
+        key = tuple(argv)
+        with self._lock:
+            if key in self._parsed:
+                self.hits += 1
+                return self._parsed[key]
+            raw = self._raw.get(key)  # seeded from a snapshot, not parsed yet
+
+        fetched = None
+        if raw is None:
+            raw = local_check_output(argv, stderr=stderr).decode("utf-8")
+            fetched = time.time()
+            self.misses += 1
+        else:
+            self.hits += 1
+        parsed = json.loads(raw)
+
+        with self._lock:
+            self._raw[key] = raw
+            self._parsed[key] = parsed
+            if fetched is not None:
+                self._fetched[key] = fetched
+        return parsed
+
+    def invalidate(self, argv=None):
+        with self._lock:
+            if argv is None:
+                self._raw.clear()
+                self._parsed.clear()
+                self._fetched.clear()
+            else:
+                self._raw.pop(tuple(argv), None)
+                self._parsed.pop(tuple(argv), None)
+                self._fetched.pop(tuple(argv), None)
+
+    def load_snapshot(self, path, max_age_secs):
+        """Seed the cache from the entries of *path* fetched less than *max_age_secs* ago."""
+        self.snapshot_path = path
+        now = time.time()
+        try:
+            with open(path, "r") as f:
+                snapshot = json.load(f)
+            # Older snapshots carry a single creation time instead of one per entry
+            entries = [(tuple(entry[0]), entry[1], entry[2] if len(entry) > 2 else snapshot["created"])
+                       for entry in snapshot["entries"]]
+        except FileNotFoundError:
+            return False
+        except (ValueError, KeyError, TypeError, IndexError) as e:
+            logging.warning(f"Ignoring unreadable cluster state snapshot {path}: {e}")
+            return False
+
+        fresh = [(argv, raw, fetched) for argv, raw, fetched in entries if now - fetched <= max_age_secs]
+        if not fresh:
+            logging.info(f"Cluster state snapshot {path} is older than {int(max_age_secs)}s, not reusing it")
+            return False
+
+        with self._lock:
+            for argv, raw, fetched in fresh:
+                self._raw[argv] = raw
+                self._fetched[argv] = fetched
+        age = now - min(fetched for _, _, fetched in fresh)
+        ECHO(f"Reusing cluster state captured up to {int(age // 60)} minute(s) ago from {path}")
+        return True
+
+    def save_snapshot(self):
+        logging.info(f"weka CLI cache: {self.hits} hits, {self.misses} misses")
+        if not self.snapshot_path:
+            return
+
+        with self._lock:
+            entries = [[list(argv), raw, self._fetched[argv]] for argv, raw in self._raw.items() if argv in self._fetched]
+        created = min((fetched for _, _, fetched in entries), default=time.time())
+        try:
+            with open(self.snapshot_path, "w") as f:
+                json.dump({"created": created, "entries": entries}, f)
+        except OSError as e:
+            WARN(f"Unable to write cluster state snapshot {self.snapshot_path}: {e}")
+
+
+weka_cli = WekaCLICache()
+
+
+def weka_json(argv, stderr=None):
+    """Run a weka CLI command and return its parsed JSON output (memoized per argv)."""
+    return weka_cli.json(argv, stderr=stderr)
+
+
 def printlist(lst, num):
     #global num_warn
 
@@ -289,12 +783,15 @@ def printlist(lst, num):
         #num_warn += 1
 
 
-def create_tar_file(source_file, output_path):
+def create_tar_file(source_file, output_path, extra_files=()):
     now = datetime.datetime.now()
     timestamp = now.strftime("%Y-%m-%d_%H-%M-%S")
     tar_file_name = f"{os.path.splitext(source_file)[0]}_{timestamp}.tar.gz"
     with tarfile.open(tar_file_name, "w:gz") as tar:
         tar.add(source_file)
+        for extra_file in extra_files:
+            if os.path.exists(extra_file):
+                tar.add(extra_file)
 
 
 def get_online_version():
@@ -365,18 +862,10 @@ ClusterCheckResults = namedtuple(
 
 def weka_cluster_checks(target_version):
     INFO("VERIFYING WEKA AGENT STATUS")
-    weka_agent_service = subprocess.call(
-        ["sudo", "service", "weka-agent", "status"],
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.STDOUT,
-    )
+    weka_agent_service = local_call(["sudo", "service", "weka-agent", "status"])
 
     if weka_agent_service != 0:
-        weka_agent_service = subprocess.call(
-            ["sudo", "systemctl", "status", "weka-agent"],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.STDOUT,
-        )
+        weka_agent_service = local_call(["sudo", "systemctl", "status", "weka-agent"])
 
     if weka_agent_service != 0:
         BAD("WEKA is NOT installed on host or the container is down, cannot continue")
@@ -390,13 +879,9 @@ def weka_cluster_checks(target_version):
     last_error = None
     for attempt in range(2):
         try:
-            raw = subprocess.check_output(
+            con_status = weka_json(
                 ["weka", "local", "status", "-J"], stderr=subprocess.STDOUT
             )
-            raw = raw.decode("utf-8").strip()
-            if not raw:
-                raise ValueError("Empty output from 'weka local status -J'")
-            con_status = json.loads(raw)
             break
         except (subprocess.CalledProcessError, ValueError, json.JSONDecodeError) as e:
             last_error = e
@@ -420,8 +905,7 @@ def weka_cluster_checks(target_version):
             sys.exit(1)
 
     INFO("WEKA USER LOGIN TEST")
-    p = run(["weka", "status"], stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
-    if p.returncode != 0:
+    if local_call(["weka", "status"]) != 0:
         BAD("Please login using weka user login first, cannot continue")
         sys.exit(1)
     else:
@@ -432,7 +916,7 @@ def weka_cluster_checks(target_version):
         return version_string.split("-")[0]
 
     INFO("WEKA IDENTIFIED")
-    weka_info = json.loads(subprocess.check_output(["weka", "status", "-J"]))
+    weka_info = weka_json(["weka", "status", "-J"])
     cluster_name = weka_info["name"]
     weka_status = weka_info["status"]
     uuid = weka_info["guid"]
@@ -472,7 +956,7 @@ def weka_cluster_checks(target_version):
     try:
         # Capture output and decode safely
         weka_alerts_json_string = (
-            subprocess.check_output(
+            local_check_output(
                 ["weka", "alerts", "--no-header", "-J"], stderr=subprocess.STDOUT
             )
             .decode("utf-8", errors="replace")
@@ -521,34 +1005,31 @@ def weka_cluster_checks(target_version):
     INFO("VERIFYING CUSTOM SSL_CERT_FILE")
     try:
         file_path = os.path.abspath(f"/opt/weka/dist/release/{weka_versions}.spec")
-        with open(file_path, "r") as file:
-            content = file.read()
-            if "SSL_CERT_FILE" in content:
-                BAD(f"SSL_CERT_FILE defined in {weka_versions}.spec. Please contact WEKA Support before upgrading")
-            else:
-                GOOD("SSL_CERT_FILE not defined")
+        content = read_local_file(file_path)
+        if "SSL_CERT_FILE" in content:
+            BAD(f"SSL_CERT_FILE defined in {weka_versions}.spec. Please contact WEKA Support before upgrading")
+        else:
+            GOOD("SSL_CERT_FILE not defined")
     except FileNotFoundError:
         BAD("Unable to determine if SSL_CERT_FILE is defined.")
 
     INFO("VALIDATING SSL CERT KEY SIZE")
     if V(weka_version) >= V("4.2.7"):
         cert = os.path.abspath("/opt/weka/data/drives0/tls/certificate.pem")
-        if not os.path.exists(cert):
+        if not local_path_exists(cert):
             WARN(f"Certificate file does not exist: {cert}")
         else:
             try:
                 # Run openssl command to get certificate details
-                result = subprocess.run(
+                cert_text = local_check_output(
                     ["openssl", "x509", "-in", cert, "-noout", "-text"],
-                    capture_output=True,
-                    text=True,
-                    check=True,
-                )
+                    stderr=subprocess.DEVNULL,
+                ).decode("utf-8", errors="replace")
                 # We only care if rsaEncryption is in use
                 match_algorithm = re.search(
-                    r"Public Key Algorithm: rsaEncryption", result.stdout
+                    r"Public Key Algorithm: rsaEncryption", cert_text
                 )
-                match = re.search(r"Public-Key: \((\d+) bit\)", result.stdout)
+                match = re.search(r"Public-Key: \((\d+) bit\)", cert_text)
                 if match_algorithm:
                     if match:
                         key_size = int(match.group(1))
@@ -564,9 +1045,7 @@ def weka_cluster_checks(target_version):
                 WARN("Failed to read the certificate. Ensure the file path is correct and openssl is installed.")
 
     INFO("CHECKING REBUILD STATUS")
-    rebuild_status = json.loads(
-        subprocess.check_output(["weka", "status", "rebuild", "-J"])
-    )
+    rebuild_status = weka_json(["weka", "status", "rebuild", "-J"])
     if rebuild_status["progressPercent"] == 0:
         GOOD("No rebuild in progress")
     else:
@@ -576,17 +1055,11 @@ def weka_cluster_checks(target_version):
     INFO("VERIFYING WEKA BACKEND MACHINES")
     weka_bk_servers = [
         Machine(machine_json)
-        for machine_json in json.loads(
-            subprocess.check_output(
-                ["weka", "cluster", "servers", "list", "--role", "backend", "-J"] # 4.1+
-            )
-        )
+        for machine_json in weka_json(["weka", "cluster", "servers", "list", "--role", "backend", "-J"])  # 4.1+
     ]
     backend_hosts = [
         Host(host_json)
-        for host_json in json.loads(
-            subprocess.check_output(["weka", "cluster", "container", "-b", "-J"])
-        )
+        for host_json in weka_json(["weka", "cluster", "container", "-b", "-J"])
     ]
     _seen_bk = set()
     ssh_bk_hosts = []
@@ -609,17 +1082,11 @@ def weka_cluster_checks(target_version):
     INFO("VERIFYING WEKA CLIENT MACHINES")
     weka_cl_servers = [
         Machine(machine_json)
-        for machine_json in json.loads(
-            subprocess.check_output(
-                ["weka", "cluster", "servers", "list", "--role", "client", "-J"] # 4.1+
-            )
-        )
+        for machine_json in weka_json(["weka", "cluster", "servers", "list", "--role", "client", "-J"])  # 4.1+
     ]
     client_hosts = [
         Host(host_json)
-        for host_json in json.loads(
-            subprocess.check_output(["weka", "cluster", "container", "-c", "-J"])
-        )
+        for host_json in weka_json(["weka", "cluster", "container", "-c", "-J"])
     ]
     _seen_cl = set()
     ssh_cl_hosts = []
@@ -649,16 +1116,24 @@ def weka_cluster_checks(target_version):
         BAD(
             f"Multiple container versions detected: {', '.join(unique_versions)}. Upgrade is not possible until all container versions match."
         )
+        graph = load_upgrade_graph(_UPGRADE_PATH_FILE)
+        if graph:
+            INFO2(f"Upgrade path to {target_version} per container version:")
+            paths = graph.find_paths(
+                sorted(clean_version_string(version) for version in unique_versions),
+                target_version,
+            )
+            for version, path in paths.items():
+                if path:
+                    ECHO(f"{version}: {' --> '.join(path)}")
+                else:
+                    ECHO(f"{version}: no upgrade path to {target_version}")
 
     INFO("Validating compute processes avg CPU utilization")
     spinner = Spinner("  Processing Data   ", color=colors.OKCYAN)
     spinner.start()
     try:
-        compute_process_ids = json.loads(
-            subprocess.check_output(
-                ["weka", "cluster", "process", "-b", "-F", "role=COMPUTE", "-J"] # 4.0+
-            )
-        )
+        compute_process_ids = weka_json(["weka", "cluster", "process", "-b", "-F", "role=COMPUTE", "-J"])  # 4.0+
         node_ids = [item["node_id"] for item in compute_process_ids]
         just_node_ids = ",".join(
             [
@@ -668,7 +1143,7 @@ def weka_cluster_checks(target_version):
         )
 
         percentage_str = (
-            subprocess.check_output(
+            local_check_output(
                 [
                     "weka",
                     "stats",
@@ -705,7 +1180,7 @@ def weka_cluster_checks(target_version):
 
     INFO("Validating client target version")
     client_target_verion = (
-        subprocess.check_output(
+        local_check_output(
             ["weka", "cluster", "client-target-version", "show"] # 4.2+
         )
         .decode()
@@ -772,7 +1247,7 @@ def weka_cluster_checks(target_version):
         GOOD("All clients hosts are up to date")
 
     INFO("VERIFYING WEKA PROCESS STATUS")
-    weka_nodes = json.loads(subprocess.check_output(["weka", "cluster", "nodes", "-J"]))
+    weka_nodes = weka_json(["weka", "cluster", "nodes", "-J"])
     down_node = []
     for node in weka_nodes:
         if node["status"] != "UP":
@@ -790,15 +1265,11 @@ def weka_cluster_checks(target_version):
         WARN2(f"Failed WEKA processes detected\n")
         printlist(down_node, 5)
 
-    obj_store_enabled = json.loads(
-        subprocess.check_output(["weka", "fs", "tier", "s3", "-J"])
-    )
+    obj_store_enabled = weka_json(["weka", "fs", "tier", "s3", "-J"])
 
     # need to check element names
     INFO("VERIFYING WEKA FS SNAPSHOTS UPLOAD STATUS")
-    weka_snapshot = json.loads(
-        subprocess.check_output(["weka", "fs", "snapshot", "-J"])
-    )
+    weka_snapshot = weka_json(["weka", "fs", "snapshot", "-J"])
     snap_upload = []
     for snapshot in weka_snapshot:
         if snapshot["remoteStowInfo"]["stowStatus"] == "UPLOADING":
@@ -818,17 +1289,15 @@ def weka_cluster_checks(target_version):
 
     if V("4.2.12") <= V(target_version) <= V("4.4"):
         INFO("VERIFYING SNAPSHOT BUCKET COUNT")
-        snap_layers = json.loads(
-            subprocess.check_output(
-                [
-                    "weka",
-                    "debug",
-                    "config",
-                    "show",
-                    "snapLayers[*].stowInfo.LOCAL.bucketsNum",
-                    "-J",
-                ]
-            )
+        snap_layers = weka_json(
+            [
+                "weka",
+                "debug",
+                "config",
+                "show",
+                "snapLayers[*].stowInfo.LOCAL.bucketsNum",
+                "-J",
+            ]
         )
         unique_snap_layers = list(set(snap_layers))
         snap_result = any(x != weka_buckets and x != 0 for x in unique_snap_layers)
@@ -843,12 +1312,12 @@ def weka_cluster_checks(target_version):
     spinner.start()
     backend_ips = [*{bkhost.ip for bkhost in backend_hosts}]
     cmd = ["weka", "cluster", "container", "info-hw", "-J"]
-    host_hw_info = json.loads(subprocess.check_output(cmd + backend_ips))
+    host_hw_info = weka_json(cmd + backend_ips)
     spinner.stop()
 
 
     INFO("CHECKING FOR SMALL WEKA FILE SYSTEMS")
-    wekafs = json.loads(subprocess.check_output(["weka", "fs", "-J"]))
+    wekafs = weka_json(["weka", "fs", "-J"])
     small_wekafs = []
     for fs in wekafs:
         if fs["available_total"] < 1073741824:
@@ -927,9 +1396,7 @@ def weka_cluster_checks(target_version):
 
 
     INFO("VERIFYING WEKA CLUSTER DRIVE STATUS")
-    weka_drives = json.loads(
-        subprocess.check_output(["weka", "cluster", "drive", "-J"])
-    )
+    weka_drives = weka_json(["weka", "cluster", "drive", "-J"])
     bad_drive = []
     for drive in weka_drives:
         if drive["status"] != "ACTIVE":
@@ -967,9 +1434,7 @@ def weka_cluster_checks(target_version):
 
     if V("4.0") <= V(weka_version) < V("4.2.1"):
         INFO("VERIFYING DRIVES CONFIGURATION")
-        weka_drives = json.loads(
-            subprocess.check_output(["weka", "debug", "config", "show", "disks"])
-        )
+        weka_drives = weka_json(["weka", "debug", "config", "show", "disks"])
         fake_drives = []
         for disk_id, drive in weka_drives.items():
             target_state = drive["_targetState"]["state"]
@@ -1071,9 +1536,7 @@ def weka_cluster_checks(target_version):
         GOOD(f"No misconfigured core ids found.")
 
     INFO("VERIFYING WEKA TRACES STATUS")
-    weka_traces = json.loads(
-        subprocess.check_output(["weka", "debug", "traces", "status", "-J"]) # 3.10+
-    )
+    weka_traces = weka_json(["weka", "debug", "traces", "status", "-J"])  # 3.10+
     if weka_traces["enabled"]:
         GOOD(f"WEKA traces are enabled")
     else:
@@ -1083,9 +1546,7 @@ def weka_cluster_checks(target_version):
 
     INFO("CHECKING FOR MANUAL WEKA OVERRIDES")
     override_list = []
-    manual_overrides = json.loads(
-        subprocess.check_output(["weka", "debug", "override", "list", "-J"]) # 3.9+
-    )
+    manual_overrides = weka_json(["weka", "debug", "override", "list", "-J"])  # 3.9+
     if manual_overrides:
         WARN("Manual WEKA overrides found\n")
         for override in manual_overrides:
@@ -1106,11 +1567,7 @@ def weka_cluster_checks(target_version):
 
     # WEKAPP-578864
     try:
-        catalog = json.loads(
-            subprocess.check_output(["weka", "debug", "config", "show", "catalogInfo"],
-                stderr=subprocess.DEVNULL
-            )
-        )
+        catalog = weka_json(["weka", "debug", "config", "show", "catalogInfo"], stderr=subprocess.DEVNULL)
         INFO("CHECKING FOR WEKA CATALOG INDEXING ENABLED")
         if catalog.get("indexEnabled", False):
             BAD("Catalog indexing must be disabled before upgrades (weka catalog config update --index-enabled false).")
@@ -1122,9 +1579,7 @@ def weka_cluster_checks(target_version):
 
     INFO("CHECKING FOR WEKA CLUSTER TASKS")
     bg_task = []
-    cluster_tasks = json.loads(
-        subprocess.check_output(["weka", "cluster", "tasks", "-J"]) # 4.0+
-    )
+    cluster_tasks = weka_json(["weka", "cluster", "tasks", "-J"])  # 4.0+
 
     for task in cluster_tasks:
         if task["type"] not in ("FSCK", "RAID_SCANNER"):
@@ -1146,9 +1601,7 @@ def weka_cluster_checks(target_version):
         GOOD(f"No WEKA blacklisted nodes found")
     else:
         WARN(f"WEKA blacklisted nodes found\n")
-        blacklist_list = json.loads(
-            subprocess.check_output(["weka", "debug", "blacklist", "list", "-J"])
-        )
+        blacklist_list = weka_json(["weka", "debug", "blacklist", "list", "-J"])
         for nodes in blacklist_list:
             blacklist += [
                 nodes["node_id"],
@@ -1163,9 +1616,7 @@ def weka_cluster_checks(target_version):
 
     if V(weka_version) < V("4.2.7"):
         INFO("CHECKING WEKA STATS RETENTION")
-        stats_retention = json.loads(
-            subprocess.check_output(["weka", "stats", "retention", "status", "-J"])
-        )
+        stats_retention = weka_json(["weka", "stats", "retention", "status", "-J"])
         if stats_retention["retention_secs"] <= 172800:
             GOOD("WEKA stats retention settings are set correctly")
         else:
@@ -1212,9 +1663,7 @@ def weka_cluster_checks(target_version):
 
     s3_status = False
 
-    s3_cluster_status = json.loads(
-        subprocess.check_output(["weka", "s3", "cluster", "-J"])
-    )
+    s3_cluster_status = weka_json(["weka", "s3", "cluster", "-J"])
 
     s3_status = s3_cluster_status["active"] # 3.13+
 
@@ -1222,9 +1671,7 @@ def weka_cluster_checks(target_version):
         bad_s3_hosts = []
         failed_s3host = []
         INFO("CHECKING WEKA S3 CLUSTER HEALTH")
-        s3_cluster_hosts = json.loads(
-            subprocess.check_output(["weka", "s3", "cluster", "status", "-J"])
-        )
+        s3_cluster_hosts = weka_json(["weka", "s3", "cluster", "status", "-J"])
         if V(weka_version) < V("4.3.5.105"):
             for host, status in s3_cluster_hosts.items():
                 if not status:
@@ -1256,9 +1703,7 @@ def weka_cluster_checks(target_version):
 
     if s3_status:
         INFO("CHECKING WEKA S3 MOUNT OPTIONS")
-        s3_mount_options = json.loads(
-            subprocess.check_output(["weka", "s3", "cluster", "-J"])
-        )
+        s3_mount_options = weka_json(["weka", "s3", "cluster", "-J"])
         mount_options = s3_mount_options["mount_options"]
         if "writecache" in mount_options:
             WARN(f'S3 mount options set incorrectly, update mount options using "weka s3 cluster update --mount-options readcache -f"')
@@ -1269,10 +1714,7 @@ def weka_cluster_checks(target_version):
         if V(target_version) >= V("4.4.9"):
             INFO("CHECKING WEKA S3 BUCKET LIFECYCLE RULES COMPLIANCE")
             try:
-                bucket_list_output = subprocess.check_output(
-                    ["weka", "s3", "bucket", "list", "-J"], text=True
-                )
-                buckets = json.loads(bucket_list_output)
+                buckets = weka_json(["weka", "s3", "bucket", "list", "-J"])
             except subprocess.CalledProcessError as e:
                 WARN(f"Failed to list S3 buckets for lifecycle-rule check: {e}")
                 buckets = []
@@ -1283,12 +1725,10 @@ def weka_cluster_checks(target_version):
             for bucket in buckets:
                 bucket_name = bucket.get("name")
                 try:
-                    lifecycle_output = subprocess.check_output(
+                    rules = weka_json(
                         ["weka", "s3", "bucket", "lifecycle-rule", "list", bucket_name, "-J"],
-                        text=True,
-                        stderr=subprocess.STDOUT
+                        stderr=subprocess.STDOUT,
                     )
-                    rules = json.loads(lifecycle_output)
                     rule_count = len(rules)
                     global_rule_count += rule_count
 
@@ -1327,12 +1767,7 @@ def weka_cluster_checks(target_version):
     # NFS CHECKS #
     ##############
     try:
-        nfs_server_hosts = json.loads(
-            subprocess.check_output(
-                ["weka", "nfs", "interface-group", "-J"],
-                stderr=subprocess.DEVNULL
-            )
-        )
+        nfs_server_hosts = weka_json(["weka", "nfs", "interface-group", "-J"], stderr=subprocess.DEVNULL)
     except (subprocess.CalledProcessError, json.JSONDecodeError):
         nfs_server_hosts = []
 
@@ -1344,19 +1779,14 @@ def weka_cluster_checks(target_version):
         if V(target_version) < V("4.4.3"):
             if len(nfs_server_hosts) != 0:
                 INFO("CHECKING WEKA NFS CUSTOM OPTIONS")
-                custom_options = json.loads(
-                    subprocess.check_output(["weka", "nfs", "custom-options", "-J"])
-                )
+                custom_options = weka_json(["weka", "nfs", "custom-options", "-J"])
                 if custom_options["customNfsOptions"]:
                     BAD(f"Custom NFS options specified -- please review with WEKA Customer Success")
                 else:
                     GOOD(f"No custom NFS options specified")
 
         INFO("CHECKING WEKA NFS CONFIG FS")
-        output = subprocess.check_output(
-            ["weka", "nfs", "global-config", "show", "-J"], text=True
-        )
-        config = json.loads(output)
+        config = weka_json(["weka", "nfs", "global-config", "show", "-J"])
 
         if config.get("config_fs") is None:
                 WARN("NFS global-config missing 'config_fs' entry")
@@ -1424,11 +1854,7 @@ def weka_cluster_checks(target_version):
 
         cx4_found = False
         try:
-            net_entries = json.loads(
-                subprocess.check_output(
-                    ["weka", "cluster", "container", "net", "-J"], text=True
-                )
-            )
+            net_entries = weka_json(["weka", "cluster", "container", "net", "-J"])
             for entry in net_entries:
                 for dev in entry.get("net_devices") or []:
                     if "connectx-4" in (dev.get("device") or "").lower():
@@ -1448,19 +1874,14 @@ def weka_cluster_checks(target_version):
     # Added 2026-02-19
     #  Known issue if taskmon.home.weka.io endpoint is offline (WEKAPP-594061)
     if V("5.1.2") > V(weka_version) >= V("5.0.1"):
-        output = subprocess.check_output(
-            ["weka", "debug", "traces", "remote-endpoint", "status", "-J"], text=True
-        )
-        config = json.loads(output)
+        config = weka_json(["weka", "debug", "traces", "remote-endpoint", "status", "-J"])
         if config.get("enabled"):
             INFO("CHECKING IF REMOTE TRACES ARE ENABLED")
             BAD("Remote traces are enabled. It is recommended that they be disabled by running: " \
                 "weka debug traces remote-endpoint disable")
 
 
-    orgs = json.loads(
-        subprocess.check_output(["weka", "org", "-J"])
-    )
+    orgs = weka_json(["weka", "org", "-J"])
     multi_org = len(orgs) > 1
 
     return ClusterCheckResults(
@@ -1752,10 +2173,7 @@ def weka_agent_unit_type(host_name, result):
 
 def get_rpc_max_connections():
     try:
-        output = subprocess.check_output(
-            ["weka", "nfs", "custom-options", "-J"], text=True
-        )
-        data = json.loads(output)
+        data = weka_json(["weka", "nfs", "custom-options", "-J"])
         # If JSON is null, empty, or not a dict → return default
         if not isinstance(data, dict):
             return 1024
@@ -1811,8 +2229,12 @@ def weka_agent_check(host_name, result):
 
 def time_check(host_name, result):
     current_time = result
-    local_lime = int(time.time())
-    if abs(int(current_time) - local_lime) > 60:
+    # Captured next to the host's clock, so a replay compares against the local clock of the recording
+    local_time = command_capture.value(["local_time", host_name], time.time)
+    if local_time is None:
+        WARN(f"Unable to determine local time to compare with host: {host_name}")
+        return
+    if abs(int(current_time) - int(local_time)) > 60:
         BAD(f"Time difference greater than 60s on host: {host_name}")
     else:
         GOOD(f"Time check passed on host: {host_name}")
@@ -1971,20 +2393,16 @@ def frontend_check(host_name, result):
 def protocol_host(backend_hosts, s3_enabled, weka_version):
     S3 = []
     global weka_s3, weka_nfs, weka_smb
-    s3_enabled = json.loads(subprocess.check_output(["weka", "s3", "cluster", "-J"]))
+    s3_enabled = weka_json(["weka", "s3", "cluster", "-J"])
     if s3_enabled:
-        weka_s3 = json.loads(
-            subprocess.check_output(["weka", "s3", "cluster", "-J"])
-        )
+        weka_s3 = weka_json(["weka", "s3", "cluster", "-J"])
         if weka_s3:
             S3 = list(weka_s3["s3_hosts"]) if weka_s3 != [] else []
 
-    weka_smb = json.loads(subprocess.check_output(["weka", "smb", "cluster", "-J"]))
+    weka_smb = weka_json(["weka", "smb", "cluster", "-J"])
     SMB = list(weka_smb["sambaHosts"]) if weka_smb != [] else []
     NFS = []
-    weka_nfs = json.loads(
-        subprocess.check_output(["weka", "nfs", "interface-group", "-J"])
-    )
+    weka_nfs = weka_json(["weka", "nfs", "interface-group", "-J"])
     if weka_nfs:
         unique_host_ids = {
             hid["host_id"] for host_id in weka_nfs for hid in host_id["ports"]
@@ -2179,9 +2597,7 @@ def fallocate_check(host_name, result):
 
 
 def weka_traces_size(host_name, result):
-    weka_trace_status = json.loads(
-        subprocess.check_output(["weka", "debug", "traces", "status", "-J"])
-    )
+    weka_trace_status = weka_json(["weka", "debug", "traces", "status", "-J"])
     weka_trace_ensure_free = weka_trace_status["servers_ensure_free"]["value"]
     INFO2(f'{" " * 2}Checking free space for WEKA traces on Host: {host_name}:')
     if weka_trace_ensure_free > int(result) * 1024:
@@ -2217,56 +2633,40 @@ def check_os_kernel(host_name, result):
 
 
 def check_kernel_arguments(host_name, result, target_weka_version):
-    known_issues = {}
     found_any_problem = False
 
     try:
-        with open(known_issues_file, "r") as file:
-            known_issues = json.load(file)
+        index = load_known_issue_index()
     except FileNotFoundError:
         WARN(f"Error: {known_issues_file} not found.")
         return
     except json.JSONDecodeError:
         WARN(f"Error: {known_issues_file} contains invalid JSON.")
         return
-   
+    except ValueError as e:
+        WARN(f"Error: {e}")
+        return
+
     current_kernel_arguments = result.split()
- 
-    for key, issue in known_issues.items():
-        if issue.get("problematic_kernel_arguments"):
-            problematic_kernel_arguments = issue['problematic_kernel_arguments']
 
-            for vrange in issue.get("affected_versions", []):
-                vmin = vrange.get("min")
-                vmax = vrange.get("max")
+    for key in index.keys_of(index.affecting(target_weka_version) & index.kernel_mask):
+        issue = index.issue(key)
+        description = issue['description']
+        internal_reference = issue['internal_reference']
 
-                # Determine whether version falls in this affected range
-                if vmax:
-                    # Standard closed-open range: [min, max)
-                    min_ok = (not vmin) or V(target_weka_version) >= V(vmin)
-                    max_ok = V(target_weka_version) < V(vmax)
-                else:
-                    # No max → affected if version <= min
-                    min_ok = V(target_weka_version) >= V(vmin)
-                    max_ok = True
-
-                if min_ok and max_ok:
-                    description = issue['description']
-                    internal_reference = issue['internal_reference']
-
-                    for problematic_kernel_argument in problematic_kernel_arguments:
-                        if problematic_kernel_argument in current_kernel_arguments:
-                            BAD(
-                                f"Host {host_name} kernel has been booted with "
-                                f"'{problematic_kernel_argument}', which is affected by: {description}. "
-                                f"Contact Customer Success and refer to {internal_reference}."
-                               )
-                            found_any_problem = True
-                        else:
-                            GOOD(
-                                 f"Host {host_name} kernel does not feature "
-                                 f"'{problematic_kernel_argument}'."
-                                )
+        for problematic_kernel_argument in issue['problematic_kernel_arguments']:
+            if problematic_kernel_argument in current_kernel_arguments:
+                BAD(
+                    f"Host {host_name} kernel has been booted with "
+                    f"'{problematic_kernel_argument}', which is affected by: {description}. "
+                    f"Contact Customer Success and refer to {internal_reference}."
+                   )
+                found_any_problem = True
+            else:
+                GOOD(
+                     f"Host {host_name} kernel does not feature "
+                     f"'{problematic_kernel_argument}'."
+                    )
 
     if not found_any_problem:
         GOOD(f"Host {host_name} kernel arguments do not contain any known problematic values for WEKA version {target_weka_version}.")
@@ -2408,15 +2808,205 @@ def check_cpu_frequency(host_name, cpu_info_output, core_ids):
         # This helps debug if parsing failed entirely for a host
         WARN(f"Host: {host_name} - Could not verify frequency for assigned cores: {core_ids}")
 
-def parallel_execution(
+def _host_display_name(host):
+    if isinstance(host, dict):
+        return host.get("hostname") or host.get("name") or host.get("ip", "unknown")
+    return host
+
+
+class RemoteDeadlineExceeded(Exception):
+    """A remote command was still running when its call's deadline expired."""
+
+
+# One remote command of a parallel_execution() call.
+RemoteJob = namedtuple("RemoteJob", ["host_name", "host_ip", "command"])
+
+
+class AsyncRemoteExecutor:
+    """Run remote commands as asyncio subprocesses with bounded concurrency.
+
+    A single event loop drives every ssh process of a parallel_execution() call,
+    so thousands of hosts are handled from one thread instead of in waves of
+    pool workers. Each command has its own timeout, and at most ``max_output``
+    bytes of each of its output streams are kept (the rest is drained and
+    dropped) so memory stays bounded however much a host prints.
+    """
+
+    def __init__(
+        self, concurrency=256, timeout=300, max_output=16 * 1024 * 1024, deadline=None
+    ):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_output = max_output
+        # Wall-clock limit, in seconds, for one parallel_execution() call as a whole.
+        self.deadline = deadline
+
+    async def _read_bounded(self, stream, job):
+        chunks = []
+        size = 0
+        while True:
+            chunk = await stream.read(65536)
+            if not chunk:
+                break
+            if size < self.max_output:
+                chunks.append(chunk[: self.max_output - size])
+            size += len(chunk)
+        if size > self.max_output:
+            logging.warning(
+                f"Host {job.host_name}: output of '{job.command.strip()[:60]}' truncated "
+                f"from {size} to {self.max_output} bytes"
+            )
+        return b"".join(chunks)
+
+    async def _exec(self, semaphore, job, make_argv, env):
+        async with semaphore:
+            started = time.monotonic()
+            try:
+                returncode, stdout, stderr = await self._exec_one(job, make_argv, env)
+            except asyncio.TimeoutError:
+                # A host that hits the timeout is exactly what the report should show.
+                check_profiler.record_remote(
+                    job.host_name,
+                    time.monotonic() - started,
+                    len(job.command.encode("utf-8")),
+                    0,
+                    failed=True,
+                )
+                raise
+            check_profiler.record_remote(
+                job.host_name,
+                time.monotonic() - started,
+                len(job.command.encode("utf-8")),
+                len(stdout) + len(stderr),
+                failed=returncode != 0,
+            )
+            return returncode, stdout, stderr
+
+    async def _exec_one(self, job, make_argv, env):
+        key = ["ssh", job.host_ip, job.command]
+        if command_capture.mode == "replay":
+            return command_capture.lookup(key)
+
+        # Build argv only once a slot is free, so SSH connection reuse is
+        # accounted against the state of the host's master at spawn time.
+        argv = make_argv(job)
+        proc = await asyncio.create_subprocess_exec(
+            *argv,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=env,
+        )
+        try:
+            stdout, stderr, _ = await asyncio.wait_for(
+                asyncio.gather(
+                    self._read_bounded(proc.stdout, job),
+                    self._read_bounded(proc.stderr, job),
+                    proc.wait(),
+                ),
+                self.timeout,
+            )
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            proc.kill()
+            await proc.wait()
+            raise
+
+        command_capture.record(key, proc.returncode, stdout, stderr)
+        return proc.returncode, stdout, stderr
+
+    def stream(self, jobs, make_argv, env=None, deadline=None):
+        """Yield (job, (returncode, stdout, stderr) or exception) as each job finishes.
+
+        The event loop runs in a helper thread, so the caller can evaluate a
+        host's result while slower hosts are still running. When *deadline*
+        seconds have passed, the jobs still running are killed and yielded with a
+        RemoteDeadlineExceeded outcome instead of being waited for.
+        """
+        if not jobs:
+            return
+
+        finished = queue.Queue()
+        tasks = []
+        loop = asyncio.new_event_loop()
+
+        async def run_one(semaphore, index, job):
+            try:
+                outcome = await self._exec(semaphore, job, make_argv, env)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                outcome = exc
+            finished.put((index, outcome))
+
+        async def run_all():
+            semaphore = asyncio.Semaphore(self.concurrency)
+            tasks.extend(
+                loop.create_task(run_one(semaphore, index, job))
+                for index, job in enumerate(jobs)
+            )
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        def cancel_all():
+            for task in tasks:
+                task.cancel()
+
+        worker = threading.Thread(target=loop.run_until_complete, args=(run_all(),))
+        worker.daemon = True
+        worker.start()
+
+        pending = set(range(len(jobs)))
+        end = time.monotonic() + deadline if deadline else None
+        try:
+            while pending:
+                wait = None if end is None else end - time.monotonic()
+                if wait is not None and wait <= 0:
+                    break
+                try:
+                    index, outcome = finished.get(timeout=wait)
+                except queue.Empty:
+                    break
+                pending.discard(index)
+                yield jobs[index], outcome
+        finally:
+            if pending:
+                loop.call_soon_threadsafe(cancel_all)
+            worker.join()
+            loop.close()
+
+        # Jobs that completed while the stragglers were being cancelled still count.
+        while not finished.empty():
+            index, outcome = finished.get()
+            pending.discard(index)
+            yield jobs[index], outcome
+        for index in sorted(pending):
+            yield jobs[index], RemoteDeadlineExceeded(deadline)
+
+    def run(self, jobs, make_argv, env=None, deadline=None):
+        """Run *jobs*; return [(job, (returncode, stdout, stderr) or exception)] in completion order."""
+        return list(self.stream(jobs, make_argv, env, deadline))
+
+
+remote_executor = AsyncRemoteExecutor()
+
+
+def iter_parallel_execution(
     hosts,
     commands,
     use_check_output=True,
     use_json=False,
     use_call=False,
     ssh_identity=None,
+    deadline=None,
 ):
-    results = []
+    """Yield (host_name, result) for each host command as soon as it finishes.
+
+    Results come in completion order, so evaluating the fast hosts never waits
+    on a slow one. Hosts still running when the deadline (default: the
+    --remote-deadline setting) expires are reported as timed out and skipped.
+    """
+    if deadline is None:
+        deadline = remote_executor.deadline
+
     spinner = Spinner("  Retrieving Data  ", color=colors.OKCYAN)
     spinner.start()
 
@@ -2433,119 +3023,229 @@ def parallel_execution(
     if ssh_identity:
         ssh_opts += [["-i", ssh_identity]]
 
+    ssh_opts_flat = list(itertools.chain(*ssh_opts))
+
     # System ssh must not inherit PyInstaller's LD_LIBRARY_PATH (see helper).
     ssh_env = _clean_subprocess_env()
 
-    def run_command(host, command, use_check_output, use_json, use_call, ssh_opts):
-        if isinstance(host, dict):
-            host_ip = host["ip"]
-            host_name = (
-                host.get("hostname") or host.get("name") or host.get("ip", "unknown")
-            )
-        else:
-            host_ip = host
-            host_name = host
+    def make_argv(job):
+        return ["ssh"] + ssh_opts_flat + ssh_pool.options(job.host_ip) + [job.host_ip, job.command]
 
-        ssh_opts_flat = list(itertools.chain(*ssh_opts))
+    jobs = [
+        RemoteJob(
+            _host_display_name(host),
+            host["ip"] if isinstance(host, dict) else host,
+            command,
+        )
+        for host in hosts
+        for command in commands
+    ]
 
-        if use_check_output:
-            result = (
-                subprocess.check_output(
-                    ["ssh"] + ssh_opts_flat + [host_ip, command], env=ssh_env
+    def to_result(job, returncode, stdout, stderr):
+        if use_check_output or use_json:
+            if stderr:
+                sys.stderr.write(stderr.decode("utf-8", errors="replace"))
+            if returncode != 0:
+                raise subprocess.CalledProcessError(
+                    returncode, ["ssh", job.host_ip, job.command], output=stdout
                 )
-                .decode("utf-8")
-                .strip()
-            )
-        elif use_json:
-            result = json.loads(
-                subprocess.check_output(
-                    ["ssh"] + ssh_opts_flat + [host_ip, command], env=ssh_env
-                )
-                .decode("utf-8")
-                .strip()
-            )
+            result = stdout.decode("utf-8").strip()
+            if use_json:
+                result = json.loads(result)
         elif use_call:
-            result = subprocess.call(
-                ["ssh"] + ssh_opts_flat + [host_ip, command],
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.STDOUT,
-                env=ssh_env,
-            )
+            result = returncode
         else:
-            result = subprocess.run(
-                ["ssh"] + ssh_opts_flat + [host_ip, command],
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.STDOUT,
-                env=ssh_env,
+            result = subprocess.CompletedProcess(
+                ["ssh", job.host_ip, job.command], returncode
             )
-        return host_name, result
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=50) as executor:
-        future_to_host = {
-            executor.submit(
-                run_command,
-                host,
-                command,
-                use_check_output,
-                use_json,
-                use_call,
-                ssh_opts,
-            ): host
-            for host in hosts
-            for command in commands
-        }
-        for future in concurrent.futures.as_completed(future_to_host):
-            host = future_to_host[future]
-            try:
-                result = future.result()
-                results.append(result)
-            except Exception as exc:
-                host_name = (
-                    host.get("hostname")
-                    or host.get("name")
-                    or host.get("ip", "unknown")
-                    if isinstance(host, dict)
-                    else host
-                )
-                WARN(f"Unable to determine Host: {host_name} results")
+        return result
+
+    spinning = True
+    for job, outcome in remote_executor.stream(jobs, make_argv, ssh_env, deadline):
+        if spinning:
+            # Results are printed as they arrive from here on, which shows progress.
+            spinner.stop()
+            spinning = False
+        if isinstance(outcome, RemoteDeadlineExceeded):
+            WARN(f"Host: {job.host_name} timed out, no result within {deadline}s")
+            continue
+        if isinstance(outcome, asyncio.TimeoutError):
+            WARN(
+                f"Host: {job.host_name} did not respond within {remote_executor.timeout}s"
+            )
+            continue
+        try:
+            if isinstance(outcome, Exception):
+                raise outcome
+            result = to_result(job, *outcome)
+        except Exception as exc:
+            WARN(f"Unable to determine Host: {job.host_name} results: {exc}")
+            continue
+        yield job.host_name, result
 
-    spinner.stop()
-    return results
+    if spinning:
+        spinner.stop()
 
 
-# backend checks
-def backend_host_checks(
-    backend_hosts,
-    ssh_bk_hosts,
-    weka_version,
-    backend_ips,
-    ssh_identity,
-    s3_enabled,
-    target_version,
-    check_rhel_systemd_hosts,
-    good_nfs_hosts,
-    multi_org
+def parallel_execution(
+    hosts,
+    commands,
+    use_check_output=True,
+    use_json=False,
+    use_call=False,
+    ssh_identity=None,
+    deadline=None,
 ):
-    INFO("CHECKING PASSWORDLESS SSH CONNECTIVITY")
-    results = parallel_execution(
-        ssh_bk_hosts,
-        ["/bin/true"],
-        use_check_output=False,
-        use_call=True,
-        ssh_identity=ssh_identity,
+    return list(
+        iter_parallel_execution(
+            hosts,
+            commands,
+            use_check_output=use_check_output,
+            use_json=use_json,
+            use_call=use_call,
+            ssh_identity=ssh_identity,
+            deadline=deadline,
+        )
     )
-    for host_name, result in results:
-        if result is not None:
-            ssh_bk_hosts = ssh_check(host_name, result, ssh_bk_hosts)
-        else:
-            WARN(f"Unable to determine SSH connectivity on Host: {host_name}")
 
-    if len(ssh_bk_hosts) == 0:
-        BAD(f"Unable to proceed, passwordless SSH not configured on any host")
-        sys.exit(1)
 
-    INFO("CHECKING IF OS IS SUPPORTED ON BACKENDS")
-    command = r"""
+# Remote probes: a named shell snippet plus how its output is consumed
+# ("output" = stripped stdout, "json" = parsed stdout, "call" = exit status).
+# A probe with several commands yields one result per command per host, exactly
+# like passing several commands to parallel_execution().
+HostProbe = namedtuple("HostProbe", ["name", "commands", "mode"])
+
+_PROBE_MODES = {
+    "output": dict(use_check_output=True),
+    "json": dict(use_check_output=False, use_json=True),
+    "call": dict(use_check_output=False, use_call=True),
+}
+
+
+def build_probe_script(probes):
+    """Build one remote shell script that runs every probe and prints a JSON document.
+
+    Each command runs in its own bash with stdin closed. Its exit status and
+    base64-encoded stdout are stored under "<probe name>#<command index>", so any
+    output survives the JSON envelope without escaping on the remote side.
+    """
+    lines = ['t=$(mktemp) || exit 1', "trap 'rm -f \"$t\"' EXIT", "printf '{'"]
+    sep = ""
+    for probe in probes:
+        for index, command in enumerate(probe.commands):
+            encoded = base64.b64encode(command.encode("utf-8")).decode("ascii")
+            lines.append(
+                f'bash -c "$(echo {encoded} | base64 -d)" >"$t" 2>/dev/null </dev/null; rc=$?'
+            )
+            lines.append(
+                f"printf '%s\"{probe.name}#{index}\":{{\"rc\":%d,\"out\":\"%s\"}}' "
+                f"'{sep}' \"$rc\" \"$(base64 -w0 <\"$t\")\""
+            )
+            sep = ","
+    lines.append("printf '}'")
+    return "\n".join(lines)
+
+
+def collect_host_probes(hosts, probes, ssh_identity=None):
+    """Run all *probes* on every host in a single SSH round trip per host.
+
+    Returns {host key: {"<probe>#<index>": (rc, stdout bytes)}}. Each host is
+    indexed by both the address ssh connected to and its display name, so that
+    probe_results() can serve host lists that identify hosts either way.
+    """
+    addresses = {}
+    for host in hosts:
+        addresses[_host_display_name(host)] = host["ip"] if isinstance(host, dict) else host
+
+    batch = {}
+    results = parallel_execution(
+        hosts,
+        [build_probe_script(probes)],
+        use_check_output=True,
+        ssh_identity=ssh_identity,
+    )
+    for host_name, result in results:
+        try:
+            entries = {
+                key: (entry["rc"], base64.b64decode(entry["out"]))
+                for key, entry in json.loads(result).items()
+            }
+        except (ValueError, KeyError, TypeError, AttributeError):
+            WARN(f"Unable to parse batched probe results from Host: {host_name}")
+            continue
+        batch[host_name] = entries
+        batch[addresses.get(host_name, host_name)] = entries
+
+    return batch
+
+
+def _batched_host_entries(batch, host):
+    if isinstance(host, dict):
+        keys = (host.get("ip"), host.get("hostname"), host.get("name"))
+    else:
+        keys = (host,)
+    for key in keys:
+        if key in batch:
+            return batch[key]
+    return None
+
+
+def iter_probe_results(probe, hosts, batch=None, ssh_identity=None):
+    """Yield *probe*'s results in the shape iter_parallel_execution() produces.
+
+    Hosts covered by *batch* are answered locally from the collected document
+    and come first. Any other host (not batched, or its document could not be
+    parsed) is probed individually over SSH, its results streamed as they arrive.
+    """
+    remaining = []
+    for host in hosts:
+        entries = _batched_host_entries(batch, host) if batch else None
+        keys = [f"{probe.name}#{index}" for index in range(len(probe.commands))]
+        if entries is None or any(key not in entries for key in keys):
+            remaining.append(host)
+            continue
+
+        host_name = _host_display_name(host)
+        for key in keys:
+            rc, out = entries[key]
+            if probe.mode == "call":
+                yield host_name, rc
+                continue
+            if rc != 0:
+                # Same outcome as a failed check_output() in parallel_execution().
+                WARN(f"Unable to determine Host: {host_name} results")
+                continue
+            out = out.decode("utf-8", errors="replace").strip()
+            if probe.mode == "json":
+                try:
+                    out = json.loads(out)
+                except ValueError:
+                    WARN(f"Unable to determine Host: {host_name} results")
+                    continue
+            yield host_name, out
+
+    if remaining:
+        yield from iter_parallel_execution(
+            remaining,
+            probe.commands,
+            ssh_identity=ssh_identity,
+            **_PROBE_MODES[probe.mode],
+        )
+
+
+def probe_results(probe, hosts, batch=None, ssh_identity=None):
+    """Return *probe*'s results in the shape parallel_execution() produces."""
+    return list(iter_probe_results(probe, hosts, batch, ssh_identity))
+
+
+def backend_host_probes(weka_version, target_version, api_ip=None, api_ports=()):
+    """Remote probes used by backend_host_checks(), keyed by probe name.
+
+    Version-dependent probes are only present when their check applies.
+    """
+    probes = []
+
+    probes.append(HostProbe("os_release", [r"""
     echo "WEKA_KERNEL=$(uname -r)";
     echo "WEKA_ARCH=$(uname -m)";
     OS=$(sudo awk -F= '/^ID=/ {gsub(/"/, "", $2); print $2}' /etc/os-release);
@@ -2554,74 +3254,19 @@ def backend_host_checks(
     else
         sudo cat /etc/os-release;
     fi
-    """
-    results = parallel_execution(
-        ssh_bk_hosts,
-        [command],
-        use_check_output=True,
-        ssh_identity=ssh_identity,
-    )
-    for host_name, result in results:
-        if result is not None:
-            check_os_release(
-                host_name, result, target_version, backend=True
-            )
-        else:
-            WARN(f"Unable to determine Host: {host_name} OS version")
+    """], "output"))
 
-    relevant_hosts = [host for host in check_rhel_systemd_hosts]
-
-    if check_rhel_systemd_hosts:
-        INFO("CHECKING WEKA AGENT SERVICE TYPE")
-        command = r"""
+    probes.append(HostProbe("agent_unit_type", [r"""
         if [ -f "/etc/init.d/weka-agent" ]; then
             echo "SRV=init.d";
         else
             echo "SRV=systemd";
         fi
-        """
-        results = parallel_execution(
-            relevant_hosts,
-            [command],
-            use_check_output=True,
-            ssh_identity=ssh_identity,
-        )
-        for host_name, result in results:
-            if result is not None:
-                weka_agent_unit_type(host_name, result)
-            else:
-                WARN(
-                    f"Unable to determine Host: {host_name} WEKA agent service unit type"
-                )
-
-    connection_counts = {}
+        """], "output"))
 
-    if good_nfs_hosts:
-        INFO("CHECKING NUMBER OF NFS CONNECTIONS ON BACKENDS")
-        command = r"ss --no-header -t sport = :2049 | wc -l"
-        results = parallel_execution(
-            good_nfs_hosts,
-            [command],
-            use_check_output=True,
-            ssh_identity=ssh_identity,
-        )
+    probes.append(HostProbe("nfs_connections", [r"ss --no-header -t sport = :2049 | wc -l"], "output"))
 
-        for host_name, result in results:
-            if result is not None:
-                try:
-                    count = int(result.strip())
-                    connection_counts[host_name] = count
-                except ValueError:
-                    WARN(f"Invalid connection count from {host_name}: {result}")
-            else:
-                WARN(f"Unable to determine NFS connection count on host: {host_name}")
-
-    if connection_counts:
-        max_per_host = get_rpc_max_connections()
-        evaluate_nfs_failover_risk(connection_counts, max_per_host, good_nfs_hosts)
-
-    INFO("CHECKING WEKA AGENT STATUS ON BACKENDS")
-    command = r"""
+    probes.append(HostProbe("agent_status", [r"""
     if ! sudo service weka-agent status > /dev/null 2>&1; then
     # Fallback to checking with systemctl if the 'service' command fails
         if [ "$(sudo systemctl is-active weka-agent)" == "active" ]; then
@@ -2632,33 +3277,10 @@ def backend_host_checks(
     else
         echo "running"
     fi
-    """
-    results = parallel_execution(
-        ssh_bk_hosts,
-        [command],
-        use_check_output=True,
-        ssh_identity=ssh_identity,
-    )
-    for host_name, result in results:
-        if result is not None:
-            weka_agent_check(host_name, result)
-        else:
-            WARN(f"Unable to determine Host: {host_name} weka-agent status")
+    """], "output"))
 
-    INFO("CHECKING TIME DIFFERENCE ON BACKENDS")
-    results = parallel_execution(
-        ssh_bk_hosts,
-        ["date --utc +%s"],
-        use_check_output=True,
-        ssh_identity=ssh_identity,
-    )
-    for host_name, result in results:
-        if result is not None:
-            time_check(host_name, result)
-        else:
-            WARN(f"Unable to determine time on Host: {host_name}")
+    probes.append(HostProbe("time", ["date --utc +%s"], "output"))
 
-    INFO("CHECKING WEKA DATA DIRECTORY SPACE USAGE ON BACKENDS")
     # Match the product's upgrade preflight (agent ensure_available_space), which
     # checks EACH container individually: available space on the container data
     # dir's partition must exceed 1.5x that container's size. Enumeration runs on
@@ -2690,18 +3312,7 @@ def backend_host_checks(
         '[ -n "$avail" ] && [ -n "$used" ] && echo "$name:$avail:$used"; '
         "done"
     )
-
-    results = parallel_execution(
-        ssh_bk_hosts,
-        [data_check_cmd],
-        use_check_output=True,
-        ssh_identity=ssh_identity,
-    )
-    for host_name, result in results:
-        if result is None:
-            WARN(f"Unable to determine Host: {host_name} available space")
-
-    free_space_check_data(results)
+    probes.append(HostProbe("data_dir_space", [data_check_cmd], "output"))
 
     # WEKA 4.4.10+ and 5.1.0+ requires the filesystem backing /opt/weka to support fallocate.
     # Probe each backend with a benign 4 KiB allocation on a temp file under
@@ -2709,7 +3320,6 @@ def backend_host_checks(
     # outcome). A non-zero fallocate exit (e.g. EOPNOTSUPP on ext2/ext3, FAT, some
     # network filesystems) means the FS cannot back /opt/weka for this upgrade.
     if ( (V("4.4.10.171") <= V(target_version) < V("5.0.0")) or V(target_version) >= V("5.1.0")):
-        INFO("CHECKING FALLOCATE SUPPORT ON /opt/weka ON BACKENDS")
         fallocate_cmd = (
             'if ! command -v fallocate >/dev/null 2>&1; then echo "P=nobin"; exit 0; fi; '
             'f=$(sudo mktemp -p /opt/weka .upgrade_fallocate_check.XXXXXX 2>/dev/null); '
@@ -2717,25 +3327,238 @@ def backend_host_checks(
             'if sudo fallocate -l 4096 "$f" >/dev/null 2>&1; then echo "P=ok"; else echo "P=fail"; fi; '
             'sudo rm -f "$f"'
         )
-        results = parallel_execution(
-            ssh_bk_hosts,
-            [fallocate_cmd],
-            use_check_output=True,
-            ssh_identity=ssh_identity,
+        probes.append(HostProbe("fallocate", [fallocate_cmd], "output"))
+
+    probes.append(HostProbe("logs_space", ["df -m /opt/weka/logs/ | awk 'NR==2 {print $3, $4}'"], "output"))
+
+    probes.append(HostProbe("local_ps", ["weka local ps -J"], "json"))
+
+    probes.append(HostProbe("wekafs_mounts", ["sudo mount -t wekafs | awk '{print $1, $2, $3}'"], "output"))
+
+    probes.append(HostProbe("endpoint_ips", [
+        "container_name=$(weka local ps --no-header -o name| grep -E '(dataserv|drive|compute|frontend)'); for name in $container_name; do echo -en [{container: {$name}, ip: [; sudo weka local resources --stable --container $name -J | grep -w ip | awk '{print $2}' | tr '\n' ' '; echo -e ]}]; done"
+    ], "output"))
+
+    probes.append(HostProbe("join_secrets", [r"""
+    container_name=$(weka local ps --no-header -o name | grep -E '(dataserv|drive|compute|frontend)');
+    echo -n "{";
+    first=true;
+    for cname in $container_name; do
+        if [ "$first" = true ]; then first=false; else echo -n ","; fi
+        echo -n "\"$cname\":";
+
+        # Determine if Python or Python3 is available
+        python_cmd=""
+        if command -v python &>/dev/null; then
+            python_cmd="python"
+        elif command -v python3 &>/dev/null; then
+            python_cmd="python3"
+        else
+            echo "[]";
+            continue
+        fi
+
+        join_secret=$(sudo weka local resources -C "$cname" -J | $python_cmd -c 'import sys, json; resource = sys.stdin.read(); data = json.loads(resource); join_secret = data.get("join_secret", []); print(json.dumps(join_secret))')
+
+        echo -n "$join_secret"
+    done;
+    echo -n "}"
+    """], "output"))
+
+    probes.append(HostProbe("traces_space", ["df -BK /opt/weka/traces | awk 'NR==2 {print $2}' | sed s/K$//"], "output"))
+
+    probes.append(HostProbe("avx2", [r'grep "\<avx2\>" /proc/cpuinfo'], "output"))
+
+    if V("4.3.2") <= V(target_version) < V("4.4.6"):
+        probes.append(HostProbe("ipv6", ["test -f /proc/net/if_inet6"], "call"))
+
+    if V("4.2.6") <= V(weka_version) <= V("4.2.10"):
+        probes.append(HostProbe("os_kernel", [r"""
+        OS=$(sudo awk -F= '/^ID=/ {gsub(/"/, "", $2); print $2}' /etc/os-release);
+        if [[ $OS == rocky ]]; then
+            KV=$(sudo uname -r);
+            if [[ ! -z $(sudo grep "launder_folio" /usr/src/kernels/"${KV}"/include/linux/fs.h) ]]; then
+                echo "P=true";
+            else
+                echo "P=false";
+            fi;
+        else
+            echo "P=not_rocky";
+        fi
+        """], "output"))
+
+    probes.append(HostProbe("endpoint_status", [r"""
+    if sudo systemctl status falcon-sensor &> /dev/null; then
+        echo "P=running"
+    elif sudo lsmod | grep -q -m 1 falcon_lsm; then
+        echo "P=loaded"
+    else
+        echo "P=not_running"
+    fi
+    """], "output"))
+
+    if api_ip:
+        probes.append(HostProbe("api_ports", [
+            f"curl -sL --insecure https://[{api_ip}]:{port} -o /dev/null; echo $? {port}"
+            if ":" in api_ip
+            else f"curl -sL --insecure https://{api_ip}:{port} -o /dev/null; echo $? {port}"
+            for port in api_ports
+        ], "output"))
+
+    probes.append(HostProbe("kernel_args", [r"""
+        cat /proc/cmdline
+    """], "output"))
+
+    probes.append(HostProbe("available_memory", ['weka local ps --no-header | wc -l; free -h'], "output"))
+
+    probes.append(HostProbe("cpu_frequency", ["grep -E 'processor|cpu MHz' /proc/cpuinfo"], "output"))
+
+    return {probe.name: probe for probe in probes}
+
+
+# backend checks
+def backend_host_checks(
+    backend_hosts,
+    ssh_bk_hosts,
+    weka_version,
+    backend_ips,
+    ssh_identity,
+    s3_enabled,
+    target_version,
+    check_rhel_systemd_hosts,
+    good_nfs_hosts,
+    multi_org,
+    batch_probes=False,
+):
+    INFO("CHECKING PASSWORDLESS SSH CONNECTIVITY")
+    for host_name, result in iter_parallel_execution(
+        ssh_bk_hosts,
+        ["/bin/true"],
+        use_check_output=False,
+        use_call=True,
+        ssh_identity=ssh_identity,
+    ):
+        if result is not None:
+            ssh_bk_hosts = ssh_check(host_name, result, ssh_bk_hosts)
+        else:
+            WARN(f"Unable to determine SSH connectivity on Host: {host_name}")
+
+    if len(ssh_bk_hosts) == 0:
+        BAD(f"Unable to proceed, passwordless SSH not configured on any host")
+        sys.exit(1)
+
+    # The port connectivity probe targets the API ports of this host's local
+    # containers, so resolve them before the probe set is built.
+    api_ports = []
+    ips = []
+
+    con_status = weka_json(["weka", "local", "status", "-J"])
+
+    for container in con_status:
+        if con_status[container]["type"] == "weka":
+            api_ports.append(con_status[container]["status"]["APIPort"])
+            ip = con_status[container]["resources"]["ips"]
+            if not ip: continue
+            first_ip = ip[0]
+            if first_ip not in ips:
+                ips.append(first_ip)
+
+    probes = backend_host_probes(
+        weka_version, target_version, ips[0] if ips else None, api_ports
+    )
+
+    batch = None
+    if batch_probes:
+        INFO("COLLECTING BACKEND HOST DATA IN A SINGLE PASS")
+        batch = collect_host_probes(ssh_bk_hosts, probes.values(), ssh_identity)
+        collected = sum(
+            1 for host in ssh_bk_hosts if _batched_host_entries(batch, host) is not None
         )
-        for host_name, result in results:
+        ECHO(f"Collected probe data from {collected} of {len(ssh_bk_hosts)} hosts in one round trip")
+
+    INFO("CHECKING IF OS IS SUPPORTED ON BACKENDS")
+    for host_name, result in iter_probe_results(
+        probes["os_release"], ssh_bk_hosts, batch, ssh_identity
+    ):
+        if result is not None:
+            check_os_release(
+                host_name, result, target_version, backend=True
+            )
+        else:
+            WARN(f"Unable to determine Host: {host_name} OS version")
+
+    relevant_hosts = [host for host in check_rhel_systemd_hosts]
+
+    if check_rhel_systemd_hosts:
+        INFO("CHECKING WEKA AGENT SERVICE TYPE")
+        for host_name, result in iter_probe_results(
+            probes["agent_unit_type"], relevant_hosts, batch, ssh_identity
+        ):
+            if result is not None:
+                weka_agent_unit_type(host_name, result)
+            else:
+                WARN(
+                    f"Unable to determine Host: {host_name} WEKA agent service unit type"
+                )
+
+    connection_counts = {}
+
+    if good_nfs_hosts:
+        INFO("CHECKING NUMBER OF NFS CONNECTIONS ON BACKENDS")
+        for host_name, result in iter_probe_results(
+            probes["nfs_connections"], good_nfs_hosts, batch, ssh_identity
+        ):
+            if result is not None:
+                try:
+                    count = int(result.strip())
+                    connection_counts[host_name] = count
+                except ValueError:
+                    WARN(f"Invalid connection count from {host_name}: {result}")
+            else:
+                WARN(f"Unable to determine NFS connection count on host: {host_name}")
+
+    if connection_counts:
+        max_per_host = get_rpc_max_connections()
+        evaluate_nfs_failover_risk(connection_counts, max_per_host, good_nfs_hosts)
+
+    INFO("CHECKING WEKA AGENT STATUS ON BACKENDS")
+    for host_name, result in iter_probe_results(
+        probes["agent_status"], ssh_bk_hosts, batch, ssh_identity
+    ):
+        if result is not None:
+            weka_agent_check(host_name, result)
+        else:
+            WARN(f"Unable to determine Host: {host_name} weka-agent status")
+
+    INFO("CHECKING TIME DIFFERENCE ON BACKENDS")
+    for host_name, result in iter_probe_results(
+        probes["time"], ssh_bk_hosts, batch, ssh_identity
+    ):
+        if result is not None:
+            time_check(host_name, result)
+        else:
+            WARN(f"Unable to determine time on Host: {host_name}")
+
+    INFO("CHECKING WEKA DATA DIRECTORY SPACE USAGE ON BACKENDS")
+    results = probe_results(probes["data_dir_space"], ssh_bk_hosts, batch, ssh_identity)
+    for host_name, result in results:
+        if result is None:
+            WARN(f"Unable to determine Host: {host_name} available space")
+
+    free_space_check_data(results)
+
+    if "fallocate" in probes:
+        INFO("CHECKING FALLOCATE SUPPORT ON /opt/weka ON BACKENDS")
+        for host_name, result in iter_probe_results(
+            probes["fallocate"], ssh_bk_hosts, batch, ssh_identity
+        ):
             if result is None:
                 WARN(f"Unable to determine fallocate support on /opt/weka on Host: {host_name}")
             else:
                 fallocate_check(host_name, result)
 
     INFO("CHECKING WEKA LOGS DIRECTORY SPACE USAGE ON BACKENDS")
-    results = parallel_execution(
-        ssh_bk_hosts,
-        ["df -m /opt/weka/logs/ | awk 'NR==2 {print $3, $4}'"],
-        use_check_output=True,
-        ssh_identity=ssh_identity,
-    )
+    results = probe_results(probes["logs_space"], ssh_bk_hosts, batch, ssh_identity)
     for host_name, result in results:
         if result is None:
             WARN(f"Unable to determine Host: {host_name} available space")
@@ -2743,13 +3566,7 @@ def backend_host_checks(
     free_space_check_logs(results)
 
     INFO("CHECKING BACKEND WEKA CONTAINER STATUS ON BACKENDS")
-    results = parallel_execution(
-        ssh_bk_hosts,
-        ["weka local ps -J"],
-        use_check_output=False,
-        use_json=True,
-        ssh_identity=ssh_identity,
-    )
+    results = probe_results(probes["local_ps"], ssh_bk_hosts, batch, ssh_identity)
     for host_name, result in results:
         if result is None:
             WARN(f"Unable to determine Host: {host_name} WEKA container status")
@@ -2758,12 +3575,7 @@ def backend_host_checks(
         weka_container_status(results, weka_version)
 
     INFO("CHECKING FOR WEKA MOUNTS ON BACKENDS")
-    results = parallel_execution(
-        ssh_bk_hosts,
-        ["sudo mount -t wekafs | awk '{print $1, $2, $3}'"],
-        use_check_output=True,
-        ssh_identity=ssh_identity,
-    )
+    results = probe_results(probes["wekafs_mounts"], ssh_bk_hosts, batch, ssh_identity)
     for host_name, result in results:
         if result is None:
             WARN(f"Unable to determine WEKA mounts on Host: {host_name}")
@@ -2773,58 +3585,20 @@ def backend_host_checks(
     INFO("CHECKING NUMBER OF RUNNING PROTOCOLS ON BACKENDS")
     protocol_host(backend_hosts, s3_enabled, weka_version)
 
-    backend_containers = json.loads(
-        subprocess.check_output(["weka", "cluster", "container", "-b", "-J"])
-    )
+    backend_containers = weka_json(["weka", "cluster", "container", "-b", "-J"])
     backend_ips_set = set([ip for entry in backend_containers for ip in entry["ips"]])
 
     INFO("CHECKING FOR INVALID ENDPOINT IPS ON BACKENDS")
-    results = parallel_execution(
-        ssh_bk_hosts,
-        [
-            "container_name=$(weka local ps --no-header -o name| grep -E '(dataserv|drive|compute|frontend)'); for name in $container_name; do echo -en [{container: {$name}, ip: [; sudo weka local resources --stable --container $name -J | grep -w ip | awk '{print $2}' | tr '\n' ' '; echo -e ]}]; done"
-        ],
-        use_check_output=True,
-        ssh_identity=ssh_identity,
-    )
-    for host_name, result in results:
+    for host_name, result in iter_probe_results(
+        probes["endpoint_ips"], ssh_bk_hosts, batch, ssh_identity
+    ):
         if result is None:
             WARN(f"Unable to check for invalid endpoint IPs on Host: {host_name}")
         else:
             invalid_endpoints(host_name, result, backend_ips_set)
 
     INFO("CHECKING FOR MISSING / INVALID JOIN-SECRETS ON BACKENDS")
-    command = r"""
-    container_name=$(weka local ps --no-header -o name | grep -E '(dataserv|drive|compute|frontend)');
-    echo -n "{";
-    first=true;
-    for cname in $container_name; do
-        if [ "$first" = true ]; then first=false; else echo -n ","; fi
-        echo -n "\"$cname\":";
-
-        # Determine if Python or Python3 is available
-        python_cmd=""
-        if command -v python &>/dev/null; then
-            python_cmd="python"
-        elif command -v python3 &>/dev/null; then
-            python_cmd="python3"
-        else
-            echo "[]";
-            continue
-        fi
-
-        join_secret=$(sudo weka local resources -C "$cname" -J | $python_cmd -c 'import sys, json; resource = sys.stdin.read(); data = json.loads(resource); join_secret = data.get("join_secret", []); print(json.dumps(join_secret))')
-
-        echo -n "$join_secret"
-    done;
-    echo -n "}"
-    """
-    results = parallel_execution(
-        ssh_bk_hosts,
-        [command],
-        use_check_output=True,
-        ssh_identity=ssh_identity,
-    )
+    results = probe_results(probes["join_secrets"], ssh_bk_hosts, batch, ssh_identity)
     for host_name, result in results:
         if result is None:
             WARN(f"Unable to check for missing / invalid join-secrets on Host: {host_name}")
@@ -2846,129 +3620,58 @@ def backend_host_checks(
             GOOD(f"All containers on all hosts have matching secrets")
 
     INFO("VERIFYING FREE SPACE FOR WEKA TRACES")
-    results = parallel_execution(
-        ssh_bk_hosts,
-        ["df -BK /opt/weka/traces | awk 'NR==2 {print $2}' | sed s/K$//"],
-        use_check_output=True,
-        ssh_identity=ssh_identity,
-    )
-    for host_name, result in results:
+    for host_name, result in iter_probe_results(
+        probes["traces_space"], ssh_bk_hosts, batch, ssh_identity
+    ):
         if result is None:
             WARN(f"Unable to determine Host: {host_name} available trace space")
         else:
             weka_traces_size(host_name, result)
 
     INFO("VALIDATING CPU INSTRUCTION SET")
-    results = parallel_execution(
-        ssh_bk_hosts,
-        [r'grep "\<avx2\>" /proc/cpuinfo'],
-        use_check_output=True,
-        ssh_identity=ssh_identity,
-    )
-    for host_name, result in results:
+    for host_name, result in iter_probe_results(
+        probes["avx2"], ssh_bk_hosts, batch, ssh_identity
+    ):
         if result is None:
             WARN(f"Unable to determine Host: {host_name} cpu instruction set")
         else:
             cpu_instruction_set(host_name, result)
 
-    if V("4.3.2") <= V(target_version) < V("4.4.6"):
+    if "ipv6" in probes:
         INFO("VALIDATING IPV6")
-        results = parallel_execution(
-            ssh_bk_hosts,
-            ["test -f /proc/net/if_inet6"],
-            use_check_output=False,
-            use_call=True,
-            ssh_identity=ssh_identity,
-        )
-        for host_name, result in results:
+        for host_name, result in iter_probe_results(
+            probes["ipv6"], ssh_bk_hosts, batch, ssh_identity
+        ):
             INFO2(f'{" " * 2}Checking IPv6 status on Host: {host_name}:')
             if result == 0:
                 GOOD(f"IPv6 is enabled")
             else:
                 BAD(f"Cannot update WEKA - IPv6 is disabled")
 
-    if V("4.2.6") <= V(weka_version) <= V("4.2.10"):
+    if "os_kernel" in probes:
         INFO("VALIDATING OS KERNEL UPGRADE ELIGIBILITY")
-        command = r"""
-        OS=$(sudo awk -F= '/^ID=/ {gsub(/"/, "", $2); print $2}' /etc/os-release);
-        if [[ $OS == rocky ]]; then
-            KV=$(sudo uname -r);
-            if [[ ! -z $(sudo grep "launder_folio" /usr/src/kernels/"${KV}"/include/linux/fs.h) ]]; then
-                echo "P=true";
-            else
-                echo "P=false";
-            fi;
-        else
-            echo "P=not_rocky";
-        fi
-        """
-        results = parallel_execution(
-            ssh_bk_hosts,
-            [command],
-            use_check_output=True,
-            ssh_identity=ssh_identity,
-        )
-        for host_name, result in results:
+        for host_name, result in iter_probe_results(
+            probes["os_kernel"], ssh_bk_hosts, batch, ssh_identity
+        ):
             if result is None:
                 WARN(f"Unable to validate Host: {host_name} kernel version")
-            else:
-                check_os_kernel(host_name, result)
-
-    INFO("VALIDATING ENDPOINT STATUS")
-    command = r"""
-    if sudo systemctl status falcon-sensor &> /dev/null; then
-        echo "P=running"
-    elif sudo lsmod | grep -q -m 1 falcon_lsm; then
-        echo "P=loaded"
-    else
-        echo "P=not_running"
-    fi
-    """
-    results = parallel_execution(
-        ssh_bk_hosts,
-        [command],
-        use_check_output=True,
-        ssh_identity=ssh_identity,
-    )
-    for host_name, result in results:
+            else:
+                check_os_kernel(host_name, result)
+
+    INFO("VALIDATING ENDPOINT STATUS")
+    for host_name, result in iter_probe_results(
+        probes["endpoint_status"], ssh_bk_hosts, batch, ssh_identity
+    ):
         if result is None:
             WARN(f"Unable to validate Host: {host_name} endpoint status")
         else:
             endpoint_status(host_name, result)
 
     INFO("VERIFYING BACKEND HOST PORT CONNECTIVITY STATUS")
-    api_ports = []
-    ips = []
-
-    con_status = json.loads(
-        subprocess.check_output(["weka", "local", "status", "-J"])
-    )
-
-    for container in con_status:
-        if con_status[container]["type"] == "weka":
-            api_ports.append(con_status[container]["status"]["APIPort"])
-            ip = con_status[container]["resources"]["ips"]
-            if not ip: continue
-            first_ip = ip[0]
-            if first_ip not in ips:
-                ips.append(first_ip)
-
-    if not ips:
+    if "api_ports" not in probes:
         WARN("Unable to verify backend host port connectivity: no IPs found in weka local status")
     else:
-        curl_commands = [
-            f"curl -sL --insecure https://[{ips[0]}]:{port} -o /dev/null; echo $? {port}"
-            if ":" in ips[0]
-            else f"curl -sL --insecure https://{ips[0]}:{port} -o /dev/null; echo $? {port}"
-            for port in api_ports
-        ]
-
-        results = parallel_execution(
-            ssh_bk_hosts,
-            curl_commands,
-            use_check_output=True,
-            ssh_identity=ssh_identity,
-        )
+        results = probe_results(probes["api_ports"], ssh_bk_hosts, batch, ssh_identity)
         for host_name, result in results:
             if result is None:
                 WARN(f"Unable to Determine Host: {host_name} port connectivity")
@@ -2976,49 +3679,33 @@ def backend_host_checks(
         host_port_connectivity(results)
 
     INFO("CHECKING FOR KNOWN PROBLEMATIC KERNEL ARGUMENTS")
-    command = r"""
-        cat /proc/cmdline
-    """
-    results = parallel_execution(
-        ssh_bk_hosts,
-        [command],
-        use_check_output=True,
-        ssh_identity=ssh_identity,
-    )
-    for host_name, result in results:
+    for host_name, result in iter_probe_results(
+        probes["kernel_args"], ssh_bk_hosts, batch, ssh_identity
+    ):
         if result is None:
             WARN(f"Unable to extract kernel arguments from host {host_name}")
         else:
             check_kernel_arguments(host_name, result, target_version)
 
     INFO("CHECKING ENOUGH AVAILABLE MEMORY ON BACKENDS")
-    results = parallel_execution(
-        ssh_bk_hosts,
-        ['weka local ps --no-header | wc -l; free -h'],
-        use_check_output=True,
-        ssh_identity=ssh_identity,
-    )
-    for host_name, result in results:
+    for host_name, result in iter_probe_results(
+        probes["available_memory"], ssh_bk_hosts, batch, ssh_identity
+    ):
         if result is not None:
             available_memory_check(host_name, result)
         else:
             WARN(f"Unable to determine available memory on Host: {host_name}")
 
     INFO("VERIFYING CPU FREQUENCY FOR ASSIGNED WEKA CORES")
-    
+
     # Map hostnames to their assigned core IDs from the existing backend_hosts list
     host_to_cores = defaultdict(set)
     for bk in backend_hosts:
         if bk.cores_ids:
             host_to_cores[bk.hostname].update(bk.cores_ids)
 
-    # Execute remote command to pull CPU data via parallel_execution
-    cpu_results = parallel_execution(
-        ssh_bk_hosts,
-        ["grep -E 'processor|cpu MHz' /proc/cpuinfo"],
-        use_check_output=True,
-        ssh_identity=ssh_identity,
-    )
+    # Pull CPU data from every backend (batched or via parallel_execution)
+    cpu_results = probe_results(probes["cpu_frequency"], ssh_bk_hosts, batch, ssh_identity)
 
     if not cpu_results:
         WARN("No CPU frequency data could be retrieved from backend hosts.")
@@ -3027,7 +3714,7 @@ def backend_host_checks(
             if result:
                 # Look up the cores for this specific host
                 assigned_cores = host_to_cores.get(host_name)
-                
+
                 if assigned_cores:
                     check_cpu_frequency(host_name, result, assigned_cores)
                 else:
@@ -3040,10 +3727,7 @@ def backend_host_checks(
     #    SMBW Checks    #
     #####################
     # Load SMB cluster host statuses
-    output = subprocess.check_output(
-        ["weka", "smb", "cluster", "status", "-J"]
-    )
-    smb_cluster_hosts = json.loads(output)
+    smb_cluster_hosts = weka_json(["weka", "smb", "cluster", "status", "-J"])
 
     if smb_cluster_hosts:
         INFO("CHECKING WEKA SMB CLUSTER HOST HEALTH AND PATCH STATUS")
@@ -3110,11 +3794,7 @@ def backend_host_checks(
     if V(weka_version) == V("4.4.8.76"):
         data = None
         try:
-            data = json.loads(
-                subprocess.check_output(
-                    ["weka", "cluster", "process", "-b", "-J"]
-                )
-            )
+            data = weka_json(["weka", "cluster", "process", "-b", "-J"])
         except subprocess.CalledProcessError as e:
             WARN(f"Error executing command: {e.output.decode('utf-8').strip()}")
         except Exception as ex:
@@ -3140,14 +3820,13 @@ def backend_host_checks(
 def client_hosts_checks(weka_version, ssh_cl_hosts, ssh_identity, target_version=None):
     INFO("CHECKING PASSWORDLESS SSH CONNECTIVITY ON CLIENTS")
     ssh_cl_hosts_dict = [{"name": host} for host in ssh_cl_hosts]
-    results = parallel_execution(
+    for host_name, result in iter_parallel_execution(
         ssh_cl_hosts,
         ["/bin/true"],
         use_check_output=False,
         use_call=True,
         ssh_identity=ssh_identity,
-    )
-    for host_name, result in results:
+    ):
         if result is not None:
             ssh_cl_hosts_dict = ssh_check(host_name, result, ssh_cl_hosts_dict)
         else:
@@ -3169,13 +3848,12 @@ def client_hosts_checks(weka_version, ssh_cl_hosts, ssh_identity, target_version
         sudo cat /etc/os-release;
     fi
     """
-    results = parallel_execution(
+    for host_name, result in iter_parallel_execution(
         ssh_cl_hosts,
         [command],
         use_check_output=True,
         ssh_identity=ssh_identity,
-    )
-    for host_name, result in results:
+    ):
         if result is not None:
             check_os_release(
                 host_name, result, target_version or weka_version, backend=False
@@ -3198,13 +3876,12 @@ def client_hosts_checks(weka_version, ssh_cl_hosts, ssh_identity, target_version
             echo "P=not_rocky";
         fi
         """
-        results = parallel_execution(
+        for host_name, result in iter_parallel_execution(
             ssh_cl_hosts,
             [command],
             use_check_output=True,
             ssh_identity=ssh_identity,
-        )
-        for host_name, result in results:
+        ):
             if result is None:
                 WARN(f"Unable to validate Host: {host_name} kernel version")
             else:
@@ -3227,33 +3904,31 @@ def client_hosts_checks(weka_version, ssh_cl_hosts, ssh_identity, target_version
         GOOD(f"Skipping clients check, no online clients found")
 
     INFO("CHECKING TIME DIFFERENCE ON CLIENTS")
-    results = parallel_execution(
+    for host_name, result in iter_parallel_execution(
         ssh_cl_hosts,
         ["date --utc +%s"],
         use_check_output=True,
         ssh_identity=ssh_identity,
-    )
-    for host_name, result in results:
+    ):
         if result is not None:
             time_check(host_name, result)
         else:
             WARN(f"Unable to determine Host: {host_name} weka-agent status")
 
     INFO("CHECKING WEKA MOUNT POINTS ON CLIENTS")
-    results = parallel_execution(
+    for host_name, result in iter_parallel_execution(
         ssh_cl_hosts,
         ["sudo mountpoint -qd /weka/ | wc -l"],
         use_check_output=True,
         ssh_identity=ssh_identity,
-    )
-    for host_name, result in results:
+    ):
         if result is not None:
             client_mount_check(host_name, result)
         else:
             WARN(f"Unable to determine wekafs mounts on client: {host_name}")
 
     INFO("CHECKING WEKA AGENT STATUS ON CLIENTS")
-    results = parallel_execution(
+    for host_name, result in iter_parallel_execution(
         ssh_cl_hosts,
         [r"""
         if sudo service weka-agent status > /dev/null 2>&1; then
@@ -3264,8 +3939,7 @@ def client_hosts_checks(weka_version, ssh_cl_hosts, ssh_identity, target_version
         """],
         use_check_output=True,
         ssh_identity=ssh_identity,
-    )
-    for host_name, result in results:
+    ):
         if result is not None:
             weka_agent_check(host_name, result)
         else:
@@ -3287,7 +3961,7 @@ def client_hosts_checks(weka_version, ssh_cl_hosts, ssh_identity, target_version
         weka_container_status(results, weka_version)
 
     INFO("CHECKING IOMMU STATUS ON CLIENTS")
-    results = parallel_execution(
+    for host_name, result in iter_parallel_execution(
         ssh_cl_hosts,
         [
             """
@@ -3303,8 +3977,7 @@ def client_hosts_checks(weka_version, ssh_cl_hosts, ssh_identity, target_version
         use_check_output=False,
         use_json=False,
         ssh_identity=ssh_identity,
-    )
-    for host_name, result in results:
+    ):
         if result is None:
             WARN(f"Unable to determine Host: {host_name} IOMMU status")
         elif result.returncode == 0:
@@ -3319,6 +3992,286 @@ def cluster_summary():
     WARN(f"Total Warnings: {num_warn}")
     BAD(f"Total Checks Failed: {num_bad}")
 
+class KnownIssueIndex:
+    """known_issues.json compiled for lookups by version.
+
+    Every issue gets one bit, and a set of issues is a Python int. The
+    affected_versions ranges are flattened into sorted version boundaries; each
+    slot between two boundaries holds the mask of the issues whose ranges cover
+    it, so the issues affecting a version are one bisect away. version_from
+    issues are kept sorted by version with prefix masks. The protocol,
+    link-type, obj_store and multi_org filters are precomputed as one mask per
+    distinct filter combination.
+    """
+
+    OBJ_STORE = 1
+    MULTI_ORG = 2
+
+    def __init__(self, known_issues):
+        self.keys = list(known_issues)
+        self._issues = known_issues
+        self.kernel_mask = 0
+        self._protocol_bits = {}
+        self._link_type_bits = {}
+        filter_masks = defaultdict(int)
+        ranges = []
+        version_from = []
+        parsed = {}
+
+        def parse(version):
+            # The same handful of release strings repeat across the whole file.
+            if version not in parsed:
+                parsed[version] = V(version)
+            return parsed[version]
+
+        for index, key in enumerate(self.keys):
+            issue = known_issues[key]
+            bit = 1 << index
+            if issue.get("problematic_kernel_arguments"):
+                self.kernel_mask |= bit
+            if issue.get("version_from"):
+                version_from.append((parse(issue["version_from"]), bit))
+                continue
+
+            for vrange in issue.get("affected_versions", []):
+                vmin = vrange.get("min")
+                vmax = vrange.get("max")
+                # With a max the range is [min, max) and min is optional;
+                # without one it covers every version from min on.
+                ranges.append(
+                    (parse(vmin) if vmin else None, parse(vmax) if vmax else None, bit)
+                )
+
+            signature = (
+                self._bits(self._protocol_bits, issue.get("related_protocols", [])),
+                self._bits(self._link_type_bits, issue.get("link_types", [])),
+                (self.OBJ_STORE if issue.get("obj_store", False) else 0)
+                | (self.MULTI_ORG if issue.get("multi_org", False) else 0),
+            )
+            filter_masks[signature] |= bit
+
+        self._filter_masks = dict(filter_masks)
+
+        # Slot i covers [boundaries[i-1], boundaries[i]); the first and last
+        # slots are open-ended.
+        self._boundaries = sorted(
+            {vmin for vmin, _, _ in ranges if vmin is not None}
+            | {vmax for _, vmax, _ in ranges if vmax is not None}
+        )
+        events = defaultdict(list)
+        for vmin, vmax, bit in ranges:
+            events[0 if vmin is None else self._slot(vmin)].append((bit, 1))
+            if vmax is not None:
+                events[self._slot(vmax)].append((bit, -1))
+
+        # One issue may list overlapping ranges, so its bit stays set for as
+        # long as any of them is open.
+        open_ranges = Counter()
+        mask = 0
+        self._slot_masks = []
+        for slot in range(len(self._boundaries) + 1):
+            for bit, delta in events.get(slot, ()):
+                open_ranges[bit] += delta
+                if open_ranges[bit]:
+                    mask |= bit
+                else:
+                    mask &= ~bit
+            self._slot_masks.append(mask)
+
+        version_from.sort(key=lambda entry: entry[0])
+        self._from_versions = [version for version, _ in version_from]
+        # Bits are distinct, so the XOR of two prefixes is the OR of the slice between them.
+        self._from_prefix = [0]
+        for _, bit in version_from:
+            self._from_prefix.append(self._from_prefix[-1] ^ bit)
+
+    @staticmethod
+    def _bits(bit_map, names):
+        mask = 0
+        for name in names:
+            mask |= bit_map.setdefault(name, 1 << len(bit_map))
+        return mask
+
+    def _slot(self, version):
+        return bisect.bisect_right(self._boundaries, version)
+
+    def affecting(self, version):
+        """Mask of the affected_versions issues with a range containing *version*."""
+        return self._slot_masks[self._slot(V(version))]
+
+    def crossing(self, version, final_version):
+        """Mask of the version_from issues with version <= version_from < final_version."""
+        low = bisect.bisect_left(self._from_versions, V(version))
+        high = bisect.bisect_left(self._from_versions, V(final_version))
+        if high <= low:
+            return 0
+        return self._from_prefix[high] ^ self._from_prefix[low]
+
+    def filter_mask(self, protocols, link_type, obj_store_enabled, multi_org):
+        """Mask of the affected_versions issues whose filters accept this cluster."""
+        enabled_protocols = 0
+        for name, bit in self._protocol_bits.items():
+            if name in protocols:
+                enabled_protocols |= bit
+        link_type_bit = self._link_type_bits.get(link_type, 0)
+        features = (self.OBJ_STORE if obj_store_enabled else 0) | (
+            self.MULTI_ORG if multi_org else 0
+        )
+
+        mask = 0
+        for (protocol_mask, link_type_mask, required), bits in self._filter_masks.items():
+            if protocol_mask and not protocol_mask & enabled_protocols:
+                continue
+            if link_type_mask and not link_type_mask & link_type_bit:
+                continue
+            if required & ~features:
+                continue
+            mask |= bits
+        return mask
+
+    def match_path(self, upgrade_hops, filter_mask):
+        """[(hop, issue keys)] for every hop but the first, keys in known_issues.json order."""
+        return [
+            (
+                version,
+                self.keys_of(
+                    (self.affecting(version) & filter_mask)
+                    | self.crossing(version, upgrade_hops[-1])
+                ),
+            )
+            for version in upgrade_hops[1:]
+        ]
+
+    def issue(self, key):
+        return self._issues[key]
+
+    def keys_of(self, mask):
+        # Walk the binary digits lowest first: one pass instead of a big-int
+        # operation per set bit.
+        digits = bin(mask)[:1:-1]
+        return [self.keys[index] for index, digit in enumerate(digits) if digit == "1"]
+
+
+_known_issue_indexes = {}
+
+
+def load_known_issue_index(path=None):
+    """Return the compiled index of *path* (default: known_issues.json).
+
+    The index is compiled once and reused until the file changes. Raises
+    FileNotFoundError, json.JSONDecodeError, or ValueError when the file does
+    not hold a dictionary.
+    """
+    path = path or known_issues_file
+    stat = os.stat(path)
+    cache_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    index = _known_issue_indexes.get(cache_key)
+    if index is None:
+        with open(path, "r") as file:
+            known_issues = json.load(file)
+        if not isinstance(known_issues, dict):
+            raise ValueError(f"Invalid format in {path}. Expected a dictionary.")
+        index = KnownIssueIndex(known_issues)
+        _known_issue_indexes[cache_key] = index
+    return index
+
+
+def _scan_known_issues(known_issues, upgrade_hops, protocols, link_type, obj_store_enabled, multi_org):
+    """Linear reference matcher, the pre-index algorithm, used by the benchmark."""
+    matches = []
+    for version in upgrade_hops[1:]:
+        found = []
+        for key, issue in known_issues.items():
+            if issue.get("version_from"):
+                if V(version) <= V(issue["version_from"]) and V(upgrade_hops[-1]) > V(issue["version_from"]):
+                    found.append(key)
+                continue
+            for vrange in issue.get("affected_versions", []):
+                vmin = vrange.get("min")
+                vmax = vrange.get("max")
+                if vmax:
+                    in_range = ((not vmin) or V(version) >= V(vmin)) and V(version) < V(vmax)
+                else:
+                    in_range = V(version) >= V(vmin)
+                if not in_range:
+                    continue
+                related_protocols = set(issue.get("related_protocols", []))
+                related_link_types = set(issue.get("link_types", []))
+                if related_protocols and not (related_protocols & protocols):
+                    continue
+                if related_link_types and link_type not in related_link_types:
+                    continue
+                if issue.get("obj_store", False) and not obj_store_enabled:
+                    continue
+                if issue.get("multi_org", False) and not multi_org:
+                    continue
+                found.append(key)
+                break
+        matches.append((version, found))
+    return matches
+
+
+def benchmark_known_issues(issue_count=10000, rounds=100):
+    """Time the indexed matcher against the linear scan on a synthetic issue database."""
+    rng = random.Random(issue_count)
+    versions = [
+        f"{major}.{patch}"
+        for major in ("4.2", "4.3", "4.4", "5.0", "5.1", "5.2")
+        for patch in range(0, 40)
+    ]
+    known_issues = {}
+    for number in range(issue_count):
+        issue = {
+            "description": f"Synthetic issue {number}",
+            "related_protocols": rng.choice([[], [], ["s3"], ["nfs"], ["smb"], ["nfs", "smb"]]),
+            "link_types": rng.choice([[], [], ["ETH"], ["IB"]]),
+            "problematic_kernel_arguments": ["iommu=on"] if rng.random() < 0.05 else [],
+            "internal_reference": f"SYNTH-{number}",
+            "multi_org": rng.random() < 0.1,
+            "obj_store": rng.random() < 0.2,
+        }
+        if rng.random() < 0.1:
+            issue["version_from"] = rng.choice(versions)
+        else:
+            issue["affected_versions"] = []
+            for _ in range(rng.randint(1, 3)):
+                low, high = sorted(rng.sample(range(len(versions)), 2))
+                vrange = {"min": versions[low], "max": versions[high]}
+                if rng.random() < 0.05:
+                    del vrange["max"]
+                issue["affected_versions"].append(vrange)
+        known_issues[f"SYNTH-{number}"] = issue
+
+    upgrade_hops = ["4.2.3", "4.2.18", "4.3.5", "4.4.2", "4.4.21", "5.0.1", "5.1.0", "5.1.22", "5.2.7"]
+    protocols = {"s3", "nfs"}
+
+    INFO(f"BENCHMARKING KNOWN ISSUES MATCHING ({issue_count} SYNTHETIC ISSUES, {len(upgrade_hops) - 1} HOPS)")
+
+    started = time.perf_counter()
+    index = KnownIssueIndex(known_issues)
+    compile_secs = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        indexed = index.match_path(
+            upgrade_hops, index.filter_mask(protocols, "ETH", True, False)
+        )
+    indexed_secs = (time.perf_counter() - started) / rounds
+
+    started = time.perf_counter()
+    scanned = _scan_known_issues(known_issues, upgrade_hops, protocols, "ETH", True, False)
+    scan_secs = time.perf_counter() - started
+
+    ECHO(f"Compile index: {compile_secs * 1000:.1f} ms")
+    ECHO(f"Indexed match of the upgrade path: {indexed_secs * 1000:.3f} ms (mean of {rounds})")
+    ECHO(f"Linear scan of the upgrade path: {scan_secs * 1000:.1f} ms")
+    ECHO(f"Speedup per path: {scan_secs / indexed_secs:.0f}x")
+    if indexed == scanned:
+        GOOD(f"Indexed and linear matchers agree ({sum(len(keys) for _, keys in indexed)} matches)")
+    else:
+        BAD("Indexed and linear matchers disagree")
+
+
 def check_known_issues(
     upgrade_hops,
     s3_enabled,
@@ -3332,95 +4285,48 @@ def check_known_issues(
     Checks each version in the upgrade hops list against known issues,
     considering configured protocols, link type, version_from, and object store status.
     The upgrade map requires upgrade_path.json and the code traverses from bottom to top in the list or oldest to newest from that list.
-    Once the upgrade path is determined then we check for any know issues outlined in known_issues.json.
+    Once the upgrade path is determined then we check for any know issues outlined in known_issues.json,
+    matched through the compiled KnownIssueIndex.
     """
     try:
-        with open(known_issues_file, "r") as file:
-            known_issues = json.load(file)
-
-        if not isinstance(known_issues, dict):
-            WARN(f"Error: Invalid format in {known_issues_file}. Expected a dictionary.")
-            return
-
-        # Determine enabled protocols
-        enabled_protocols = set()
-        if s3_enabled:
-            enabled_protocols.add("s3")
-        if weka_nfs:
-            enabled_protocols.add("nfs")
-        if weka_smb:
-            enabled_protocols.add("smb")
-
-        for index, version in enumerate(upgrade_hops):
-            if index != 0:
-                found_issues = []  # reset per hop so reporting is per-version
-                for key, issue in known_issues.items():
-                    description = issue.get("description", "No description available.")
-                    if issue.get("version_from"):
-                        if V(version) <= V(issue['version_from']) and V(upgrade_hops[-1]) > V(issue['version_from']):
-                            found_issues += [
-                                key, 
-                                description,
-                            ]
-                    else:
-                         for vrange in issue.get("affected_versions", []):
-                             vmin = vrange.get("min")
-                             vmax = vrange.get("max")
-
-                             # min_ok logic
-                             if vmax:
-                                 # Normal range: version >= min AND version < max
-                                 min_ok = (not vmin) or V(version) >= V(vmin)
-                                 max_ok = V(version) < V(vmax)
-                             # No max:                                 
-                             else:
-                                 min_ok = V(version) >= V(vmin)
-                                 max_ok = True
-
-                             if min_ok and max_ok:
-                                related_protocols = set(issue.get("related_protocols", []))
-                                related_link_types = set(issue.get("link_types", []))
-                                requires_obj_store = issue.get("obj_store", False)
-                                requires_multi_org = issue.get("multi_org", False)
-
-                                # Check protocols
-                                if related_protocols and not (related_protocols & enabled_protocols):
-                                    continue
-
-                                # Check link type
-                                if related_link_types and link_type not in related_link_types:
-                                    continue
-
-                                # Check object store
-                                if requires_obj_store and not obj_store_enabled:
-                                    continue
-
-                                # Check if multiple organizations
-                                if requires_multi_org and not multi_org:
-                                    continue
-
-                                found_issues += [
-                                    key,
-                                    description,
-                                ]
-                                # Stop at the first matching range so an issue with
-                                # multiple affected_versions entries isn't reported twice.
-                                break
-
-                if found_issues:
-                    header = f"Known issues for version {version}:"
-                    print(f"\n{colors.WARNING}{header}{colors.ENDC}")
-                    logging.warning(header)
-                    printlist(found_issues, 2)
-                else:
-                    no_issues_msg = f"No known issues for version {version}."
-                    print(f"{colors.OKCYAN}{no_issues_msg}{colors.ENDC}")
-                    logging.info(no_issues_msg)
-
+        index = load_known_issue_index()
     except FileNotFoundError:
         WARN(f"Error: {known_issues_file} not found.")
+        return
     except json.JSONDecodeError:
         WARN(f"Error: {known_issues_file} contains invalid JSON.")
+        return
+    except ValueError as e:
+        WARN(f"Error: {e}")
+        return
+
+    # Determine enabled protocols
+    enabled_protocols = set()
+    if s3_enabled:
+        enabled_protocols.add("s3")
+    if weka_nfs:
+        enabled_protocols.add("nfs")
+    if weka_smb:
+        enabled_protocols.add("smb")
+
+    filter_mask = index.filter_mask(enabled_protocols, link_type, obj_store_enabled, multi_org)
+
+    for version, keys in index.match_path(upgrade_hops, filter_mask):
+        if keys:
+            found_issues = []
+            for key in keys:
+                found_issues += [
+                    key,
+                    index.issue(key).get("description", "No description available."),
+                ]
+            header = f"Known issues for version {version}:"
+            print(f"\n{colors.WARNING}{header}{colors.ENDC}")
+            logging.warning(header)
+            printlist(found_issues, 2)
+        else:
+            no_issues_msg = f"No known issues for version {version}."
+            print(f"{colors.OKCYAN}{no_issues_msg}{colors.ENDC}")
+            logging.info(no_issues_msg)
 
 
 def _clean_version(version):
@@ -3513,7 +4419,7 @@ def check_completed_fsck(current_version):
     INFO("VERIFYING A CLEAN FSCK COMPLETED SINCE THE LAST UPGRADE")
 
     try:
-        fsck_raw = subprocess.check_output(
+        fsck_raw = local_check_output(
             ["weka", "debug", "manhole", "--slot", "0", "get_completed_fsck_info"],
             stderr=subprocess.STDOUT,
         )
@@ -3528,11 +4434,7 @@ def check_completed_fsck(current_version):
         return
 
     try:
-        last_upgrade_usecs = json.loads(
-            subprocess.check_output(
-                ["weka", "debug", "config", "show", "upgradeInfo.lastUpgradeTime.usecs", "-J"]
-            )
-        )
+        last_upgrade_usecs = weka_json(["weka", "debug", "config", "show", "upgradeInfo.lastUpgradeTime.usecs", "-J"])
     except (subprocess.CalledProcessError, ValueError, json.JSONDecodeError) as e:
         WARN(
             f"Unable to retrieve last upgrade time ({e}); verify a clean FSCK ran since "
@@ -3552,11 +4454,7 @@ def check_completed_fsck(current_version):
     # deployed straight onto 4.4.2x). initialSwVersion is the reliable discriminator
     # because a fresh install still writes lastUpgradeTime.
     try:
-        initial_sw_version = json.loads(
-            subprocess.check_output(
-                ["weka", "debug", "config", "show", "clusterInfo.initialSwVersion", "-J"]
-            )
-        )
+        initial_sw_version = weka_json(["weka", "debug", "config", "show", "clusterInfo.initialSwVersion", "-J"])
     except (subprocess.CalledProcessError, ValueError, json.JSONDecodeError):
         initial_sw_version = None  # older clusters may lack the key; fall through
 
@@ -3593,10 +4491,9 @@ def check_mixed_accepted_versions():
     FAIL when: MIXED is present and non-empty.
     """
     INFO("VERIFYING NO MIXED ACCEPTED VERSIONS")
-    result = subprocess.run(
+    result = local_run(
         ["weka", "debug", "config", "show",
-         "clusterInfo.acceptedVersionsPerType", "-J"],
-        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+         "clusterInfo.acceptedVersionsPerType", "-J"]
     )
     if result.returncode != 0:
         err = result.stderr.decode("utf-8", "replace").strip()
@@ -3627,100 +4524,147 @@ def check_mixed_accepted_versions():
             "before upgrading. See WEKAPP-638315.")
 
 
-def target_version_check(
-    weka_version,
-    target_version,
-    upgrade_path,
-    s3_enabled,
-    weka_nfs,
-    weka_smb,
-    link_type,
-    obj_store_enabled,
-    multi_org,
-):
-    INFO("VALIDATING UPGRADE PATH AND KNOWN ISSUES")
+def load_upgrade_map(upgrade_path):
+    try:
+        with open(upgrade_path, "r") as f:
+            upgrade_map = json.load(f)
+        # Validate the structure of upgrade_map
+        for ver, rule in upgrade_map.items():
+            if not isinstance(rule, dict):
+                WARN(f"Invalid entry in upgrade_map for version {ver}: not a dict")
+                continue
+            # min is REQUIRED and must be a non-empty list
+            if "min" not in rule or not isinstance(rule["min"], list) or not rule["min"]:
+                WARN(f"Invalid entry in upgrade_map for version {ver}: missing or empty 'min' list")
+                continue
+            # Validate each min version is parseable
+            for min_str in rule["min"]:
+                if not isinstance(min_str, str) or not min_str.strip():
+                    WARN(f"Invalid entry in upgrade_map for version {ver}: empty/non-string in 'min'")
+                    continue
+                min_v = parse_version(min_str)
+                if not min_v:
+                    WARN(f"Invalid entry in upgrade_map for version {ver}: cannot parse min '{min_str}'")
+            # Parse the target version
+            ver_v = parse_version(ver)
+            if not ver_v:
+                WARN(f"Invalid entry in upgrade_map for version {ver}: cannot parse version key")
+                continue
+        return upgrade_map
+    except FileNotFoundError:
+        WARN(f"Error: Upgrade path file '{upgrade_path}' not found.")
+        return {}
+    except json.JSONDecodeError:
+        WARN(f"Error: Failed to parse JSON file '{upgrade_path}'.")
+        return {}
+    except ValueError as e:
+        WARN(f"Error in upgrade map: {e}")
+        return {}
 
-    def load_upgrade_map(upgrade_path):
-        try:
-            with open(upgrade_path, "r") as f:
-                upgrade_map = json.load(f)
-            # Validate the structure of upgrade_map
-            for ver, rule in upgrade_map.items():
-                if not isinstance(rule, dict):
-                    WARN(f"Invalid entry in upgrade_map for version {ver}: not a dict")
+
+def parse_version(version):
+    if not version or not isinstance(version, str) or version.strip() == "":
+        return None
+    try:
+        return V(version.strip())
+    except Exception:
+        return None
+
+
+class UpgradeGraph:
+    """upgrade_path.json as a graph of release versions.
+
+    Versions are interned once as release tuples with trailing zeros dropped, so
+    they compare like packaging versions ("5.0" == "5.0.0") at tuple speed. The
+    edges leaving a version are derived from the min/max rules the first time
+    the version is reached and then reused, and every path found is memoized per
+    (source, target, metric).
+
+    Cost-based search ("cost", the default):
+      - Same-major hops cost 1, cross-major hops cost 2.
+      - Within equal cost, more same-major hops are preferred.
+      - Within equal cost and same-major hops, higher same-major intermediates are preferred.
+    "hops" counts every hop as 1 and keeps the same tie-breakers.
+    Min/max rules are filtered to only compare versions matching the current version's major.
+    """
+
+    def __init__(self, upgrade_map):
+        self._versions = {}
+        self._successors = {}
+        self._paths = {}
+        self._rules = []
+        for ver, rule in upgrade_map.items():
+            ver_t = self.intern(ver)
+            if ver_t is None:
+                continue
+            limits = {}
+            for bound in ("min", "max"):
+                by_major = defaultdict(list)
+                for m in rule.get(bound, []) if isinstance(rule, dict) else []:
+                    m_t = self.intern(m)
+                    if m_t is not None:
+                        by_major[m.split(".")[0]].append(m_t)
+                limits[bound] = dict(by_major)
+            self._rules.append((ver, ver_t, limits["min"], limits["max"]))
+
+    def intern(self, version):
+        """Return the release tuple of *version*, or None if it cannot be parsed."""
+        if version not in self._versions:
+            parsed = parse_version(version)
+            if parsed is None:
+                self._versions[version] = None
+            else:
+                release = list(parsed.release)
+                while len(release) > 1 and release[-1] == 0:
+                    release.pop()
+                self._versions[version] = tuple(release)
+        return self._versions[version]
+
+    def _sort_key(self, ver):
+        """Return a fixed-length 4-tuple of ints for a version string."""
+        parts = list(self._versions.get(ver) or ())
+        while len(parts) < 4:
+            parts.append(0)
+        return tuple(parts[:4])
+
+    def successors(self, current):
+        """Versions reachable from *current* in one hop, in upgrade_path.json order."""
+        if current not in self._successors:
+            current_t = self.intern(current)
+            current_major = current.split(".")[0]
+            found = []
+            for ver, ver_t, mins, maxs in self._rules:
+                if ver_t <= current_t:
                     continue
-                # min is REQUIRED and must be a non-empty list
-                if "min" not in rule or not isinstance(rule["min"], list) or not rule["min"]:
-                    WARN(f"Invalid entry in upgrade_map for version {ver}: missing or empty 'min' list")
+                min_list = mins.get(current_major)
+                if not min_list or not any(current_t >= m for m in min_list):
                     continue
-                # Validate each min version is parseable
-                for min_str in rule["min"]:
-                    if not isinstance(min_str, str) or not min_str.strip():
-                        WARN(f"Invalid entry in upgrade_map for version {ver}: empty/non-string in 'min'")
-                        continue
-                    min_v = parse_version(min_str)
-                    if not min_v:
-                        WARN(f"Invalid entry in upgrade_map for version {ver}: cannot parse min '{min_str}'")
-                # Parse the target version
-                ver_v = parse_version(ver)
-                if not ver_v:
-                    WARN(f"Invalid entry in upgrade_map for version {ver}: cannot parse version key")
+                if any(current_t > m for m in maxs.get(current_major, ())):
                     continue
-            return upgrade_map
-        except FileNotFoundError:
-            WARN(f"Error: Upgrade path file '{upgrade_path}' not found.")
-            return {}
-        except json.JSONDecodeError:
-            WARN(f"Error: Failed to parse JSON file '{upgrade_path}'.")
-            return {}
-        except ValueError as e:
-            WARN(f"Error in upgrade map: {e}")
-            return {}
-
-    def parse_version(version):
-        if not version or not isinstance(version, str) or version.strip() == "":
-            return None
-        try:
-            return V(version.strip())
-        except Exception:
-            return None
+                found.append(ver)
+            self._successors[current] = found
+        return self._successors[current]
 
-    def find_upgrade_path(weka_version, target_version, upgrade_map):
-        """
-        Find a valid upgrade path from weka_version to target_version using upgrade_map.
-        Uses cost-based search:
-          - Same-major hops cost 1, cross-major hops cost 2.
-          - Within equal cost, more same-major hops are preferred.
-          - Within equal cost and same-major hops, higher same-major intermediates are preferred.
-        Min/max rules are filtered to only compare versions matching the current version's major.
-        """
+    def find_path(self, weka_version, target_version, metric="cost"):
+        """Upgrade path from weka_version to target_version, or [] if there is none."""
         weka_version = weka_version.strip()
         target_version = target_version.strip()
+        key = (weka_version, target_version, metric)
+        if key not in self._paths:
+            self._paths[key] = self._search(weka_version, target_version, metric)
+        return list(self._paths[key])
+
+    def find_paths(self, weka_versions, target_version, metric="cost"):
+        """Batch form of find_path(): {version: path} for every distinct version given."""
+        return {
+            version: self.find_path(version, target_version, metric)
+            for version in dict.fromkeys(weka_versions)
+        }
 
-        # Pre-parse upgrade_map keys for efficiency
-        parsed_versions = {}
-        for pver in upgrade_map:
-            try:
-                parsed_versions[pver] = parse_version(pver)
-            except Exception:
-                WARN(f"Cannot parse version key '{pver}' in upgrade_map")
-                parsed_versions[pver] = None
-
-        def same_major(v1, v2):
-            try:
-                return v1.split(".")[0] == v2.split(".")[0]
-            except Exception:
-                return False
-
-        def version_sort_key(ver):
-            """Return a fixed-length 4-tuple of ints for a version string."""
-            v = parsed_versions.get(ver)
-            if v is None:
-                return (0, 0, 0, 0)
-            parts = list(v.release)
-            while len(parts) < 4:
-                parts.append(0)
-            return tuple(parts[:4])
+    def _search(self, weka_version, target_version, metric):
+        if self.intern(weka_version) is None:
+            return []
+        source_major = weka_version.split(".")[0]
 
         heap = [(0, 0, (0, 0, 0, 0), [weka_version])]  # (cost, neg_same_major, neg_max_intermediate, path)
         visited = set()
@@ -3736,54 +4680,67 @@ def target_version_check(
                 continue
             visited.add(current)
 
-            current_v = parse_version(current)
             current_major = current.split(".")[0]
-
-            for ver, rule in upgrade_map.items():
+            for ver in self.successors(current):
                 if ver in visited:
                     continue
-                ver_v = parsed_versions.get(ver)
-                if ver_v is None:
-                    continue
-                if ver_v <= current_v:
-                    continue
-                # Filter min entries to only those matching current version's major
-                min_list = rule.get("min", [])
-                min_list_parsed = [(m, parsed_versions.get(m) or parse_version(m)) for m in min_list]
-                min_list_parsed = [v for m, v in min_list_parsed if m.split(".")[0] == current_major and v is not None]
-                if not min_list_parsed:
-                    continue
-                if not any(current_v >= m for m in min_list_parsed):
-                    continue
-                # Filter max entries to only those matching current version's major
-                max_list = rule.get("max", [])
-                max_list_parsed = [(m, parsed_versions.get(m) or parse_version(m)) for m in max_list]
-                max_list_parsed = [v for m, v in max_list_parsed if m.split(".")[0] == current_major and v is not None]
-                if max_list_parsed and any(current_v > m for m in max_list_parsed):
-                    continue
-                hop_cost = 1 if same_major(ver, current) else 2
-                new_cost = cost + hop_cost
-                new_neg_same = neg_same - (1 if same_major(ver, current) else 0)
+                same_major = ver.split(".")[0] == current_major
+                hop_cost = 1 if same_major or metric == "hops" else 2
+                new_neg_same = neg_same - (1 if same_major else 0)
                 # Only track same-major-as-source intermediates as tiebreaker, exclude destination
-                if ver == target_version:
-                    new_neg_max = neg_max
-                elif same_major(ver, weka_version):
-                    vkey = version_sort_key(ver)
-                    cur_neg = tuple(-x for x in vkey)
-                    new_neg_max = min(neg_max, cur_neg)
+                if ver != target_version and ver.split(".")[0] == source_major:
+                    new_neg_max = min(neg_max, tuple(-x for x in self._sort_key(ver)))
                 else:
                     new_neg_max = neg_max
-                heapq.heappush(heap, (new_cost, new_neg_same, new_neg_max, path + [ver]))
+                heapq.heappush(heap, (cost + hop_cost, new_neg_same, new_neg_max, path + [ver]))
 
-        WARN(f"Could not reach target version {target_version} from {weka_version}")
         return []
 
+
+_upgrade_graphs = {}
+
+
+def load_upgrade_graph(upgrade_path):
+    """Return the UpgradeGraph of *upgrade_path*, built once until the file changes.
+
+    Returns None (after warning) when the file is missing, invalid or empty.
+    """
+    try:
+        stat = os.stat(upgrade_path)
+        cache_key = (os.path.abspath(upgrade_path), stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        cache_key = None
+    if cache_key in _upgrade_graphs:
+        return _upgrade_graphs[cache_key]
+
+    upgrade_map = load_upgrade_map(upgrade_path)
+    graph = UpgradeGraph(upgrade_map) if upgrade_map else None
+    if cache_key is not None:
+        _upgrade_graphs[cache_key] = graph
+    return graph
+
+
+def target_version_check(
+    weka_version,
+    target_version,
+    upgrade_path,
+    s3_enabled,
+    weka_nfs,
+    weka_smb,
+    link_type,
+    obj_store_enabled,
+    multi_org,
+):
+    INFO("VALIDATING UPGRADE PATH AND KNOWN ISSUES")
+
     try:
-        upgrade_map = load_upgrade_map(upgrade_path)
-        if not upgrade_map:
+        graph = load_upgrade_graph(upgrade_path)
+        if not graph:
             WARN("Invalid or empty upgrade map. Ensure upgrade_path.json exists and is not empty.")
             return
-        upgrade_hops = find_upgrade_path(weka_version, target_version, upgrade_map)
+        upgrade_hops = graph.find_path(weka_version, target_version)
+        if not upgrade_hops:
+            WARN(f"Could not reach target version {target_version} from {weka_version}")
         if upgrade_hops:  # Only proceed if a valid path exists
             total_hops = len(upgrade_hops) - 1
             if total_hops == 1:
@@ -3834,6 +4791,10 @@ def main():
         print(_paint(_seq(_GLYPHS)))
         sys.exit(0)
 
+    if "--benchmark-known-issues" in sys.argv[1:]:
+        benchmark_known_issues()
+        sys.exit(0)
+
     check_pg_version()
 
     parser = argparse.ArgumentParser(
@@ -3886,12 +4847,88 @@ def main():
         type=str,
         help="Specify the target version for upgrade path calculation.",
     )
+    parser.add_argument(
+        "--no-ssh-multiplex",
+        dest="no_ssh_multiplex",
+        action="store_true",
+        help="Open a new SSH connection for every remote command instead of reusing one persistent connection per host.",
+    )
+    parser.add_argument(
+        "--batch-host-probes",
+        dest="batch_host_probes",
+        action="store_true",
+        help="Collect all backend host data with a single remote script per host, then evaluate the backend checks locally.",
+    )
+    parser.add_argument(
+        "--reuse-cluster-state",
+        dest="reuse_cluster_state",
+        type=int,
+        metavar="MINUTES",
+        default=None,
+        help="Save the weka CLI output of this run, and reuse the output saved by a previous run if it is at most MINUTES old.",
+    )
+    parser.add_argument(
+        "--ssh-concurrency",
+        dest="ssh_concurrency",
+        type=int,
+        default=remote_executor.concurrency,
+        help="Maximum number of remote commands running at the same time (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--ssh-timeout",
+        dest="ssh_timeout",
+        type=int,
+        metavar="SECONDS",
+        default=remote_executor.timeout,
+        help="Per-host timeout for a remote command, in seconds (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--remote-deadline",
+        dest="remote_deadline",
+        type=int,
+        metavar="SECONDS",
+        default=None,
+        help="Stop waiting for hosts that have not answered a check within SECONDS and report them as timed out.",
+    )
+    snapshot_group = parser.add_mutually_exclusive_group()
+    snapshot_group.add_argument(
+        "--record-snapshot",
+        dest="record_snapshot",
+        metavar="FILE",
+        default=None,
+        help="Capture every cluster command and remote host output consumed by the checks into a compressed snapshot bundle.",
+    )
+    snapshot_group.add_argument(
+        "--replay-snapshot",
+        dest="replay_snapshot",
+        metavar="FILE",
+        default=None,
+        help="Run the checks against a snapshot bundle captured with --record-snapshot, without touching the cluster.",
+    )
     parser.add_argument("--dude", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--benchmark-known-issues", action="store_true", help=argparse.SUPPRESS)
     args = parser.parse_args()
     if args.version:
         print("WEKA upgrade checker version: %s" % pg_version)
         sys.exit(0)
 
+    ssh_pool.enabled = not args.no_ssh_multiplex
+    remote_executor.concurrency = max(1, args.ssh_concurrency)
+    remote_executor.timeout = args.ssh_timeout
+    remote_executor.deadline = args.remote_deadline
+    if args.replay_snapshot:
+        try:
+            command_capture.load(args.replay_snapshot)
+        except (OSError, ValueError, KeyError) as e:
+            BAD(f"Unable to load snapshot bundle {args.replay_snapshot}: {e}")
+            sys.exit(1)
+        ssh_pool.enabled = False
+    elif args.record_snapshot:
+        command_capture.start_recording(args.record_snapshot)
+
+    if args.reuse_cluster_state is not None and command_capture.mode is None:
+        weka_cli.load_snapshot(cluster_state_file_path, args.reuse_cluster_state * 60)
+
     if not args.target_version:
         parser.error("--target-version is required.")
 
@@ -3921,8 +4958,11 @@ def main():
             check_rhel_systemd_hosts,
             r.good_nfs_hosts,
             r.multi_org,
+            batch_probes=args.batch_host_probes,
         )
         client_hosts_checks(r.weka_version, r.ssh_cl_hosts, ssh_identity, target_version=args.target_version)
+        ssh_pool.close()
+        ssh_pool.report()
         cluster_summary()
         INFO(f"Cluster upgrade checks complete!")
         if args.target_version:
@@ -3937,7 +4977,15 @@ def main():
                 r.obj_store_enabled,
                 r.multi_org
             )
-        create_tar_file(log_file_path, "./weka_upgrade_checker.tar.gz")
+        weka_cli.save_snapshot()
+        command_capture.save()
+        command_capture.report()
+        check_profiler.save(timing_report_file_path)
+        create_tar_file(
+            log_file_path,
+            "./weka_upgrade_checker.tar.gz",
+            extra_files=[timing_report_file_path],
+        )
         sys.exit(0)
 
     elif args.cluster_checks_only:
@@ -3946,7 +4994,15 @@ def main():
         )
         cluster_summary()
         INFO(f"Cluster upgrade checks complete!")
-        create_tar_file(log_file_path, "./weka_upgrade_checker.tar.gz")
+        weka_cli.save_snapshot()
+        command_capture.save()
+        command_capture.report()
+        check_profiler.save(timing_report_file_path)
+        create_tar_file(
+            log_file_path,
+            "./weka_upgrade_checker.tar.gz",
+            extra_files=[timing_report_file_path],
+        )
         sys.exit(0)
 
     elif args.check_specific_backend_hosts:
@@ -3962,10 +5018,21 @@ def main():
             check_rhel_systemd_hosts,
             r.good_nfs_hosts,
             r.multi_org,
+            batch_probes=args.batch_host_probes,
         )
+        ssh_pool.close()
+        ssh_pool.report()
         cluster_summary()
         INFO(f"Cluster upgrade checks complete!")
-        create_tar_file(log_file_path, "./weka_upgrade_checker.tar.gz")
+        weka_cli.save_snapshot()
+        command_capture.save()
+        command_capture.report()
+        check_profiler.save(timing_report_file_path)
+        create_tar_file(
+            log_file_path,
+            "./weka_upgrade_checker.tar.gz",
+            extra_files=[timing_report_file_path],
+        )
         sys.exit(0)
 
     elif args.skip_client_checks:
@@ -3981,7 +5048,10 @@ def main():
             check_rhel_systemd_hosts,
             r.good_nfs_hosts,
             r.multi_org,
+            batch_probes=args.batch_host_probes,
         )
+        ssh_pool.close()
+        ssh_pool.report()
         cluster_summary()
         INFO(f"Cluster upgrade checks complete!")
         if args.target_version:
@@ -3996,7 +5066,15 @@ def main():
                 r.obj_store_enabled,
                 r.multi_org
             )
-        create_tar_file(log_file_path, "./weka_upgrade_checker.tar.gz")
+        weka_cli.save_snapshot()
+        command_capture.save()
+        command_capture.report()
+        check_profiler.save(timing_report_file_path)
+        create_tar_file(
+            log_file_path,
+            "./weka_upgrade_checker.tar.gz",
+            extra_files=[timing_report_file_path],
+        )
         sys.exit(0)
 
 